@@ -0,0 +1,373 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+    Benchmark Harness Cluster
+    Distributes the jobs of a sweep matrix over many nodes.
+
+    The coordinator expands the matrix into a queue of controller jobs,
+    each one bound to the architecture of its machine model (jobs without
+    a machine type run on any node), and serves it over HTTP (JSON):
+        POST /claim      {worker, arch} -> {job, finished}
+        POST /heartbeat  {worker}
+        POST /result     {worker, job, valid, name, error, meta, outs, errs}
+        GET  /status
+    Workers claim jobs of their architecture one at a time, run them
+    through all controller phases, send heartbeats meanwhile and post the
+    parsed results back, which the coordinator stores in its results
+    database. Jobs of workers that miss their heartbeats are requeued (up
+    to --attempts times). Requests carry the --token, if any, in the
+    X-Cluster-Token header.
+
+    Usage:
+        benchmark_cluster.py coordinator matrix.yaml --port=8642
+        benchmark_cluster.py worker http://coordinator:8642 [--arch=aarch64]
+"""
+
+import sys
+import os
+import argparse
+import hmac
+import json
+import platform
+import socket
+import threading
+import time
+import urllib.error
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from helper.BenchmarkLogger import BenchmarkLogger
+from helper.JobQueue import JobQueue
+from helper.ResultsDatabase import ResultsDatabase
+from helper.SweepMatrix import SweepMatrix
+from models.machines.MachineFactory import MachineFactory
+
+from benchmark_controller import BenchmarkController
+from benchmark_controller import build_parser as build_controller_parser
+
+class CoordinatorHandler(BaseHTTPRequestHandler):
+    """JSON requests of the workers, served by the coordinator"""
+
+    def _reply(self, code, body=None):
+        data = json.dumps(body or {}).encode('utf-8')
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        try:
+            self.wfile.write(data)
+        except OSError as err:
+            # ex. the worker was killed while waiting for the reply
+            self.server.coordinator.logger.warning('Reply to %s lost: %s' %
+                                                   (self.client_address[0],
+                                                    err))
+
+    def _authorized(self):
+        token = self.server.coordinator.args.token
+        if not token:
+            return True
+        given = self.headers.get('X-Cluster-Token', '')
+        if hmac.compare_digest(given.encode('utf-8'), token.encode('utf-8')):
+            return True
+        self._reply(403, {'error': 'Bad token'})
+        return False
+
+    def do_GET(self):
+        if not self._authorized():
+            return
+        if self.path != '/status':
+            return self._reply(404, {'error': 'Unknown path'})
+        self._reply(200, self.server.coordinator.queue.status())
+
+    def do_POST(self):
+        if not self._authorized():
+            return
+        handlers = {'/claim': self.server.coordinator.claim,
+                    '/heartbeat': self.server.coordinator.heartbeat,
+                    '/result': self.server.coordinator.result}
+        if self.path not in handlers:
+            return self._reply(404, {'error': 'Unknown path'})
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            request = json.loads(self.rfile.read(length) or b'{}')
+            self._reply(200, handlers[self.path](request))
+        except (KeyError, ValueError, TypeError, IndexError) as err:
+            self._reply(400, {'error': 'Bad request: %s' % err})
+
+    def log_message(self, format, *args):
+        self.server.coordinator.logger.debug(format % args)
+
+class ClusterCoordinator(object):
+    """Hands the jobs of a sweep matrix out to workers, collects results"""
+
+    def __init__(self, argparse_parser, argparse_args):
+        self.parser = argparse_parser
+        self.args = argparse_args
+        self.logger = BenchmarkLogger(__name__, self.parser,
+                                      self.args.verbose)
+
+        self.queue = JobQueue(self.args.heartbeat_timeout, self.args.attempts)
+        overrides = {'unique_id': self.args.unique_id}
+        arches = dict()
+        for argv in SweepMatrix(self.args.matrix, overrides).jobs():
+            machine = build_controller_parser().parse_args(argv).machine_type
+            if machine and machine not in arches:
+                model = MachineFactory(machine).getMachine()
+                if model is None:
+                    raise ImportError('No machine model for %s' % machine)
+                arches[machine] = model.arch
+            self.queue.add(argv, arches.get(machine))
+        self.logger.info('Cluster queue of %d jobs' % len(self.queue.jobs))
+
+        self.db_path = self.args.results_db or os.path.join(
+            self.args.benchmark_root, 'results.db')
+        self.db_lock = threading.Lock()
+        # Workers told that there is nothing left to do
+        self.released = set()
+
+    def claim(self, request):
+        job = self.queue.claim(request['worker'], request['arch'])
+        finished = self.queue.finished()
+        if finished:
+            self.released.add(request['worker'])
+        if job:
+            self.logger.info('Job %d [%s] to %s' %
+                             (job['id'], ' '.join(job['argv']),
+                              request['worker']))
+        return {'job': job, 'finished': finished}
+
+    def heartbeat(self, request):
+        self.queue.heartbeat(request['worker'])
+        return {}
+
+    def result(self, request):
+        worker = request['worker']
+        job_id = request['job']
+        if not self.queue.complete(worker, job_id, request['valid'],
+                                   request.get('name'),
+                                   request.get('error')):
+            self.logger.warning('Ignoring result of job %d from %s: job '
+                                'requeued' % (job_id, worker))
+            return {'accepted': False}
+
+        if request.get('meta') and request.get('outs') is not None:
+            with self.db_lock, ResultsDatabase(self.db_path) as database:
+                database.add_run(request['name'], request['meta'],
+                                 request['outs'], request.get('errs'),
+                                 '%s:%s' % (worker, request.get('path')))
+        if request['valid']:
+            self.logger.info('Job %d passed on %s: %s' %
+                             (job_id, worker, request.get('name')))
+        else:
+            self.logger.warning('Job %d failed on %s: %s' %
+                                (job_id, worker, request.get('error') or
+                                 'validation failed'))
+        return {'accepted': True}
+
+    def main(self):
+        """Serves the queue until all jobs are done and the workers know,
+           returns True if all jobs passed"""
+        server = ThreadingHTTPServer((self.args.host, self.args.port),
+                                     CoordinatorHandler)
+        server.coordinator = self
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        self.logger.info('Coordinator listening on %s:%d' %
+                         server.server_address[:2])
+
+        finished_at = None
+        try:
+            while True:
+                time.sleep(min(1.0, self.args.heartbeat_timeout / 4))
+                for job_id in self.queue.reap():
+                    self.logger.warning('Job %d requeued: worker lost' %
+                                        job_id)
+                if not self.queue.finished():
+                    continue
+                # Let the live workers know before leaving
+                finished_at = finished_at or time.monotonic()
+                if (set(self.queue.workers) <= self.released or
+                        time.monotonic() - finished_at >
+                        self.args.heartbeat_timeout):
+                    break
+        finally:
+            server.shutdown()
+            server.server_close()
+
+        status = self.queue.status()['jobs']
+        self.logger.info('Cluster finished: %d of %d jobs passed' %
+                         (status['passed'], len(self.queue.jobs)))
+        self.logger.info('   Results in: %s' % self.db_path)
+        return status['failed'] == 0
+
+class ClusterWorker(object):
+    """Runs the jobs of a coordinator, one at a time"""
+
+    def __init__(self, argparse_parser, argparse_args):
+        self.parser = argparse_parser
+        self.args = argparse_args
+        self.logger = BenchmarkLogger(__name__, self.parser,
+                                      self.args.verbose)
+        self.url = self.args.coordinator.rstrip('/')
+        self.name = self.args.name or '%s-%d' % (socket.gethostname(),
+                                                 os.getpid())
+        self.arch = self.args.arch or platform.machine()
+
+    def _post(self, path, body):
+        """Posts a JSON request, returns the JSON reply"""
+        request = urllib.request.Request(
+            self.url + path, data=json.dumps(body).encode('utf-8'),
+            headers={'Content-Type': 'application/json',
+                     'X-Cluster-Token': self.args.token or ''})
+        with urllib.request.urlopen(request, timeout=60) as reply:
+            return json.load(reply)
+
+    def _heartbeats(self, stop):
+        """Sends heartbeats until stop is set"""
+        while not stop.wait(self.args.heartbeat):
+            try:
+                self._post('/heartbeat', {'worker': self.name})
+            except (OSError, ValueError) as err:
+                self.logger.warning('Heartbeat failed: %s' % err)
+
+    def _run(self, job):
+        """Runs a job through all controller phases, returns the result
+           request for the coordinator"""
+        # Results go to the coordinator, runs stay under the local root
+        # (a job handed back to the same worker resumes where it stopped)
+        argv = job['argv'] + ['--benchmark-root=%s' % self.args.benchmark_root,
+                              '--no-results-db', '--resume']
+        if self.args.verbose:
+            argv.append('-' + 'v' * self.args.verbose)
+        result = {'worker': self.name, 'job': job['id'], 'valid': False}
+        controller = None
+        try:
+            parser = build_controller_parser()
+            controller = BenchmarkController(parser, parser.parse_args(argv))
+            result['valid'] = controller.main()
+        except Exception as err:
+            result['error'] = '%s: %s' % (type(err).__name__, err)
+
+        if controller is not None and hasattr(controller, 'results_path'):
+            # Also sent for failed runs, ex. when one timed out
+            base = os.path.join(controller.results_path,
+                                controller.binary_name)
+            result['name'] = controller.binary_name
+            result['path'] = os.path.abspath(controller.unique_root_path)
+            result['meta'] = ResultsDatabase.load_records(base + '.meta')
+            result['outs'] = ResultsDatabase.load_records(base + '.out')
+            result['errs'] = ResultsDatabase.load_records(base + '.err')
+        return result
+
+    def main(self):
+        """Claims and runs jobs until the coordinator has none left,
+           returns True if all of this worker's jobs passed"""
+        self.logger.info('Worker %s (%s) of %s' % (self.name, self.arch,
+                                                   self.url))
+        passed = True
+        unreachable = None
+        while True:
+            try:
+                reply = self._post('/claim', {'worker': self.name,
+                                              'arch': self.arch})
+                unreachable = None
+            except urllib.error.HTTPError as err:
+                self.logger.error('Coordinator refused: %s' % err)
+                return False
+            except (OSError, ValueError) as err:
+                # Restarting, or gone: give up after --retry seconds
+                unreachable = unreachable or time.monotonic()
+                if time.monotonic() - unreachable > self.args.retry:
+                    self.logger.error('Coordinator unreachable: %s' % err)
+                    return False
+                time.sleep(self.args.poll)
+                continue
+
+            job = reply.get('job')
+            if job is None:
+                if reply.get('finished'):
+                    self.logger.info('No jobs left')
+                    return passed
+                time.sleep(self.args.poll)
+                continue
+
+            self.logger.info('Running job %d: %s' % (job['id'],
+                                                     ' '.join(job['argv'])))
+            stop = threading.Event()
+            heartbeats = threading.Thread(target=self._heartbeats,
+                                          args=(stop,), daemon=True)
+            heartbeats.start()
+            try:
+                result = self._run(job)
+            finally:
+                stop.set()
+                heartbeats.join()
+            passed = passed and result['valid']
+            try:
+                self._post('/result', result)
+            except (OSError, ValueError) as err:
+                # The coordinator requeues the job when it's back
+                self.logger.error('Sending result of job %d failed: %s' %
+                                  (job['id'], err))
+
+
+def build_parser():
+    """Command line options of the coordinator and the workers"""
+    parser = argparse.ArgumentParser(description='Benchmark Harness Cluster')
+    parser.add_argument('--token', type=str,
+                        default=os.environ.get('BENCHMARK_CLUSTER_TOKEN'),
+                        help='Shared secret of the coordinator and workers '
+                             '(default: $BENCHMARK_CLUSTER_TOKEN)')
+    parser.add_argument('--benchmark-root', type=str, default='./runs',
+                        help='The benchmark root directory')
+    parser.add_argument('-v', '--verbose', action='count', default=0,
+                        help='The verbosity of logging output')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    coordinator = commands.add_parser('coordinator',
+                                      help='Serve the jobs of a sweep matrix')
+    coordinator.add_argument('matrix', type=str,
+                             help='YAML file with the sweep matrix')
+    coordinator.add_argument('--host', type=str, default='127.0.0.1',
+                             help='Address to listen on (0.0.0.0 for all)')
+    coordinator.add_argument('--port', type=int, default=8642,
+                             help='Port to listen on')
+    coordinator.add_argument('--heartbeat-timeout', type=float, default=60,
+                             help='Seconds without heartbeat before a '
+                                  'worker\'s job is requeued')
+    coordinator.add_argument('--attempts', type=int, default=3,
+                             help='Times a job is handed out at most')
+    coordinator.add_argument('--unique-id', type=str, default=os.getpid(),
+                             help='Unique ID shared by all jobs')
+    coordinator.add_argument('--results-db', type=str,
+                             help='Results database (default: <benchmark-root>/results.db)')
+
+    worker = commands.add_parser('worker', help='Run jobs of a coordinator')
+    worker.add_argument('coordinator', type=str,
+                        help='Coordinator URL, ex. http://node0:8642')
+    worker.add_argument('--name', type=str,
+                        help='Worker name (default: <hostname>-<pid>)')
+    worker.add_argument('--arch', type=str,
+                        help='Architecture of the jobs to run '
+                             '(default: this machine\'s)')
+    worker.add_argument('--heartbeat', type=float, default=10,
+                        help='Seconds between heartbeats while running')
+    worker.add_argument('--poll', type=float, default=5,
+                        help='Seconds between claims when no job is ready')
+    worker.add_argument('--retry', type=float, default=300,
+                        help='Seconds to wait for an unreachable coordinator')
+    return parser
+
+
+if __name__ == '__main__':
+    """Point of entry of the cluster mode"""
+    parser = build_parser()
+    args = parser.parse_args()
+
+    if args.command == 'coordinator':
+        node = ClusterCoordinator(parser, args)
+    else:
+        node = ClusterWorker(parser, args)
+    success = node.main()
+    if not success:
+        sys.exit(1)
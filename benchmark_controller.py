@@ -17,20 +17,42 @@ import re
 import importlib
 from pathlib import Path
 import shutil
+import time
+import itertools
+import yaml
+from contextlib import nullcontext
+from concurrent.futures import ThreadPoolExecutor
 
 from helper.BenchmarkLogger import BenchmarkLogger
+from helper.DirectoryCache import DirectoryCache
+from helper.JobServer import JobServer
+from helper.CpuPartition import CpuPartition
+from helper.Statistics import Statistics
+from helper.ResultsDatabase import ResultsDatabase
+from helper.PhaseJournal import PhaseJournal
 
 from models.compilers.CompilerFactory import CompilerFactory
 from models.benchmarks.BenchmarkFactory import BenchmarkFactory
 from models.machines.MachineFactory import MachineFactory
 
 from executor.Execute import Execute
+from executor.AsyncExecute import AsyncExecute
+from executor.ResourceUsage import ResourceUsage
+from executor.ResultWriter import ResultWriter, YamlWriter, FORMATS
 from executor.LinuxPerf import LinuxPerf
+from executor.LinuxPerfRecord import LinuxPerfRecord
 from executor.CompletedProcessList import CompletedProcessList
 
 class BenchmarkController(object):
     """Point of entry of the benchmark harness application"""
 
+    # Options left out of the journaled configuration: a run resumed with
+    # different ones still measures the same thing
+    JOURNAL_IGNORED = ('verbose', 'wipe', 'resume', 'warmup',
+                       'result_format', 'results_db', 'no_results_db',
+                       'cache_root', 'profile', 'profile_frequency',
+                       'profile_events', 'profile_top')
+
     def __init__(self, argparse_parser, argparse_args):
         self.parser = argparse_parser
         self.args = argparse_args
@@ -38,6 +60,24 @@ class BenchmarkController(object):
         self.logger = BenchmarkLogger(__name__, self.parser,
                                       self.args.verbose)
 
+        # Serialises the measured phase when several controllers share a
+        # machine (see benchmark_sweep.py), no-op on standalone runs
+        self.run_lock = nullcontext()
+        # Keeps measured runs apart from the prepare and build phases of
+        # other controllers (see PhaseLock), None on standalone runs
+        self.phase_lock = None
+        # Build job tokens, shared by all controllers of a sweep
+        self.jobserver = None
+        # CPU sets for concurrent runs, None runs one iteration at a time
+        self.cpu_partition = None
+        # Measure with perf, until it turns out to be unavailable
+        self.use_perf = not self.args.no_perf
+        # Holds the cached toolchain once loaded, see release()
+        self.compiler_factory = None
+
+        # Recorded as the run timestamp in the results database
+        self.start_time = time.time()
+
         self._auto_detect()
 
         self._make_unique_name()
@@ -99,22 +139,61 @@ class BenchmarkController(object):
         if self.args.wipe and os.path.exists(self.unique_root_path):
             self.logger.info('Wiping %s' % self.unique_root_path)
             shutil.rmtree(self.unique_root_path)
+        elif os.path.exists(self.unique_root_path) and not self.args.resume:
+            raise RuntimeError("%s already exists, use --wipe or --resume" %
+                               self.unique_root_path)
 
-        # Now, create the whole tree
+        # Now, create the whole tree (what's missing of it, if resuming)
         Path(self.unique_root_path).mkdir(parents=True, exist_ok=True)
 
         self.compiler_path = os.path.join(self.unique_root_path, 'compiler')
-        os.mkdir(self.compiler_path)
+        os.makedirs(self.compiler_path, exist_ok=True)
         self.logger.debug('Compiler path: %s' % self.compiler_path)
 
         self.benchmark_path = os.path.join(self.unique_root_path, 'benchmark')
-        os.mkdir(self.benchmark_path)
+        os.makedirs(self.benchmark_path, exist_ok=True)
         self.logger.debug('Benchmark path: %s' % self.benchmark_path)
 
         self.results_path = os.path.join(self.unique_root_path, 'results')
-        os.mkdir(self.results_path)
+        os.makedirs(self.results_path, exist_ok=True)
         self.logger.debug('Results path: %s' % self.results_path)
 
+        self.logs_path = os.path.join(self.results_path, 'logs')
+        os.makedirs(self.logs_path, exist_ok=True)
+        self.logger.debug('Logs path: %s' % self.logs_path)
+
+        self._open_journal()
+
+    def _open_journal(self):
+        """Journal of the completed phases, resumed with --resume if the
+           run's configuration is the same"""
+
+        # Options that don't change what is built and measured
+        config = {name: value for name, value in vars(self.args).items()
+                  if name not in self.JOURNAL_IGNORED}
+        path = os.path.join(self.unique_root_path, 'journal.jsonl')
+        self.journal = PhaseJournal(path, config, self.args.resume,
+                                    start_time=self.start_time)
+        if self.journal.resumed:
+            self.start_time = self.journal.start['start_time']
+            self.logger.info('Resuming run started at %s' %
+                             time.ctime(self.start_time))
+        elif self.args.resume:
+            self.logger.warning('No journal of the same configuration at %s, '
+                                'starting over' % path)
+
+    def _phase(self, phase):
+        """Holds the phase lock (if shared) for a build or run phase"""
+        if self.phase_lock is None:
+            return nullcontext()
+        return self.phase_lock.hold(phase)
+
+    def _cache_root(self, name):
+        """Directory of a cache shared between runs"""
+        return os.path.join(self.args.cache_root or
+                            os.path.join(self.args.benchmark_root, '.cache'),
+                            name)
+
     def _load_models(self):
         """Load compiler/benchmark/machine models"""
 
@@ -129,38 +208,195 @@ class BenchmarkController(object):
 
             self.logger.debug('Compiler model for %s' % self.args.toolchain)
             self.logger.debug('     compiler_path %s' % self.compiler_path)
-            self.compiler_model = CompilerFactory(self.args.toolchain,
-                                                  self.compiler_path).getCompiler()
+            toolchain_cache = None
+            if not self.args.no_toolchain_cache:
+                toolchain_cache = DirectoryCache(
+                    self._cache_root('toolchains'),
+                    self.args.toolchain_cache_size << 20, verify=False)
+            self.compiler_factory = CompilerFactory(self.args.toolchain,
+                                                    self.compiler_path,
+                                                    toolchain_cache,
+                                                    self.args.toolchain_sha256)
+            self.compiler_model = self.compiler_factory.getCompiler()
             self.logger.info('Compiler model loaded')
         except ImportError as err:
             self.logger.error(err, True)
             raise
 
-    def _run_all(self, list_of_commands, perf=False):
-        """Runs and collects output results"""
+    def _limits(self, phase):
+        """Timeout, resource limits and kill delay of the commands of a
+           phase: the command line options override the benchmark model"""
+        # Warm-up iterations are runs, with the same bounds
+        if phase == 'warmup':
+            phase = 'run'
+        timeout = None
+        if phase:
+            timeout = getattr(self.args, phase + '_timeout', None)
+        if not timeout:
+            timeout = self.benchmark_model.timeouts.get(phase)
+        limits = dict()
+        if phase == 'run':
+            limits.update(self.benchmark_model.limits)
+            if self.args.limit_as:
+                limits['as'] = self.args.limit_as << 20
+            if self.args.limit_cpu:
+                limits['cpu'] = self.args.limit_cpu
+        return timeout, limits, self.args.kill_delay
+
+    def _run_one(self, cmd, perf=False, jobserver=None, cpus=None, log=None,
+                 phase=None):
+        """Runs a single command, returns its (parsed) result
+           With a log path prefix, the output is streamed to disk
+           With a phase name, the phase's limits apply"""
+
+        executor = None
+        if perf and self.use_perf:
+            self.logger.debug('Executing with Linux Perf engine')
+            try:
+                executor = LinuxPerf(cmd, self.benchmark_model.get_plugin(),
+                                     cpus=cpus, logs=log)
+            except RuntimeError as err:
+                self.logger.warning('%s, collecting resource usage instead'
+                                    % err)
+                self.use_perf = False
+        if executor:
+            events = self.args.perf_events.split(',')
+            executor.setStat(self.args.perf_repeat,
+                             self.machine_model.get_perf_events(events),
+                             self.args.perf_interval,
+                             self.args.steady_tolerance)
+        elif perf:
+            self.logger.debug('Executing with resource usage collector')
+            executor = ResourceUsage(cmd, self.benchmark_model.get_plugin(),
+                                     cpus=cpus, logs=log)
+        elif jobserver:
+            executor = Execute(cmd, env=jobserver.env(),
+                               pass_fds=jobserver.fds(), cpus=cpus, logs=log)
+        else:
+            executor = Execute(cmd, cpus=cpus, logs=log)
+        executor.setLimits(*self._limits(phase))
+
+        # Executes command, captures results
+        if cpus:
+            self.logger.info('Running command on CPUs %s : %s' % (cpus, cmd))
+        else:
+            self.logger.info('Running command : ' + str(cmd))
+        token = jobserver.acquire() if jobserver else None
+        try:
+            result = executor.run()
+        finally:
+            if token:
+                jobserver.release(token)
+        if result.timed_out:
+            self.logger.error('Timed out after %ss: %s' %
+                              (executor.timeout, cmd))
+
+        # Counter time series go to their own file, next to the logs
+        if (isinstance(result.stderr, dict) and
+                'intervals' in result.stderr):
+            intervals = result.stderr.pop('intervals')
+            if log:
+                with open(log + '.intervals.yaml', 'w') as out:
+                    yaml.dump(intervals, out, default_flow_style=None)
+
+        # Keep track of where it ran (see _record), None if not pinned
+        result.cpus = list(cpus) if cpus else None
+        return result
+
+    def _run_pinned(self, cmd, perf, partition, log, phase):
+        """Runs a command on the first free CPU set of the partition"""
+
+        cpus = partition.acquire()
+        try:
+            return self._run_one(cmd, perf, cpus=cpus, log=log, phase=phase)
+        finally:
+            partition.release(cpus)
+
+    def _log_prefix(self, phase, idx):
+        """Path prefix of the streamed logs of a command"""
+        if not phase:
+            return None
+        return os.path.join(self.logs_path, '%s-%d' % (phase, idx))
+
+    def _run_all(self, list_of_commands, perf=False, jobserver=None,
+                 partition=None, phase=None, results=None, first=None):
+        """Runs and collects output results
+           With a jobserver, each command holds a job token while running
+           and can start more parallel jobs from it (ex. make -j)
+           With a CPU partition, commands run concurrently, each one pinned
+           to its own CPU set
+           With a phase name, output is streamed to results/logs/phase-N
+           and the phase's timeout and resource limits apply
+           With a results list, new results are appended to it
+           Logs are numbered from first, or after the results so far"""
         # TODO: We should add support for make and test parser plugins, too
 
         # Group all results in a single list object
-        results = CompletedProcessList()
+        if results is None:
+            results = CompletedProcessList()
+        if first is None:
+            first = len(results)
 
+        commands = []
         for cmd in list_of_commands:
             if not cmd:
                 self.logger.debug('Empty command, ignoring')
                 continue
+            commands.append(cmd)
 
-            if perf:
-                self.logger.debug('Executing with Linux Perf engine')
-                executor = LinuxPerf(cmd, self.benchmark_model.get_plugin())
-            else:
-                executor = Execute(cmd)
+        if partition is None:
+            for idx, cmd in enumerate(commands):
+                log = self._log_prefix(phase, first + idx)
+                results.append(self._run_one(cmd, perf, jobserver, log=log,
+                                             phase=phase))
+            return results
 
-            # Executes command, captures results
-            self.logger.info('Running command : ' + str(cmd))
-            result = executor.run()
-            results.append(result)
+        # Results are kept in command order, whatever order they finish in
+        with ThreadPoolExecutor(max_workers=len(partition.sets)) as pool:
+            futures = [pool.submit(self._run_pinned, cmd, perf, partition,
+                                   self._log_prefix(phase, first + idx),
+                                   phase)
+                       for idx, cmd in enumerate(commands)]
+            for future in futures:
+                results.append(future.result())
 
         return results
 
+    def _run_groups(self, groups, phase):
+        """Runs independent groups of commands concurrently (at most
+           --prepare-jobs commands at a time), each group in order, and
+           collects the results in group order"""
+        if len(groups) == 1:
+            return self._run_all(groups[0], phase=phase)
+
+        lists = []
+        for group_idx, group in enumerate(groups):
+            executors = []
+            for idx, cmd in enumerate(cmd for cmd in group if cmd):
+                log = self._log_prefix('%s-%d' % (phase, group_idx), idx)
+                self.logger.info('Running command : ' + str(cmd))
+                executor = AsyncExecute(cmd, logs=log)
+                executor.setLimits(*self._limits(phase))
+                executors.append(executor)
+            lists.append(executors)
+
+        results = CompletedProcessList()
+        for group_results in AsyncExecute.run_lists(lists,
+                                                   self.args.prepare_jobs):
+            for result in group_results:
+                if result.timed_out:
+                    self.logger.error('Timed out: %s' % str(result.args))
+                results.append(result)
+        return results
+
+    @staticmethod
+    def _groups(commands):
+        """Commands as a list of independent groups: models may return
+           a list of commands (one group) or a list of lists of commands"""
+        if commands and commands[0] and isinstance(commands[0][0], list):
+            return commands
+        return [commands]
+
     def _check_results(self, results, public=False):
         out = results.stdout()
         err = results.stderr()
@@ -173,6 +409,9 @@ class BenchmarkController(object):
             self.logger.info("Stderr:")
             self.logger.info(err)
 
+        if results.timeouts:
+            raise RuntimeError("%d of %d commands timed out" %
+                               (results.timeouts, len(results)))
         if ret != 0:
             msg = "Execution error"
             if not public:
@@ -205,57 +444,527 @@ class BenchmarkController(object):
         if result[0].stderr and not isinstance(result[0].stderr, dict):
             raise TypeError('result element should be a dict')
 
-        # Print both stdout and stderr
+        # Streamed by the writers as the iterations completed, if any
         base_path = self.results_path + '/' + self.binary_name
-        with open(base_path + '.out', 'w') as stdout:
-            stdout.write(result.stdout())
-            stdout.close()
-        with open(base_path + '.err', 'w') as stderr:
-            stderr.write(result.stderr())
-            stderr.close()
+        writers = [writer for writer in result.writers
+                   if isinstance(writer, ResultWriter)]
+        if not writers:
+            with YamlWriter(base_path) as writer:
+                for res in result:
+                    writer.append(res)
+            writers = [writer]
 
-        self.logger.info('Output logs at: %s.out' % base_path)
-        self.logger.info(' Error logs at: %s.err' % base_path)
+        for writer in writers:
+            self.logger.info('Output logs at: %s' % writer.paths[0])
+            self.logger.info(' Error logs at: %s' % writer.paths[1])
 
-    def main(self):
-        """Main driver - downloads, unzip, compile, run, collect results"""
+    def _summarize(self, result, valid):
+        """Writes per-metric statistics of all iterations"""
 
-        self.logger.info(' ++ Preparing Environment ++')
-        self._make_dirs()
+        if result and not isinstance(result, CompletedProcessList):
+            raise TypeError('result should be a list')
+
+        stats = Statistics(self.args.outliers, self.args.outlier_threshold,
+                           self.args.confidence, self.args.bootstrap)
+        summary = {
+            'benchmark': self.args.benchmark_name,
+            'iterations': len(result),
+            'valid': valid,
+            'statistics': stats.describe(),
+            'metrics': stats.summarize_table(result.out_metrics),
+            'perf': stats.summarize_table(result.err_metrics),
+        }
+
+        path = self.results_path + '/' + self.binary_name + '.summary.yaml'
+        with open(path, 'w') as out:
+            yaml.dump(summary, out, default_flow_style=False)
+
+        for name, metric in summary['metrics'].items():
+            if metric['count']:
+                self.logger.info('%s: mean %g, median %g, cv %.2f%%' %
+                                 (name, metric['mean'], metric['median'],
+                                  metric['cv'] * 100))
+        self.logger.info('    Summary at: %s' % path)
+        return summary
+
+    def _record(self, result, valid, status=None):
+        """Writes the run metadata and stores the run in the results
+           database (unless disabled)
+           Status: 'ok' or 'invalid' (from valid) unless given, ex. 'timeout'"""
+
+        meta = {
+            'benchmark': self.args.benchmark_name,
+            'machine': self.args.machine_type,
+            'toolchain': self.args.toolchain,
+            'compiler': self.compiler_model.cc_name,
+            'compiler_version': self.compiler_model.version,
+            'compiler_flags': self.args.compiler_flags,
+            'linker_flags': self.args.linker_flags,
+            'run_flags': self.args.run_flags,
+            'unique_id': str(self.args.unique_id),
+            'timestamp': self.start_time,
+            'iterations': len(result),
+            'valid': valid,
+            'status': status or ('ok' if valid else 'invalid'),
+        }
+        # CPU set of each iteration of pinned runs, not a database column
+        cpus = [getattr(r, 'cpus', None) for r in result]
+        if any(cpus):
+            meta['cpus'] = cpus
+        base_path = self.results_path + '/' + self.binary_name
+        with open(base_path + '.meta', 'w') as out:
+            yaml.dump(meta, out, default_flow_style=False)
+
+        if self.args.no_results_db:
+            return
+        path = self.args.results_db or os.path.join(self.args.benchmark_root,
+                                                    'results.db')
+        with ResultsDatabase(path) as database:
+            database.add_run(self.binary_name, meta,
+                             [r.stdout for r in result],
+                             [r.stderr for r in result],
+                             os.path.abspath(self.unique_root_path))
+        self.logger.info('   Results in: %s' % path)
 
-        self.logger.info(' ++ Loading Models (compiler/bench/machine) ++')
-        self._load_models()
+    def _check_perf(self):
+        """Collects resource usage instead, with a warning, if perf can't
+           count here"""
+        try:
+            LinuxPerf(['true'])
+        except RuntimeError as err:
+            self.logger.warning('%s, collecting resource usage instead' % err)
+            self.use_perf = False
+
+    def _check_profile(self):
+        """Disables profiling, with a warning, if perf can't record here"""
+        try:
+            LinuxPerfRecord(['true'])
+        except RuntimeError as err:
+            self.logger.warning('%s, not profiling' % err)
+            self.args.profile = False
 
-        self.logger.info(' ++ Preparing Benchmark Build ++')
-        res = self._run_all(self.benchmark_model.prepare(self.benchmark_path,
-                                                         self.machine_model,
-                                                         self.compiler_model,
-                                                         self.args.iterations,
-                                                         self.args.size))
-        self._check_results(res, public=True)
+    def _profile(self):
+        """Runs one extra, unmeasured iteration under perf record, writes
+           its folded stacks and hot symbols next to the logs"""
+
+        cmd = next(iter(self.benchmark_model.run(self.args.run_flags, 1)))
+        base_path = self.results_path + '/' + self.binary_name
+        events = [event for event in self.args.profile_events.split(',')
+                  if event]
+        executor = LinuxPerfRecord(cmd, self.benchmark_model.get_plugin(),
+                                   logs=self._log_prefix('profile', 0),
+                                   data=base_path + '.perf.data',
+                                   frequency=self.args.profile_frequency,
+                                   events=events)
+        executor.setLimits(*self._limits('run'))
+
+        self.logger.info('Profiling command : ' + str(cmd))
+        with self._phase('run'), self.run_lock:
+            result = executor.run()
+        if result.timed_out:
+            raise RuntimeError("Profiled run timed out, see %s.stderr.log" %
+                               self._log_prefix('profile', 0))
+        if result.returncode:
+            raise RuntimeError("Profiled run failed, see %s.stderr.log" %
+                               self._log_prefix('profile', 0))
+
+        profile = executor.script()
+        profile.save(base_path + '.folded')
+        hot = profile.hot(self.args.profile_top)
+        with open(base_path + '.hot.yaml', 'w') as out:
+            yaml.dump({'samples': profile.samples(), 'hot': hot}, out,
+                      default_flow_style=False, sort_keys=False)
+
+        for entry in hot[:5]:
+            self.logger.info('%6.2f%% %s' % (entry['self_pct'],
+                                             entry['symbol']))
+        self.logger.info('Folded stacks at: %s.folded' % base_path)
+        self.logger.info('  Hot symbols at: %s.hot.yaml' % base_path)
+        return profile
+
+    def _prepare(self):
+        """Fetches and prepares the benchmark sources"""
+
+        prepare_cmds = self.benchmark_model.prepare(self.benchmark_path,
+                                                    self.machine_model,
+                                                    self.compiler_model,
+                                                    self.args.iterations,
+                                                    self.args.size)
+        groups = self._groups(prepare_cmds)
+        root_path = self.benchmark_model.root_path
+        # Building changes the sources tree, a completed build covers both
+        if (self.journal.completed('build') or
+                self.journal.completed('prepare')):
+            self.logger.info('Sources prepared by the resumed run, at: %s' %
+                             root_path)
+            return
+        if os.path.exists(root_path):
+            self.logger.info('Removing stale sources at: %s' % root_path)
+            shutil.rmtree(root_path)
+
+        self._prepare_sources(groups)
+        self.journal.record('prepare',
+                            {root_path: PhaseJournal.digest(root_path)})
+
+    def _prepare_sources(self, groups):
+        """Runs the prepare commands, or checks out their sources tree from
+           the source cache"""
+
+        if self.args.no_source_cache:
+            res = self._run_groups(groups, phase='prepare')
+            self._check_results(res, public=True)
+            return
+
+        # Sources only depend on the commands, not on where they run
+        root_path = self.benchmark_model.root_path
+        generic_groups = [[[arg.replace(root_path, '{root}') for arg in cmd]
+                           for cmd in group if cmd] for group in groups]
+        generic_cmds = generic_groups[0]
+        if len(generic_groups) > 1:
+            generic_cmds = generic_groups
+
+        def fill(tree):
+            self.logger.info('Source cache miss, fetching sources')
+            res = self._run_groups([[[arg.replace('{root}', tree)
+                                      for arg in cmd] for cmd in group]
+                                    for group in generic_groups],
+                                   phase='prepare')
+            self._check_results(res, public=True)
+
+        cache = DirectoryCache(self._cache_root('sources'),
+                               self.args.source_cache_size << 20)
+        key = cache.key(self.benchmark_model.benchmark_url, generic_cmds)
+        self.logger.debug('Source cache key: %s' % key)
+        cache.checkout(key, fill, root_path,
+                       origin=self.benchmark_model.benchmark_url)
+        self.logger.info('Sources at: %s' % root_path)
+
+    def _build(self):
+        """Builds the benchmark with the compiler and extra flags"""
+
+        if self.jobserver is None:
+            jobs = self.args.build_jobs or JobServer.default_jobs()
+            self.logger.info('Building with %d parallel jobs' % jobs)
+            self.jobserver = JobServer(jobs)
 
-        self.logger.info(' ++ Building Benchmark ++')
         compiler_flags, linker_flags = self.compiler_model.get_flags()
         if self.args.compiler_flags:
             compiler_flags += " " + self.args.compiler_flags
         if self.args.linker_flags:
             linker_flags += " " + self.args.linker_flags
-        res = self._run_all(self.benchmark_model.build(self.binary_name,
-                                                       compiler_flags,
-                                                       linker_flags))
-        self._check_results(res, public=True)
-
-        self.logger.info(' ++ Running Benchmark ++')
-        res = self._run_all(self.benchmark_model.run(self.args.run_flags),
-                               perf=True)
+        build_cmds = self.benchmark_model.build(self.binary_name,
+                                                compiler_flags,
+                                                linker_flags)
+        binary = os.path.join(self.benchmark_model.root_path,
+                              self.binary_name)
+        if self.journal.completed('build'):
+            self.logger.info('Built by the resumed run, skipping build')
+            return
+
+        self._build_binary(build_cmds)
+        self.journal.record('build', {binary: PhaseJournal.digest(binary)})
+
+    def _build_binary(self, build_cmds):
+        """Runs the build commands, or copies the binary from the build
+           cache"""
+
+        if self.args.no_build_cache:
+            res = self._run_all(build_cmds, jobserver=self.jobserver,
+                                phase='build')
+            self._check_results(res, public=True)
+            return
+
+        # Same sources, compiler, flags and machine build the same binary
+        root_path = self.benchmark_model.root_path
+        generic_cmds = [[arg.replace(root_path, '{root}')
+                            .replace(self.binary_name, '{binary}')
+                         for arg in cmd] for cmd in build_cmds if cmd]
+        source_digest, _ = DirectoryCache.checksum(root_path)
+        binary = os.path.join(root_path, self.binary_name)
+
+        def fill(tree):
+            self.logger.info('Build cache miss, building')
+            res = self._run_all(build_cmds, jobserver=self.jobserver,
+                                phase='build')
+            self._check_results(res, public=True)
+            os.mkdir(tree)
+            shutil.copy2(binary, os.path.join(tree, 'binary'))
+
+        cache = DirectoryCache(self._cache_root('builds'),
+                               self.args.build_cache_size << 20)
+        key = cache.key(source_digest, generic_cmds,
+                        self.args.toolchain,
+                        self.compiler_model.cc_name,
+                        self.compiler_model.version,
+                        self.machine_model.arch,
+                        self.machine_model.get_flags())
+        self.logger.debug('Build cache key: %s' % key)
+        tree = cache.get(key, fill, origin=self.binary_name, hold=True)
+        if not os.path.exists(binary):
+            self.logger.info('Build cache hit, skipping build')
+            shutil.copy2(os.path.join(tree, 'binary'), binary)
+        cache.release(key)
+
+    def _run(self):
+        """Runs the warm-up and measured iterations, returns the parsed
+           results"""
+
+        if self.cpu_partition is None and self.args.cpus_per_run:
+            self.cpu_partition = CpuPartition(self.args.cpus_per_run,
+                                              self.args.exclude_smt)
+            self.logger.info('Running on %d CPU sets: %s' %
+                             (len(self.cpu_partition.sets),
+                              self.cpu_partition.sets))
+
+        self.start_run()
+        try:
+            with self._phase('run'), self.run_lock:
+                self._warm_up(self.warmup_commands,
+                              partition=self.cpu_partition)
+                if self.args.adaptive:
+                    self._run_adaptive(self.run_commands, self.run_results)
+                else:
+                    self._run_all(self.run_commands, perf=True,
+                                  partition=self.cpu_partition, phase='run',
+                                  results=self.run_results)
+        finally:
+            self.close_run()
+        return self.finish_run()
+
+    def start_run(self):
+        """Opens the results of the measured iterations (restoring those of
+           a resumed run) and lines up the warm-up and measured commands
+           See run_iteration() to run them one at a time"""
+
+        iterations = None
+        if self.args.adaptive:
+            iterations = self.args.max_iterations
+        commands = self.benchmark_model.run(self.args.run_flags, iterations)
+        self.warmup_commands = iter(())
+        if self.args.warmup:
+            self.warmup_commands = self.benchmark_model.run(
+                self.args.run_flags, self.args.warmup)
+
+        # Each iteration is written out as soon as it completes
+        base_path = self.results_path + '/' + self.binary_name
+        writers = [ResultWriter.create(name, base_path)
+                   for name in self.args.result_format.split(',')]
+        res = CompletedProcessList(writers)
+        restored = self._restore(res)
+        if restored:
+            commands = itertools.islice(commands, restored, None)
+        # Journaled as they complete, like the results
+        res.writers.append(self.journal)
+        self.run_commands = commands
+        self.run_results = res
+        self.warmups = 0
+        return res
+
+    def _warm_up(self, commands, partition=None):
+        """Runs warm-up iterations, whose results are discarded, with the
+           timeout and resource limits of the measured ones"""
+
+        commands = list(commands)
+        if not commands:
+            return
+        self.logger.info('Running %d warm-up iteration(s)' % len(commands))
+        # Logs numbered after the previous warm-ups
+        res = self._run_all(commands, perf=True, partition=partition,
+                            phase='warmup', first=self.warmups)
+        self.warmups += len(commands)
         self._check_results(res, public=False)
 
+    def run_iteration(self):
+        """Runs the next warm-up or measured iteration, serially
+           Returns False when there are none left, or after one failed or
+           timed out (then reported by finish_run())"""
+
+        for cmd in self.warmup_commands:
+            self._warm_up([cmd])
+            return True
+        for cmd in self.run_commands:
+            res = self._run_all([cmd], perf=True, phase='run',
+                                results=self.run_results)
+            return not (res.returncode or res.timeouts)
+        return False
+
+    def close_run(self):
+        """Closes the results and the journal of the measured iterations"""
+        for writer in self.run_results.writers:
+            writer.close()
+
+    def finish_run(self):
+        """Closes the results of the measured iterations, checks them and
+           returns them"""
+
+        res = self.run_results
+        self.close_run()
+        if res.timeouts:
+            # Keep a record of the variant that ran out of time
+            self._output_logs(res)
+            self._record(res, False, status='timeout')
+        self._check_results(res, public=False)
+        return res
+
+    def _restore(self, results):
+        """Appends the iterations of the resumed run to the results, up to
+           the first one that failed or timed out (run again), returns
+           their number"""
+
+        for entry in self.journal.entries('iteration'):
+            if entry['returncode'] or entry['timed_out']:
+                break
+            result = subprocess.CompletedProcess(entry['args'],
+                                                 entry['returncode'],
+                                                 entry['stdout'],
+                                                 entry['stderr'])
+            result.timed_out = False
+            result.cpus = entry.get('cpus')
+            results.append(result)
+        if len(results):
+            self.logger.info('Resuming after %d iterations' % len(results))
+        return len(results)
+
+    def _relative_ci(self, results, stats):
+        """Width of the confidence interval of the adaptive metric,
+           relative to its mean, None with less than two values"""
+        metric = self.args.adaptive
+        if metric in results.out_metrics.numeric:
+            column = results.out_metrics.column(metric)
+        elif metric in results.err_metrics.numeric:
+            column = results.err_metrics.column(metric)
+        else:
+            raise ValueError("Adaptive metric '%s' not in the results" %
+                             metric)
+
+        summary = stats.summarize(column)
+        if summary['count'] < 2:
+            return None
+        if not summary['mean']:
+            return float('inf')
+        return (summary['ci_high'] - summary['ci_low']) / abs(summary['mean'])
+
+    def _check_adaptive(self):
+        """Checks the adaptive options before anything is built: the metric
+           must be one the benchmark's parser, perf or the resource usage
+           collector reports"""
+
+        if self.args.min_iterations > self.args.max_iterations:
+            err = "Minimum iterations above the maximum"
+            self.logger.error(err, True)
+            raise ValueError(err)
+
+        # Only what the collector that will run reports
+        known = set(ResourceUsage.METRICS)
+        plugin = self.benchmark_model.get_plugin()
+        if plugin and plugin.fields:
+            known.update(plugin.fields)
+        if self.use_perf:
+            events = self.machine_model.get_perf_events(
+                self.args.perf_events.split(','))
+            for event in events:
+                # Groups are lists of events
+                if isinstance(event, (list, tuple)):
+                    known.update(event)
+                else:
+                    known.add(event)
+        if self.args.adaptive not in known:
+            err = ("Adaptive metric '%s' is not reported%s, use one of: %s" %
+                   (self.args.adaptive,
+                    '' if self.use_perf else ' without perf',
+                    ', '.join(sorted(known))))
+            self.logger.error(err, True)
+            raise ValueError(err)
+
+    def _run_adaptive(self, commands, results):
+        """Runs iterations until the adaptive metric converges
+           Stops when the relative confidence interval width is within the
+           target (after the minimum iterations), when the commands run out
+           (maximum iterations) or when the time limit is reached
+           Results are appended to results, and returned"""
+
+        stats = Statistics(self.args.outliers, self.args.outlier_threshold,
+                           self.args.confidence, self.args.bootstrap)
+        # One iteration at a time, or one per CPU set
+        batch = len(self.cpu_partition.sets) if self.cpu_partition else 1
+        start = time.monotonic()
+        width = None
+        reason = 'maximum iterations'
+
+        while True:
+            cmds = list(itertools.islice(commands, batch))
+            if not cmds:
+                break
+            self._run_all(cmds, perf=True, partition=self.cpu_partition,
+                          phase='run', results=results)
+            if results.timeouts:
+                reason = 'timeout'
+                break
+            if results.returncode:
+                reason = 'execution error'
+                break
+
+            width = self._relative_ci(results, stats)
+            self.logger.debug('%s: relative CI %s after %d iterations' %
+                              (self.args.adaptive, width, len(results)))
+            if (len(results) >= self.args.min_iterations and
+                    width is not None and width <= self.args.target_ci):
+                reason = 'converged'
+                break
+            if (self.args.max_time and
+                    time.monotonic() - start >= self.args.max_time):
+                reason = 'time limit'
+                break
+
+        self.logger.info('Adaptive run stopped (%s) after %d iterations, '
+                         '%s relative CI: %s' % (reason, len(results),
+                                                 self.args.adaptive, width))
+        return results
+
+    def setup(self):
+        """Gets the run ready: directories, models, sources and binary"""
+
+        if self.use_perf:
+            self._check_perf()
+        if self.args.profile:
+            self._check_profile()
+
+        self.logger.info(' ++ Preparing Environment ++')
+        self._make_dirs()
+
+        # Toolchain and sources downloads count as building
+        with self._phase('build'):
+            self.logger.info(' ++ Loading Models (compiler/bench/machine) ++')
+            self._load_models()
+            if self.args.adaptive:
+                self._check_adaptive()
+
+            self.logger.info(' ++ Preparing Benchmark Build ++')
+            self._prepare()
+
+            self.logger.info(' ++ Building Benchmark ++')
+            self._build()
+
+    def report(self, res):
+        """Validates, writes out and records the results of the measured
+           iterations, returns whether they're valid"""
+
         self.logger.info(' ++ Validating Results ++')
         valid = self._validate(res)
 
         self.logger.info(' ++ Collecting Results ++')
         self._output_logs(res)
 
+        self.logger.info(' ++ Summarising Results ++')
+        self._summarize(res, valid)
+
+        self.logger.info(' ++ Recording Results ++')
+        self._record(res, valid)
+
+        if self.args.profile:
+            self.logger.info(' ++ Profiling Benchmark ++')
+            self._profile()
+
         # Give "some" feedback if the log level is not high enough
         if (self.logger.silent()):
             if (valid):
@@ -265,9 +974,37 @@ class BenchmarkController(object):
 
         return valid
 
+    def release(self):
+        """Lets the shared caches evict what this run held (the toolchain)"""
+        if self.compiler_factory:
+            self.compiler_factory.release()
 
-if __name__ == '__main__':
-    """This is the point of entry of our application, not much logic here"""
+    def main(self):
+        """Main driver - downloads, unzip, compile, run, collect results"""
+
+        try:
+            self.setup()
+
+            self.logger.info(' ++ Running Benchmark ++')
+            res = self._run()
+
+            return self.report(res)
+        finally:
+            self.release()
+
+
+def result_formats(value):
+    """Checks a comma separated list of result formats (argparse type)"""
+    for name in value.split(','):
+        if name not in FORMATS:
+            raise argparse.ArgumentTypeError(
+                "unknown result format '%s' (choose from %s)" %
+                (name, ', '.join(FORMATS)))
+    return value
+
+
+def build_parser():
+    """Command line options of a single benchmark run"""
     parser = argparse.ArgumentParser(description='Benchmark Harness')
 
     # Required argument: benchmark name (must have a model implemented)
@@ -283,15 +1020,127 @@ if __name__ == '__main__':
                         help='Unique ID (ex. run number, sequential)')
     parser.add_argument('--wipe', type=bool, default=False,
                         help='Wipe benchmark root directory before run')
+    parser.add_argument('--resume', action='store_true',
+                        help='Resume an interrupted run (same options and '
+                             '--unique-id), skipping its completed phases '
+                             'and iterations')
     parser.add_argument('--benchmark-root', type=str, default='./runs',
                         help='The benchmark root directory')
     parser.add_argument('--iterations', type=int,
                         help='Number of iterations to run the same build')
     parser.add_argument('--size', type=int,
                         help='Meta variable that determines the size of the benchmark run')
+    parser.add_argument('--prepare-jobs', type=int, default=4,
+                        help='Concurrent commands of independent prepare steps')
+    parser.add_argument('--build-jobs', type=int, default=0,
+                        help='Parallel build jobs (default: number of CPUs)')
+    parser.add_argument('--cpus-per-run', type=int, default=0,
+                        help='Run iterations concurrently, each pinned to its own set of N CPUs')
+    parser.add_argument('--exclude-smt', action='store_true',
+                        help='Only use one hardware thread per core for pinned runs')
     parser.add_argument('-v', '--verbose', action='count', default=0,
                         help='The verbosity of logging output')
 
+    # Caches shared between runs
+    parser.add_argument('--cache-root', type=str,
+                        help='Cache directory (default: <benchmark-root>/.cache)')
+    parser.add_argument('--no-source-cache', action='store_true',
+                        help='Always fetch the benchmark sources')
+    parser.add_argument('--source-cache-size', type=int, default=4096,
+                        help='Source cache size limit, in MB')
+    parser.add_argument('--no-toolchain-cache', action='store_true',
+                        help='Download and extract the toolchain in the run directory')
+    parser.add_argument('--toolchain-cache-size', type=int, default=32768,
+                        help='Toolchain cache size limit, in MB')
+    parser.add_argument('--toolchain-sha256', type=str,
+                        help='Expected SHA256 of the toolchain tarball')
+    parser.add_argument('--no-build-cache', action='store_true',
+                        help='Always build, even if an identical binary exists')
+    parser.add_argument('--build-cache-size', type=int, default=2048,
+                        help='Build cache size limit, in MB')
+
+    # Perf counters
+    parser.add_argument('--no-perf', action='store_true',
+                        help='Collect resource usage (wall/CPU time, max RSS, '
+                             'context switches, page faults) instead of perf '
+                             'counters (default when perf is unavailable)')
+    parser.add_argument('--perf-events', type=str, default='default',
+                        help='Comma separated event groups of the machine '
+                             'model (default, cache, tlb, stalls) or events')
+    parser.add_argument('--perf-repeat', type=int, default=1,
+                        help='Runs per iteration inside perf stat (reports '
+                             'counter variance)')
+    parser.add_argument('--perf-interval', type=int, default=0,
+                        help='Sample counters every N ms (perf stat -I)')
+    parser.add_argument('--steady-tolerance', type=float, default=0.1,
+                        help='Relative rate change within the steady state')
+
+    # Limits
+    parser.add_argument('--prepare-timeout', type=float, default=0,
+                        help='Time limit of each prepare command, in seconds '
+                             '(default: the benchmark model\'s, if any)')
+    parser.add_argument('--build-timeout', type=float, default=0,
+                        help='Time limit of each build command, in seconds')
+    parser.add_argument('--run-timeout', type=float, default=0,
+                        help='Time limit of each iteration, in seconds')
+    parser.add_argument('--kill-delay', type=float, default=5,
+                        help='Seconds between SIGTERM and SIGKILL on timeout')
+    parser.add_argument('--limit-as', type=int, default=0,
+                        help='Address space limit of each iteration, in MB')
+    parser.add_argument('--limit-cpu', type=int, default=0,
+                        help='CPU time limit of each iteration, in seconds')
+
+    # Sampling profile
+    parser.add_argument('--profile', action='store_true',
+                        help='Profile one extra iteration with perf record')
+    parser.add_argument('--profile-frequency', type=int, default=999,
+                        help='Profile samples per second')
+    parser.add_argument('--profile-events', type=str, default='',
+                        help='Comma separated sampled events (default: cycles)')
+    parser.add_argument('--profile-top', type=int, default=20,
+                        help='Number of hot symbols to report')
+
+    # Adaptive iterations
+    parser.add_argument('--adaptive', type=str, metavar='METRIC',
+                        help='Run until METRIC (ex. FOM, elapsed) converges, '
+                             'ignores --iterations')
+    parser.add_argument('--target-ci', type=float, default=0.02,
+                        help='Relative confidence interval width to stop at')
+    parser.add_argument('--min-iterations', type=int, default=3,
+                        help='Minimum adaptive iterations')
+    parser.add_argument('--max-iterations', type=int, default=50,
+                        help='Maximum adaptive iterations')
+    parser.add_argument('--max-time', type=float, default=0,
+                        help='Adaptive run time limit, in seconds (0: none)')
+
+    # Warm-up
+    parser.add_argument('--warmup', type=int, default=0,
+                        help='Warm-up iterations run (and discarded) before '
+                             'the measured ones')
+
+    # Results output
+    parser.add_argument('--result-format', type=result_formats, default='yaml',
+                        help='Comma separated formats of the results, '
+                             'written as each iteration completes: yaml '
+                             '(.out/.err), jsonl, csv')
+
+    # Results history
+    parser.add_argument('--results-db', type=str,
+                        help='Results database (default: <benchmark-root>/results.db)')
+    parser.add_argument('--no-results-db', action='store_true',
+                        help='Do not store the run in the results database')
+
+    # Result statistics
+    parser.add_argument('--outliers', type=str, default='mad',
+                        choices=Statistics.OUTLIERS,
+                        help='Outlier rejection method for the summary')
+    parser.add_argument('--outlier-threshold', type=float,
+                        help='MAD z-score (default 3.5) or IQR fence (1.5)')
+    parser.add_argument('--confidence', type=float, default=0.95,
+                        help='Confidence level of the mean intervals')
+    parser.add_argument('--bootstrap', type=int, default=1000,
+                        help='Bootstrap resamples for the intervals')
+
     # Extra flags
     parser.add_argument('--compiler-flags', type=str, default='',
                         help='The extra compiler flags')
@@ -299,6 +1148,12 @@ if __name__ == '__main__':
                         help='The extra linker flags')
     parser.add_argument('--run-flags', type=str, default='',
                         help='The benchmark execution options')
+    return parser
+
+
+if __name__ == '__main__':
+    """This is the point of entry of our application, not much logic here"""
+    parser = build_parser()
     args = parser.parse_args()
 
     # Start the controller
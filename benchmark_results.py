@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+    Benchmark Harness Results
+    Queries the history of runs stored in the results database, imports
+    run directories into it (ex. to backfill runs older than the database)
+    and checks the latest runs for performance regressions.
+
+    Usage:
+        benchmark_results.py import runs/
+        benchmark_results.py query --benchmark=lulesh --machine=aarch64 \\
+                                   --toolchain=clang --metric=FOM --days=90
+        benchmark_results.py regressions --window=10  # exit 1 on regression
+        benchmark_results.py profile-diff runs/<before> runs/<after>
+"""
+
+import sys
+import os
+import argparse
+import csv
+import time
+
+from helper.BenchmarkLogger import BenchmarkLogger
+from helper.ResultsDatabase import ResultsDatabase
+from helper.RegressionDetector import RegressionDetector
+from helper.Profile import Profile
+
+class BenchmarkResults(object):
+    """Point of entry of the results history tools"""
+
+    # Columns printed by query, per iteration or per run (--per-run)
+    COLUMNS = ['date', 'benchmark', 'machine', 'toolchain', 'compiler_version',
+               'compiler_flags', 'run_flags', 'name', 'metric']
+
+    def __init__(self, argparse_parser, argparse_args):
+        self.parser = argparse_parser
+        self.args = argparse_args
+        self.logger = BenchmarkLogger(__name__, self.parser,
+                                      self.args.verbose)
+        self.db_path = self.args.db or os.path.join(self.args.benchmark_root,
+                                                    'results.db')
+
+    def _import(self, database):
+        """Imports run directories, or all runs under benchmark roots"""
+        count = 0
+        for path in self.args.paths:
+            if os.path.isdir(os.path.join(path, 'results')):
+                names = [database.import_run(path)]
+            else:
+                names = database.import_tree(path)
+            for name in names:
+                if name:
+                    self.logger.info('Imported %s' % name)
+                    count += 1
+        self.logger.info('Imported %d runs into %s' % (count, self.db_path))
+        return True
+
+    def _query(self, database):
+        """Prints the matching metrics as CSV"""
+        rows = database.query(benchmark=self.args.benchmark,
+                              machine=self.args.machine,
+                              toolchain=self.args.toolchain,
+                              compiler_version=self.args.compiler_version,
+                              run_flags=self.args.run_flags,
+                              metric=self.args.metric,
+                              source=self.args.source,
+                              days=self.args.days,
+                              limit=self.args.limit)
+
+        writer = csv.writer(sys.stdout)
+        if self.args.per_run:
+            writer.writerow(self.COLUMNS + ['count', 'mean', 'min', 'max'])
+            runs = dict()
+            for row in rows:
+                runs.setdefault((row['id'], row['metric']), []).append(row)
+            for values in runs.values():
+                numbers = [row['value'] for row in values]
+                writer.writerow(self._columns(values[0]) +
+                                [len(numbers), sum(numbers) / len(numbers),
+                                 min(numbers), max(numbers)])
+        else:
+            writer.writerow(self.COLUMNS + ['iteration', 'value'])
+            for row in rows:
+                writer.writerow(self._columns(row) +
+                                [row['iteration'], row['value']])
+        return bool(rows)
+
+    def _regressions(self, database):
+        """Prints the regression report, fails on any regression"""
+        detector = RegressionDetector(database, self.args.window,
+                                      self.args.min_baseline,
+                                      self.args.threshold, self.args.z,
+                                      self.args.config)
+        report = detector.detect(benchmark=self.args.benchmark,
+                                 machine=self.args.machine,
+                                 toolchain=self.args.toolchain,
+                                 metric=self.args.metric,
+                                 days=self.args.days)
+
+        regressions = 0
+        for entry in report:
+            if entry['status'] == 'regression':
+                regressions += 1
+            if entry['status'] not in ('regression', 'improvement'):
+                if not self.args.all or entry['status'] == 'untracked':
+                    continue
+            line = '%-12s %s %s: %s (%s)' % (entry['status'].upper(),
+                                             entry['run'], entry['source'],
+                                             entry['metric'],
+                                             entry['direction'])
+            if 'baseline' in entry:
+                line += ' %g -> %g (%+.2f%%, z=%.1f, %d runs)' % (
+                    entry['baseline'], entry['latest'],
+                    entry['change'] * 100, entry['z'],
+                    entry['baseline_runs'])
+            if 'change_point' in entry:
+                line += ' since %s' % entry['change_point']
+            print(line)
+
+        self.logger.info('%d metrics checked, %d regressions' %
+                         (len(report), regressions))
+        return regressions == 0
+
+    @staticmethod
+    def _folded(path):
+        """Folded stacks file of a profiled run directory, or the file"""
+        if os.path.isdir(path):
+            name = os.path.basename(os.path.abspath(path))
+            return os.path.join(path, 'results', name + '.folded')
+        return path
+
+    def _profile_diff(self):
+        """Prints the symbols whose share of samples changed the most"""
+        before = Profile.load(self._folded(self.args.before))
+        after = Profile.load(self._folded(self.args.after))
+        print('%8s %8s %8s  %s' % ('before', 'after', 'delta', 'symbol'))
+        for entry in before.diff(after, self.args.top):
+            print('%7.2f%% %7.2f%% %+7.2f%%  %s' % (entry['before_pct'],
+                                                   entry['after_pct'],
+                                                   entry['delta_pct'],
+                                                   entry['symbol']))
+        return True
+
+    @staticmethod
+    def _columns(row):
+        date = ''
+        if row['timestamp'] is not None:
+            date = time.strftime('%Y-%m-%d %H:%M:%S',
+                                 time.localtime(row['timestamp']))
+        return [date] + [row[column] for column in
+                         BenchmarkResults.COLUMNS[1:]]
+
+    def main(self):
+        """Runs the selected command, returns success"""
+        if self.args.command == 'profile-diff':
+            return self._profile_diff()
+        with ResultsDatabase(self.db_path) as database:
+            if self.args.command == 'import':
+                return self._import(database)
+            if self.args.command == 'regressions':
+                return self._regressions(database)
+            return self._query(database)
+
+
+def build_parser():
+    """Command line options of the results tools"""
+    parser = argparse.ArgumentParser(description='Benchmark Harness Results')
+    parser.add_argument('--db', type=str,
+                        help='Results database (default: <benchmark-root>/results.db)')
+    parser.add_argument('--benchmark-root', type=str, default='./runs',
+                        help='The benchmark root directory')
+    parser.add_argument('-v', '--verbose', action='count', default=0,
+                        help='The verbosity of logging output')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    importer = commands.add_parser('import',
+                                   help='Import run directories or roots')
+    importer.add_argument('paths', type=str, nargs='+',
+                          help='Run directories or benchmark roots')
+
+    query = commands.add_parser('query', help='Print metrics as CSV')
+    query.add_argument('--benchmark', type=str, help='Benchmark name')
+    query.add_argument('--machine', type=str, help='Machine type')
+    query.add_argument('--toolchain', type=str, help='Toolchain name/url')
+    query.add_argument('--compiler-version', type=str,
+                       help='Compiler version')
+    query.add_argument('--run-flags', type=str, help='Run flags')
+    query.add_argument('--metric', type=str,
+                       help='Metric name (ex. FOM, MFLOPS, cycles)')
+    query.add_argument('--source', type=str, choices=['out', 'err'],
+                       help='Benchmark (out) or perf (err) metrics only')
+    query.add_argument('--days', type=float,
+                       help='Only runs of the last N days')
+    query.add_argument('--limit', type=int, help='Maximum number of rows')
+    query.add_argument('--per-run', action='store_true',
+                       help='One row per run and metric (count, mean, min, max)')
+
+    regressions = commands.add_parser(
+        'regressions', help='Compare the latest runs with their history')
+    regressions.add_argument('--benchmark', type=str, help='Benchmark name')
+    regressions.add_argument('--machine', type=str, help='Machine type')
+    regressions.add_argument('--toolchain', type=str,
+                             help='Toolchain name/url')
+    regressions.add_argument('--metric', type=str, help='Only this metric')
+    regressions.add_argument('--days', type=float,
+                             help='Only runs of the last N days')
+    regressions.add_argument('--window', type=int, default=10,
+                             help='Previous runs in the baseline')
+    regressions.add_argument('--min-baseline', type=int, default=3,
+                             help='Minimum runs to compare against')
+    regressions.add_argument('--threshold', type=float, default=0.05,
+                             help='Minimum relative change (default 5%%)')
+    regressions.add_argument('--z', type=float, default=3.0,
+                             help='Minimum change in robust standard deviations')
+    regressions.add_argument('--config', type=str,
+                             help='YAML file with per metric direction/threshold/z')
+    regressions.add_argument('--all', action='store_true',
+                             help='Also print unchanged metrics')
+
+    profile_diff = commands.add_parser(
+        'profile-diff', help='Compare the hot symbols of two profiled runs')
+    profile_diff.add_argument('before', type=str,
+                              help='Run directory or .folded file')
+    profile_diff.add_argument('after', type=str,
+                              help='Run directory or .folded file')
+    profile_diff.add_argument('--top', type=int, default=20,
+                              help='Number of symbols to print')
+    return parser
+
+
+if __name__ == '__main__':
+    """Point of entry of the results tools"""
+    parser = build_parser()
+    args = parser.parse_args()
+
+    results = BenchmarkResults(parser, args)
+    success = results.main()
+    if not success:
+        sys.exit(1)
@@ -0,0 +1,270 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+    Benchmark Harness Sweep
+    Expands a YAML matrix (benchmarks x toolchains x flag sets) into
+    benchmark controller jobs and runs them on a pool of worker processes.
+
+    Fetch and build phases of different jobs overlap, while the measured run
+    phase is serialised across the whole pool and never overlaps them: a
+    run waits for the fetches and builds in progress, and no new one starts
+    until it finishes (see PhaseLock), so that concurrent builds don't
+    disturb the results. All builds share one make jobserver, so that
+    together they use all CPUs without oversubscribing them. With
+    --cpus-per-run, measured runs of different jobs execute concurrently
+    instead, each one pinned to its own set of CPUs. Each job writes
+    its results under the same unique directory a standalone controller run
+    would use. With --interleave, all jobs are built first, then their
+    iterations take turns (see VariantScheduler).
+
+    Usage: benchmark_sweep.py matrix.yaml [--workers N] [--resume]
+                              [--interleave round-robin|random] [-v]
+"""
+
+import sys
+import os
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from helper.BenchmarkLogger import BenchmarkLogger
+from helper.SweepMatrix import SweepMatrix
+from helper.JobServer import JobServer
+from helper.CpuPartition import CpuPartition
+from helper.PhaseLock import PhaseLock
+from helper.VariantScheduler import VariantScheduler
+
+from benchmark_controller import BenchmarkController, build_parser
+
+# Run and phase locks, build jobserver and CPU partition, inherited by all
+# workers
+_run_lock = None
+_phase_lock = None
+_jobserver = None
+_cpu_partition = None
+
+def _init_worker(run_lock, phase_lock, jobserver, cpu_partition):
+    """Pool initializer, keeps the shared locks in the worker"""
+    global _run_lock, _phase_lock, _jobserver, _cpu_partition
+    _run_lock = run_lock
+    _phase_lock = phase_lock
+    _jobserver = jobserver
+    _cpu_partition = cpu_partition
+
+def _controller(argv):
+    """Controller of a job, sharing the locks of the worker"""
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    controller = BenchmarkController(parser, args)
+    controller.jobserver = _jobserver
+    # Runs never share the machine with builds, even on CPU sets
+    controller.phase_lock = _phase_lock
+    if _cpu_partition:
+        # Runs only share the machine through disjoint CPU sets
+        controller.cpu_partition = _cpu_partition
+    else:
+        controller.run_lock = _run_lock
+    return controller
+
+def _run_job(argv):
+    """Runs a single job through all controller phases, in a pool worker"""
+    controller = _controller(argv)
+    return controller.binary_name, controller.main()
+
+def _setup_job(argv):
+    """Prepares and builds a job, in a pool worker (interleaved sweeps)"""
+    controller = _controller(argv)
+    try:
+        controller.setup()
+    finally:
+        # Held again when the iterations run, see _interleave()
+        controller.release()
+    return controller.binary_name, True
+
+class BenchmarkSweep(object):
+    """Runs all jobs of a sweep matrix on a worker pool"""
+
+    def __init__(self, argparse_parser, argparse_args):
+        self.parser = argparse_parser
+        self.args = argparse_args
+        self.logger = BenchmarkLogger(__name__, self.parser,
+                                      self.args.verbose)
+
+        overrides = {'benchmark_root': self.args.benchmark_root,
+                     'unique_id': self.args.unique_id,
+                     'warmup': self.args.warmup}
+        matrix = SweepMatrix(self.args.matrix, overrides)
+        self.jobs = matrix.jobs()
+        if self.args.interleave and self.args.cpus_per_run:
+            raise ValueError("Interleaved iterations run one at a time, "
+                             "not on CPU sets")
+        if self.args.interleave and matrix.matrix.get('adaptive'):
+            raise ValueError("Interleaved iterations need a fixed number of "
+                             "iterations, not adaptive ones")
+        if self.args.verbose:
+            verbosity = '-' + 'v' * self.args.verbose
+            self.jobs = [job + [verbosity] for job in self.jobs]
+        if self.args.resume:
+            self.jobs = [job + ['--resume'] for job in self.jobs]
+        self.logger.info('Sweep of %d jobs' % len(self.jobs))
+
+    def _interleave(self, jobs, jobserver):
+        """Runs the iterations of the built jobs in turns (see
+           VariantScheduler), returns the number of jobs that failed"""
+
+        scheduler = VariantScheduler(self.args.interleave, self.args.block,
+                                     self.args.seed)
+        self.logger.info('Interleaving the iterations of %d jobs (%s, '
+                         'blocks of %d, seed %d)' %
+                         (len(jobs), scheduler.order, scheduler.block,
+                          scheduler.seed))
+
+        # Controllers of the built jobs, resumed from their journals (so
+        # skipping prepare and build)
+        controllers = []
+        errors = dict()
+        for job in jobs:
+            parser = build_parser()
+            controller = BenchmarkController(parser,
+                                             parser.parse_args(job +
+                                                               ['--resume']))
+            controller.jobserver = jobserver
+            try:
+                controller.setup()
+                controller.start_run()
+            except Exception as err:
+                controller.release()
+                self.logger.error('Job [%s] failed: %s' % (' '.join(job), err))
+                errors[controller] = err
+                continue
+            controllers.append(controller)
+
+        def step(controller):
+            try:
+                return controller.run_iteration()
+            except Exception as err:
+                errors[controller] = err
+                return False
+        scheduler.run(controllers, step)
+
+        failed = len(errors)
+        for controller in controllers:
+            name = controller.binary_name
+            if controller in errors:
+                controller.close_run()
+                controller.release()
+                self.logger.error('Job %s failed: %s' %
+                                  (name, errors[controller]))
+                continue
+            try:
+                valid = controller.report(controller.finish_run())
+            except Exception as err:
+                self.logger.error('Job %s failed: %s' % (name, err))
+                failed += 1
+                continue
+            finally:
+                controller.release()
+            if valid:
+                self.logger.info('Job %s passed' % name)
+            else:
+                self.logger.warning('Job %s failed validation' % name)
+                failed += 1
+        return failed
+
+    def main(self):
+        """Runs all jobs, returns True if all of them passed"""
+
+        # Workers must be forked to inherit the locks
+        context = multiprocessing.get_context('fork')
+        run_lock = context.Lock()
+        phase_lock = PhaseLock()
+        jobserver = JobServer(self.args.build_jobs or JobServer.default_jobs())
+        self.logger.info('Build jobs shared by all workers: %d' %
+                         jobserver.jobs)
+        cpu_partition = None
+        if self.args.cpus_per_run:
+            cpu_partition = CpuPartition(self.args.cpus_per_run,
+                                         self.args.exclude_smt)
+            self.logger.info('Runs shared by all workers on CPU sets: %s' %
+                             cpu_partition.sets)
+
+        stage = _run_job
+        if self.args.interleave:
+            # Runs wait for all the builds, then take turns
+            stage = _setup_job
+        failed = 0
+        built = []
+        with ProcessPoolExecutor(max_workers=self.args.workers,
+                                 mp_context=context,
+                                 initializer=_init_worker,
+                                 initargs=(run_lock, phase_lock, jobserver,
+                                           cpu_partition)) as pool:
+            futures = {pool.submit(stage, job): job for job in self.jobs}
+            for future in as_completed(futures):
+                job = ' '.join(futures[future])
+                try:
+                    name, valid = future.result()
+                except Exception as err:
+                    self.logger.error('Job [%s] failed: %s' % (job, err))
+                    failed += 1
+                    continue
+                if self.args.interleave:
+                    self.logger.info('Job %s built' % name)
+                    built.append(futures[future])
+                elif valid:
+                    self.logger.info('Job %s passed' % name)
+                else:
+                    self.logger.warning('Job %s failed validation' % name)
+                    failed += 1
+
+        if self.args.interleave:
+            # In job order, whatever order they were built in
+            jobs = [job for job in self.jobs if job in built]
+            failed += self._interleave(jobs, jobserver)
+
+        self.logger.info('Sweep finished: %d of %d jobs passed' %
+                         (len(self.jobs) - failed, len(self.jobs)))
+        return failed == 0
+
+
+if __name__ == '__main__':
+    """Point of entry of the sweep mode"""
+    parser = argparse.ArgumentParser(description='Benchmark Harness Sweep')
+
+    parser.add_argument('matrix', type=str,
+                        help='YAML file with the sweep matrix')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                        help='Number of concurrent jobs (fetch/build)')
+    parser.add_argument('--build-jobs', type=int, default=0,
+                        help='Build jobs shared by all workers (default: number of CPUs)')
+    parser.add_argument('--cpus-per-run', type=int, default=0,
+                        help='Run jobs concurrently, each run pinned to its own set of N CPUs')
+    parser.add_argument('--exclude-smt', action='store_true',
+                        help='Only use one hardware thread per core for pinned runs')
+    parser.add_argument('--benchmark-root', type=str,
+                        help='The benchmark root directory (overrides matrix)')
+    parser.add_argument('--unique-id', type=str, default=os.getpid(),
+                        help='Unique ID shared by all jobs of the sweep')
+    parser.add_argument('--resume', action='store_true',
+                        help='Resume an interrupted sweep (same matrix and '
+                             '--unique-id), skipping completed work')
+    parser.add_argument('--warmup', type=int,
+                        help='Discarded warm-up iterations of each job (overrides matrix)')
+    parser.add_argument('--interleave', type=str,
+                        choices=VariantScheduler.ORDERS,
+                        help='Build all jobs first, then run their iterations '
+                             'in turns, in the same order every round or '
+                             'shuffled')
+    parser.add_argument('--block', type=int, default=1,
+                        help='Iterations of each job per interleaved round')
+    parser.add_argument('--seed', type=int,
+                        help='Seed of the random interleaved order (default: '
+                             'random, logged)')
+    parser.add_argument('-v', '--verbose', action='count', default=0,
+                        help='The verbosity of logging output')
+    args = parser.parse_args()
+
+    sweep = BenchmarkSweep(parser, args)
+    success = sweep.main()
+    if not success:
+        sys.exit(1)
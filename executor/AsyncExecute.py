@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+ Execute commands with asyncio, same parser plugin contract as Execute
+
+ Usage:
+  result = asyncio.run(AsyncExecute(['myapp', '-flag'], outp=Plugin).run_async())
+
+  # Independent lists of commands, at most 4 commands at a time, each list
+  # running in order and stopping at its first failure
+  results = AsyncExecute.run_lists([[AsyncExecute(...), AsyncExecute(...)],
+                                    [AsyncExecute(...)]], limit=4)
+
+ Output is always streamed: lines are fed to the plugins as they arrive
+ (and written to prefix.stdout.log/prefix.stderr.log with logs='prefix'),
+ without plugins only the last tail_size bytes are kept, as with Execute.
+
+ Cancelling a task (or interrupting run_lists) terminates its process and
+ the process' children (each command runs in its own process group), then
+ kills them if they don't exit within kill_delay seconds. So does running
+ out of time with setLimits(timeout=...), which sets result.timed_out.
+"""
+
+import asyncio
+import functools
+import subprocess
+import signal
+import os
+from collections import deque
+
+from executor.Execute import Execute
+
+class AsyncExecute(Execute):
+    """Executes commands as asyncio subprocesses, parse with plugins"""
+
+    # Bytes read from a pipe at once
+    CHUNK_SIZE = 1 << 16
+
+    async def _stream_async(self, stream, log, parser, tail):
+        """Tees a stream into its log file (if any), feeding lines to the
+           parser (if any) or keeping the last tail_size bytes
+           The log gets the raw chunks as read, lines longer than
+           LINE_LIMIT go to the parser in LINE_LIMIT pieces (as Execute)"""
+        size = 0
+        pending = b''
+        out = open(log, 'wb') if log else None
+        try:
+            while True:
+                chunk = await stream.read(self.CHUNK_SIZE)
+                if out and chunk:
+                    out.write(chunk)
+                parts = (pending + chunk).split(b'\n')
+                lines = [part + b'\n' for part in parts[:-1]]
+                # Incomplete, unless too long to wait for the rest
+                pending = parts[-1]
+                while len(pending) >= self.LINE_LIMIT:
+                    lines.append(pending[:self.LINE_LIMIT])
+                    pending = pending[self.LINE_LIMIT:]
+                if not chunk and pending:
+                    # Last line, without a newline
+                    lines.append(pending)
+                for line in lines:
+                    text = line.decode('utf-8', errors='replace')
+                    if parser:
+                        parser.feed(text)
+                        continue
+                    tail.append(text)
+                    size += len(text)
+                    while size > self.tail_size and len(tail) > 1:
+                        size -= len(tail.popleft())
+                if not chunk:
+                    break
+        finally:
+            if out:
+                out.close()
+
+    def _preexec(self, limiter):
+        # Single threaded event loop: pinning in the child is safe here
+        if self.cpus:
+            os.sched_setaffinity(0, self.cpus)
+        if limiter:
+            limiter()
+
+    async def run_async(self):
+        """Execute the command, return a CompletedProcess with the parsed
+           out/err (or plain text without plugins)"""
+
+        proc = await asyncio.create_subprocess_exec(
+            *self._command(),
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            env=self.env,
+            pass_fds=self.pass_fds,
+            limit=self.LINE_LIMIT,
+            preexec_fn=(functools.partial(self._preexec, self._limiter())
+                        if self.cpus or self.limits else None),
+            # Own process group, to stop its children along with it
+            start_new_session=True)
+
+        tails = [deque(), deque()]
+        logs = [None, None]
+        if self.logs:
+            logs = [self.logs + '.stdout.log', self.logs + '.stderr.log']
+        async def finish():
+            await asyncio.gather(
+                self._stream_async(proc.stdout, logs[0], self.outp, tails[0]),
+                self._stream_async(proc.stderr, logs[1], self.errp, tails[1]))
+            return await proc.wait()
+        self.timed_out = False
+        try:
+            returncode = await asyncio.wait_for(finish(), self.timeout)
+        except asyncio.TimeoutError:
+            self.timed_out = True
+            await self._stop(proc)
+            returncode = proc.returncode
+        except asyncio.CancelledError:
+            await self._stop(proc)
+            raise
+
+        stdout = self.outp.result() if self.outp else ''.join(tails[0])
+        stderr = self.errp.result() if self.errp else ''.join(tails[1])
+        result = subprocess.CompletedProcess(self.program, returncode,
+                                             stdout, stderr)
+        result.timed_out = self.timed_out
+        return result
+
+    async def _stop(self, proc):
+        """Terminates a process and its children, killing them if they
+           don't exit in time"""
+        try:
+            os.killpg(proc.pid, signal.SIGTERM)
+        except ProcessLookupError:
+            return
+        try:
+            await asyncio.wait_for(proc.wait(), self.kill_delay)
+        except (asyncio.TimeoutError, asyncio.CancelledError):
+            # Out of time, or cancelled again: don't leave it behind
+            try:
+                os.killpg(proc.pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+            await proc.wait()
+
+    def run(self):
+        """Blocking run, for the Execute interface"""
+        return asyncio.run(self.run_async())
+
+    @staticmethod
+    async def _run_list(executors, semaphore):
+        """Runs executors in order, stops at the first failure"""
+        results = []
+        for executor in executors:
+            async with semaphore:
+                result = await executor.run_async()
+            results.append(result)
+            if result.returncode:
+                break
+        return results
+
+    @staticmethod
+    async def run_lists_async(lists, limit=4):
+        """Runs independent lists of executors concurrently, with at most
+           limit processes at a time. Returns the results of each list, in
+           order. If any list raises, the others are cancelled."""
+        if limit < 1:
+            raise ValueError("Concurrency limit must be positive")
+        semaphore = asyncio.Semaphore(limit)
+        tasks = [asyncio.ensure_future(AsyncExecute._run_list(executors,
+                                                              semaphore))
+                 for executors in lists]
+        try:
+            return await asyncio.gather(*tasks)
+        except BaseException as err:
+            # When cancelled, gather already cancelled them all
+            if not isinstance(err, asyncio.CancelledError):
+                for task in tasks:
+                    task.cancel()
+            # Wait until their processes are stopped
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+
+    @staticmethod
+    def run_lists(lists, limit=4):
+        """Blocking version of run_lists_async"""
+        return asyncio.run(AsyncExecute.run_lists_async(lists, limit))
@@ -4,12 +4,26 @@
 from subprocess import CompletedProcess
 import yaml
 
+from executor.MetricTable import MetricTable
+from executor.ResultWriter import YamlWriter
+
 class CompletedProcessList:
-    """ Simple list of CompletedSubprocess to collate out, err, return codes """
-    def __init__(self):
+    """ Simple list of CompletedSubprocess to collate out, err, return codes
+
+        Parsed (dict) outputs are also kept as typed columns, one row per
+        process, in out_metrics and err_metrics (see MetricTable), and
+        streamed to disk by the writers given (see ResultWriter). """
+    def __init__(self, writers=()):
         self.returncode = 0
+        # Processes stopped for running out of time
+        self.timeouts = 0
         self.list = []
-        self.idx = 0
+        self.out_metrics = MetricTable()
+        self.err_metrics = MetricTable()
+        # YAML of the parsed outputs dumped so far, one entry per process
+        self.out_yaml = []
+        self.err_yaml = []
+        self.writers = list(writers)
 
     def append(self, result):
         """ Adds a new CompleteProcess to the list"""
@@ -17,31 +31,40 @@ class CompletedProcessList:
             raise TypeError("result must be a CompleteProcess")
         self.list.append(result)
         self.returncode += result.returncode
+        if getattr(result, 'timed_out', False):
+            self.timeouts += 1
+        if isinstance(result.stdout, dict):
+            self.out_metrics.append(result.stdout)
+        if isinstance(result.stderr, dict):
+            self.err_metrics.append(result.stderr)
+        for writer in self.writers:
+            writer.append(result)
 
-    def __iter__(self):
-        return self
+    def __len__(self):
+        return len(self.list)
 
-    def __next__(self):
-        if self.idx >= len(self.list):
-            self.idx = 0
-            raise StopIteration
-        self.idx += 1
-        return self.list[self.idx-1]
+    def __iter__(self):
+        return iter(self.list)
 
     def __getitem__(self, idx):
-        self.idx = 0
         return self.list[idx]
 
+    @staticmethod
+    def _dump(outs, dumped):
+        """YAML list of all dicts, only dumping the ones not seen yet
+           (a YAML list is the concatenation of its one element lists)"""
+        for out in outs[len(dumped):]:
+            dumped.append(yaml.dump([out], Dumper=YamlWriter.DUMPER,
+                                    default_flow_style=False))
+        return ''.join(dumped)
+
     def stdout(self):
         out = ''
         if not self.list:
             return out
         if isinstance(self.list[0].stdout, dict):
-            outs = []
-            for r in self.list:
-                if r.stdout:
-                    outs.append(r.stdout)
-            out = yaml.dump(outs, default_flow_style=False)
+            outs = [r.stdout for r in self.list if r.stdout]
+            out = self._dump(outs, self.out_yaml)
         else:
             for r in self.list:
                 if r.stdout:
@@ -53,11 +76,8 @@ class CompletedProcessList:
         if not self.list:
             return err
         if isinstance(self.list[0].stderr, dict):
-            errs = []
-            for r in self.list:
-                if r.stderr:
-                    errs.append(r.stderr)
-            err = yaml.dump(errs, default_flow_style=False)
+            errs = [r.stderr for r in self.list if r.stderr]
+            err = self._dump(errs, self.err_yaml)
         else:
             for r in self.list:
                 if r.stderr:
@@ -6,31 +6,164 @@
  Usage:
   out, err = Execute(['myapp', '-flag', 'etc'], outp=Plugin, errp=None).run()
 
+ Optional: env replaces the environment of the program, pass_fds lists
+           file descriptors the program inherits (ex. make's jobserver),
+           cpus is a list of CPUs to pin the program to
+
+ Streaming: with logs='path/prefix', out/err are written to prefix.stdout.log
+            and prefix.stderr.log as they arrive and fed line by line to the
+            plugins, so only the last tail_size bytes of unparsed output are
+            kept in memory (and returned instead of the whole output)
+
+ Limits: setLimits(timeout=60, limits={'as': 1 << 30, 'cpu': 30}) bounds the
+         wall clock time of the program (SIGTERM to its process group,
+         then SIGKILL kill_delay seconds later, and result.timed_out is
+         set) and sets its resource limits (RLIMIT_AS, RLIMIT_CPU, ...),
+         in the child before it executes the program.
+         Every program runs in its own process group, so that its
+         children are stopped along with it.
+
  Plugin: parses the output of a specific benchmark, returns a dict()
          passing None makes run() returns plain text as str()
          use isinstance(out, dict) to differentiate handling
+         values are strings unless the plugin declares their types
 """
 
 import subprocess
+import threading
+import resource
+import signal
 import re
+import os
+from collections import deque
 
 class OutputParser:
     """Base class for all output (out/err) parsers that will be passed
-       to the Execute class."""
+       to the Execute class.
+
+       Fields are compiled once per parser class. parse() searches the
+       whole output once per field, like re.search. Streamed output is fed
+       line by line, and a field's regex only runs on the lines containing
+       its longest required literal (its anchor, ex. 'instructions'), so
+       streamed fields must match within a line. Fields with an entry in
+       types are converted (ex. int, float), others stay strings."""
+
+    # Compiled engines, by parser class, fields and filters
+    _engines = dict()
+
+    # Shortest literal worth using as an anchor
+    ANCHOR_MIN = 3
+
     def __init__(self):
         # Interesting fields in output, with regex to match
         self.fields = None
+        # Conversion of matched values, by field (ex. int, float)
+        self.types = dict()
+        # Which way is better, by field ('higher' or 'lower'), for metrics
+        # worth tracking across runs (see RegressionDetector)
+        self.directions = dict()
         # Filters to clean up matched output using replace
         self.filters = {
             # commas can appear in middle of numbers, depending on locale
             ',' : ''
         }
+        # Fields matched so far by feed()
+        self.partial = None
+        # Compiled engine of this instance, see _engine()
+        self.engine = None
+
+    @classmethod
+    def _anchor(cls, regex):
+        """Longest literal every match of regex contains, None if unknown"""
+        if re.search(r'\(\?[aiLmsux]', regex):
+            return None
+        runs = ['']
+        depth = 0
+        idx = 0
+        while idx < len(regex):
+            char = regex[idx]
+            literal = None
+            if char == '\\' and idx + 1 < len(regex):
+                idx += 1
+                if not regex[idx].isalnum():
+                    literal = regex[idx]
+                elif regex[idx] in 'xuU':
+                    # Escaped code points end the run, with their digits
+                    idx += {'x': 2, 'u': 4, 'U': 8}[regex[idx]]
+                elif regex[idx] == 'N':
+                    idx = regex.find('}', idx)
+                elif regex[idx].isdigit():
+                    # Octal escapes and group references
+                    while regex[idx + 1:idx + 2].isdigit():
+                        idx += 1
+            elif char == '[':
+                # Skip the class, ']' right after '[' or '[^' is literal
+                idx += 2 if regex[idx + 1:idx + 2] == '^' else 1
+                idx += 1 if regex[idx:idx + 1] == ']' else 0
+                while idx < len(regex) and regex[idx] != ']':
+                    idx += 2 if regex[idx] == '\\' else 1
+            elif char == '(':
+                depth += 1
+            elif char == ')':
+                depth -= 1
+            elif char == '|' and depth == 0:
+                return None
+            elif char in '?*{':
+                # Last character may be missing (or repeated)
+                runs[-1] = runs[-1][:-1]
+                if char == '{':
+                    idx = regex.find('}', idx)
+            elif char not in '.^$+?*{}':
+                literal = char
+
+            if literal is not None and depth == 0:
+                runs[-1] += literal
+            elif runs[-1]:
+                runs.append('')
+            idx += 1
+
+        anchor = max(runs, key=len)
+        if len(anchor) < cls.ANCHOR_MIN:
+            return None
+        return anchor
+
+    def _engine(self):
+        """Returns ({field: (regex, anchor)}, filters regex), compiling
+           them on first use for each class"""
+        if self.engine:
+            return self.engine
+
+        key = (type(self), tuple(self.fields.items()),
+               tuple(self.filters.items()))
+        if key not in OutputParser._engines:
+            compiled = dict()
+            for field, regex in self.fields.items():
+                compiled[field] = (re.compile(regex), self._anchor(regex))
+            filters = None
+            if self.filters:
+                filters = re.compile('|'.join(re.escape(find)
+                                              for find in self.filters))
+            OutputParser._engines[key] = (compiled, filters)
+
+        self.engine = OutputParser._engines[key]
+        return self.engine
 
     def sanitise(self, string):
         """Sanitise using cleanup rules"""
-        for find, repl in self.filters.items():
-            string = string.replace(find, repl)
-        return string
+        filters = self._engine()[1]
+        if filters is None:
+            return string
+        return filters.sub(lambda match: self.filters[match.group(0)], string)
+
+    def convert(self, field, string):
+        """Sanitises and converts a matched value to the field's type"""
+        value = self.sanitise(string)
+        if field in self.types:
+            try:
+                return self.types[field](value)
+            except ValueError:
+                pass
+        return value
 
     def parse(self, output):
         """Parses the raw output, returns dictionary"""
@@ -40,16 +173,39 @@ class OutputParser:
             return dict()
 
         data = dict()
-        for field, regex in self.fields.items():
-            match = re.search(regex, output)
+        for field, (regex, _) in self._engine()[0].items():
+            match = regex.search(output)
             if match:
-                data[field] = self.sanitise(match.group(1))
+                data[field] = self.convert(field, match.group(1))
         return data
 
+    def feed(self, line):
+        """Parses one line of streamed output"""
+        if self.partial is None:
+            self.partial = dict()
+        for field, (regex, anchor) in self._engine()[0].items():
+            if field in self.partial or (anchor and anchor not in line):
+                continue
+            match = regex.search(line)
+            if match:
+                self.partial[field] = self.convert(field, match.group(1))
+
+    def result(self):
+        """Returns the fields fed so far, and starts over"""
+        data = self.partial or dict()
+        self.partial = None
+        return {field: data[field] for field in self.fields if field in data}
+
 class Execute(object):
     """Executes commands, captures output, parse with plugins"""
 
-    def __init__(self, program, outp=None, errp=None):
+    # Longest chunk read at once from a streamed pipe
+    LINE_LIMIT = 1 << 20
+    # Seconds between terminating a timed out (or cancelled) process and
+    # killing it
+    KILL_DELAY = 5
+    def __init__(self, program, outp=None, errp=None, env=None, pass_fds=(),
+                 cpus=None, logs=None, tail_size=1 << 16):
         # validate arguments
         if program and not isinstance(program, list):
             raise TypeError("Program needs to be a list of arguments")
@@ -61,26 +217,200 @@ class Execute(object):
         self.program = program
         self.outp = outp
         self.errp = errp
+        self.env = env
+        self.pass_fds = pass_fds
+        self.cpus = cpus
+        self.logs = logs
+        self.tail_size = tail_size
+        # Set with setLimits()
+        self.timeout = None
+        self.limits = dict()
+        self.kill_delay = self.KILL_DELAY
+        self.timed_out = False
 
-    def run(self):
-        """Execute Commands, return out/err, accepts parser plugins"""
+    def setLimits(self, timeout=None, limits=None, kill_delay=None):
+        """Bounds the run time (seconds, None for no limit) and resources
+           (resource name, ex. 'as' or 'cpu', to its limit) of the program"""
+        if timeout is not None and timeout <= 0:
+            raise ValueError("Timeout must be positive")
+        for name, value in (limits or {}).items():
+            if not hasattr(resource, 'RLIMIT_' + name.upper()):
+                raise ValueError("Unknown resource limit '%s'" % name)
+            if not isinstance(value, int) or value < 0:
+                raise ValueError("Resource limit %s must be a non-negative "
+                                 "integer" % name)
+        if kill_delay is not None and kill_delay < 0:
+            raise ValueError("Kill delay can't be negative")
+        self.timeout = timeout
+        self.limits = dict(limits or {})
+        if kill_delay is not None:
+            self.kill_delay = kill_delay
+
+    def _command(self):
+        """Program arguments to execute"""
+        return self.program
 
-        # Call the program, capturing stdout/stderr
-        result = subprocess.run(self.program,
+    def _limiter(self):
+        """Function setting the resource limits in the child (preexec_fn),
+           None without limits
+           It runs in the forked child, before exec: values are worked out
+           here, so that it only makes setrlimit calls (no imports, locks or
+           Python level allocations that other threads could be holding),
+           and the program itself starts without any wrapper around it"""
+        if not self.limits:
+            return None
+        settings = []
+        for name, value in sorted(self.limits.items()):
+            limit = getattr(resource, 'RLIMIT_' + name.upper())
+            hard = resource.getrlimit(limit)[1]
+            if hard != resource.RLIM_INFINITY:
+                value = min(value, hard)
+            settings.append((limit, (value, hard)))
+        setrlimit = resource.setrlimit
+        def limiter():
+            for limit, values in settings:
+                setrlimit(limit, values)
+        return limiter
+
+    @staticmethod
+    def _signal(proc, sig):
+        """Sends a signal to the process group of the program"""
+        try:
+            os.killpg(proc.pid, sig)
+        except ProcessLookupError:
+            pass
+
+    def _watch(self, proc):
+        """Starts the timeout watchdog of the program, returns the event
+           that stops it (to set once the program is done)"""
+        done = threading.Event()
+        self.timed_out = False
+        if not self.timeout:
+            return done
+        def watchdog():
+            if done.wait(self.timeout):
+                return
+            self.timed_out = True
+            self._signal(proc, signal.SIGTERM)
+            if not done.wait(self.kill_delay):
+                self._signal(proc, signal.SIGKILL)
+        threading.Thread(target=watchdog, daemon=True).start()
+        return done
+
+    def _spawn(self):
+        """Starts the program in its own process group, with pipes"""
+        return subprocess.Popen(self._command(),
                                 stdout=subprocess.PIPE,
-                                stderr=subprocess.PIPE)
- 
+                                stderr=subprocess.PIPE,
+                                env=self.env,
+                                pass_fds=self.pass_fds,
+                                preexec_fn=self._limiter(),
+                                # Own process group, to stop its children
+                                start_new_session=True)
+
+    def _finish(self, proc, readers):
+        """Waits for the readers and the program under the watchdog,
+           returns its exit code. Interrupted, stops the process group."""
+        done = self._watch(proc)
+        try:
+            for reader in readers:
+                reader.start()
+            for reader in readers:
+                reader.join()
+            return self._wait(proc)
+        except BaseException:
+            # ex. KeyboardInterrupt: it no longer reaches the group
+            self._signal(proc, signal.SIGKILL)
+            raise
+        finally:
+            done.set()
+
+    def _stream(self, pipe, log, parser, tail):
+        """Tees a pipe into its log file, feeding lines to the parser (if
+           any) or keeping the last tail_size bytes"""
+        size = 0
+        with open(log, 'wb') as out:
+            for line in iter(lambda: pipe.readline(self.LINE_LIMIT), b''):
+                out.write(line)
+                text = line.decode('utf-8', errors='replace')
+                if parser:
+                    parser.feed(text)
+                    continue
+                tail.append(text)
+                size += len(text)
+                while size > self.tail_size and len(tail) > 1:
+                    size -= len(tail.popleft())
+        pipe.close()
+
+    def _run_streaming(self):
+        """Runs the program streaming out/err, returns CompletedProcess"""
+
+        proc = self._spawn()
+
+        # One reader per pipe, so that neither can fill up and block
+        tails = [deque(), deque()]
+        readers = [
+            threading.Thread(target=self._stream,
+                             args=(proc.stdout, self.logs + '.stdout.log',
+                                   self.outp, tails[0])),
+            threading.Thread(target=self._stream,
+                             args=(proc.stderr, self.logs + '.stderr.log',
+                                   self.errp, tails[1])),
+        ]
+        returncode = self._finish(proc, readers)
+
+        stdout = self.outp.result() if self.outp else ''.join(tails[0])
+        stderr = self.errp.result() if self.errp else ''.join(tails[1])
+        return subprocess.CompletedProcess(self.program, returncode,
+                                           stdout, stderr)
+
+    def _run_captured(self):
+        """Runs the program capturing all out/err, returns CompletedProcess"""
+
+        proc = self._spawn()
+
+        # One reader per pipe, so that neither can fill up and block
+        outputs = [b'', b'']
+        def read(idx, pipe):
+            outputs[idx] = pipe.read()
+            pipe.close()
+        readers = [threading.Thread(target=read, args=(0, proc.stdout)),
+                   threading.Thread(target=read, args=(1, proc.stderr))]
+        returncode = self._finish(proc, readers)
+
         # Collect stdout, parse if parser available
-        stdout = result.stdout.decode('utf-8')
+        stdout = outputs[0].decode('utf-8')
         if self.outp:
             stdout = self.outp.parse(stdout)
-        result.stdout = stdout
 
         # Collect stderr, parse if parser available
-        stderr = result.stderr.decode('utf-8')
+        stderr = outputs[1].decode('utf-8')
         if self.errp:
             stderr = self.errp.parse(stderr)
-        result.stderr = stderr
- 
-        # Return
-        return result
+
+        return subprocess.CompletedProcess(self.program, returncode,
+                                           stdout, stderr)
+
+    def _wait(self, proc):
+        """Waits for the program to finish, returns its exit code"""
+        return proc.wait()
+
+    def run(self):
+        """Execute Commands, return out/err, accepts parser plugins"""
+
+        # Children inherit the affinity of the calling thread, which is
+        # thread safe (unlike setting it in preexec_fn)
+        if self.cpus:
+            affinity = os.sched_getaffinity(0)
+            os.sched_setaffinity(0, self.cpus)
+
+        try:
+            if self.logs:
+                result = self._run_streaming()
+            else:
+                result = self._run_captured()
+            result.timed_out = self.timed_out
+            return result
+        finally:
+            if self.cpus:
+                os.sched_setaffinity(0, affinity)
@@ -4,8 +4,9 @@
  Linux Tools' Perf wrapper for Execute
 
  Usage:
-  app = LinuxPerf(['myapp', '-flag', 'etc'], outp=Plugin)
-  out, err = app.stat()
+  app = LinuxPerf(['myapp', '-flag', 'etc'], plugin=Plugin)
+  app.setStat(events=[['cycles', 'instructions'], 'page-faults'])
+  out, err = app.run()
 
  Plugin: parses the output of a specific benchmark, returns a dictionary
          stderr is parsed by Perf's own local parser. If benchmark also
@@ -15,29 +16,192 @@
 """
 
 from executor.Execute import *
+from helper.Statistics import Statistics
 from pathlib import Path
+from array import array
+import math
 import os
+import re
 import shutil
 
 class LinuxPerfParser(OutputParser):
-    """All data generated by perf as well as external dictionary"""
-    def __init__(self):
+    """Counters from perf stat's CSV output (-x,), one line per event:
+         value,unit,event[,variance%],run time,running %[,metric,unit]
+
+       Each counted event gives its value (int, or float for ex. msec) and:
+         event:ratio     fraction of the time the event was counted (below
+                         1 when events are multiplexed and the value is a
+                         scaled estimate, 0 if it was never counted)
+         event:variance  relative standard deviation, in % (with -r)
+         event:unit      unit of the value, when perf reports one
+       duration_time is reported as elapsed, in seconds. Other lines (ex.
+       the program's own stderr) are ignored. Events are named as requested
+       (see names): the modifiers perf appends to them are dropped, ex.
+       'cycles:u' when it can only count user space.
+
+       In interval mode (perf stat -I, lines start with a timestamp), the
+       samples of each event are kept in compact arrays, returned under
+       'intervals' ({event: {'time': [...], 'value': [...]}}), and each
+       event's value is its total, plus:
+         event:rate      steady-state rate, per second
+         event:warmup    time to reach the steady state, in seconds
+       event:ratio is then the mean over all intervals."""
+    def __init__(self, interval=False, tolerance=0.1):
         super().__init__()
-        self.fields = {
-            'instructions' : r'([\d,]+)\s+instructions',
-            'cycles' : r'([\d,]+)\s+cycles',
-            'cpu-migrations' : r'([\d,]+)\s+cpu-migrations',
-            'context-switches' : r'([\d,]+)\s+context-switches',
-            'page-faults' : r'([\d,]+)\s+page-faults',
-            'branches' : r'([\d,]+)\s+branches',
-            'branch-misses' : r'([\d,]+)\s+branch-misses',
-            'elapsed' : r'(\d+\.\d+)\s+seconds time elapsed'
+        # No regex fields, lines are split on the separator
+        self.fields = dict()
+        self.separator = ','
+        # Lines start with a timestamp (perf stat -I)
+        self.interval = interval
+        # Steady-state tolerance, relative to the rate
+        self.tolerance = tolerance
+        # Interval samples, by event: (times, values, ratios)
+        self.series = dict()
+        # Event names as requested, empty drops all modifiers
+        self.names = set()
+        self.directions = {
+            'instructions' : 'lower',
+            'cycles' : 'lower',
+            'context-switches' : 'lower',
+            'cpu-migrations' : 'lower',
+            'page-faults' : 'lower',
+            'branch-misses' : 'lower',
+            'elapsed' : 'lower'
         }
 
+    # Modifiers perf appends to event names, see perf list
+    MODIFIERS = re.compile(r':[ukhIGHpPSDWe]+$')
+
+    def _name(self, event):
+        """Event name as requested, without the modifiers perf added"""
+        if event in self.names:
+            return event
+        name = self.MODIFIERS.sub('', event)
+        if name in self.names or not self.names:
+            return name
+        return event
+
+    @staticmethod
+    def _number(string):
+        """int or float of a counter value, None if it's not a number"""
+        try:
+            return int(string)
+        except ValueError:
+            pass
+        try:
+            return float(string)
+        except ValueError:
+            return None
+
+    def feed(self, line):
+        """Parses one line of perf stat CSV output"""
+        if self.partial is None:
+            self.partial = dict()
+        fields = line.rstrip('\n').split(self.separator)
+        timestamp = None
+        if self.interval and fields:
+            timestamp = self._number(fields[0].strip())
+            if timestamp is None:
+                return
+            fields = fields[1:]
+        if len(fields) < 5 or not fields[2]:
+            return
+        value, unit, event = fields[0], fields[1], self._name(fields[2])
+        rest = fields[3:]
+
+        if value.startswith('<not supported>'):
+            return
+        counted = not value.startswith('<not counted>')
+        number = self._number(value) if counted else None
+        if counted and number is None:
+            return
+
+        variance = None
+        if rest[0].endswith('%'):
+            variance = self._number(rest[0][:-1])
+            rest = rest[1:]
+        running = self._number(rest[1]) if len(rest) > 1 else None
+
+        if timestamp is not None:
+            self._sample(event, unit, timestamp, number, running)
+            return
+
+        if event.startswith('duration_time'):
+            if number is not None:
+                # Wall clock time of the whole run, ns
+                self.partial['elapsed'] = number / 1e9
+            return
+
+        if number is not None:
+            self.partial[event] = number
+        if unit:
+            self.partial[event + ':unit'] = unit
+        if running is not None:
+            self.partial[event + ':ratio'] = running / 100 if counted else 0.0
+        if variance is not None:
+            self.partial[event + ':variance'] = variance
+
+    def _sample(self, event, unit, timestamp, number, running):
+        """Keeps one interval sample of an event"""
+        if event not in self.series:
+            self.series[event] = (array('d'), array('d'), array('d'))
+            if unit:
+                self.partial[event + ':unit'] = unit
+        times, values, ratios = self.series[event]
+        times.append(timestamp)
+        values.append(math.nan if number is None else number)
+        ratios.append(running / 100 if running is not None and
+                      number is not None else 0.0)
+
+    def _summarize_series(self, data):
+        """Totals, steady-state rates and warm-up times of the samples"""
+        intervals = dict()
+        for event, (times, values, ratios) in self.series.items():
+            counted = [value for value in values if not math.isnan(value)]
+            intervals[event] = {'time': times.tolist(),
+                                'value': values.tolist()}
+            if event.startswith('duration_time'):
+                data['elapsed'] = math.fsum(counted) / 1e9
+                continue
+            if counted:
+                total = math.fsum(counted)
+                data[event] = int(total) if total.is_integer() else total
+            data[event + ':ratio'] = math.fsum(ratios) / len(ratios)
+            rate, warmup = Statistics.steady_state(times, values,
+                                                   self.tolerance)
+            if rate is not None:
+                data[event + ':rate'] = rate
+                data[event + ':warmup'] = warmup
+        data['intervals'] = intervals
+
+    def result(self):
+        """Returns the events fed so far, and starts over"""
+        data = self.partial or dict()
+        if self.series:
+            self._summarize_series(data)
+        self.partial = None
+        self.series = dict()
+        return data
+
+    def parse(self, output):
+        """Parses the whole perf stat CSV output, returns dictionary"""
+        if not isinstance(output, str):
+            raise TypeError("Output must be string")
+        self.partial = None
+        for line in output.splitlines():
+            self.feed(line)
+        return self.result()
+
 class LinuxPerf(Execute):
     """Overrides Executor to run commands using Linux perf"""
 
-    def __init__(self, program=None, plugin=None, perf=None):
+    # Counted unless setStat() is given other events
+    DEFAULT_EVENTS = [['task-clock', 'context-switches', 'cpu-migrations',
+                       'page-faults'],
+                      ['cycles', 'instructions', 'branches', 'branch-misses']]
+
+    def __init__(self, program=None, plugin=None, perf=None, cpus=None,
+                 logs=None):
         if program and not isinstance(program, list):
             raise TypeError("Program needs to be a list of arguments")
         if not program:
@@ -45,12 +209,13 @@ class LinuxPerf(Execute):
         if plugin and not isinstance(plugin, OutputParser):
             raise TypeError("Output parser needs to derive from OutputParser")
 
-        super(LinuxPerf, self).__init__(None, plugin, LinuxPerfParser())
+        super(LinuxPerf, self).__init__(None, plugin, LinuxPerfParser(),
+                                        cpus=cpus, logs=logs)
 
         # Program to run, to be wrapped with perf stat
         self.program = program
-        # list of events
-        self.events = list()
+        # list of events (names, or lists of names counted as a group)
+        self.events = list(self.DEFAULT_EVENTS)
         # additional stat arguments
         self.stat_args = list()
         # Validate perf and permissions
@@ -61,43 +226,64 @@ class LinuxPerf(Execute):
         self.perf = perf
         if self.perf is None:
             self.perf = shutil.which('perf')
+            if self.perf is None:
+                raise RuntimeError("Perf not found in PATH")
         else:
             self.perf = os.path.abspath(perf)
         if not Path(self.perf).exists():
             raise RuntimeError("Perf '" + self.perf + "' not available")
 
         # Check that you have permissions to do anything
-        CAP_SYS_ADMIN = Path('/proc/sys/kernel/perf_event_paranoid').read_text()
+        try:
+            CAP_SYS_ADMIN = Path('/proc/sys/kernel/perf_event_paranoid').read_text()
+        except OSError:
+            raise RuntimeError("Kernel has no perf events support")
         if int(CAP_SYS_ADMIN) >= 3:
             raise RuntimeError("Can't run perf with CAP_SYS_ADMIN higher than 2")
 
-    def setStat(self, repeat=1, events=None):
-        """Set extra stat arguments"""
+    def setStat(self, repeat=1, events=None, interval=0, tolerance=0.1):
+        """Set extra stat arguments
+           events: event names, or lists of names to count as a group
+           interval: sample the counters every N ms (perf stat -I)
+           tolerance: relative rate change still in the steady state"""
 
         if repeat and not isinstance(repeat, int):
             raise TypeError("Repeat number must be an integer")
         if events and not isinstance(events, list):
             raise TypeError("Events needs to be a list")
-        # Repeat the run N times, reports stdev
-        if repeat > 1:
-            self.stat_args.extend(['-r', repeat])
+        if interval and not isinstance(interval, int):
+            raise TypeError("Interval must be an integer (ms)")
+        if interval and repeat and repeat > 1:
+            raise ValueError("perf stat can't repeat runs in interval mode")
+        # Print the counters every N ms, parsed as time series
+        if interval:
+            self.stat_args.extend(['-I', str(interval)])
+            self.errp.interval = True
+            self.errp.tolerance = tolerance
+        # Repeat the run N times, reports variance
+        if repeat and repeat > 1:
+            self.stat_args.extend(['-r', str(repeat)])
 
-        # Collects only a few events (empty = all)
+        # Collects only these events (empty = default)
         if events:
-            self.stat_args.append('-e')
-            ev_str = ''
-            for event in self.events:
-                ev_str += event
-                ev_str += ','
-            ev_str.pop()
-            self.stat_args.append(ev_str)
+            self.events = events
 
+    def _event_list(self):
+        """Events argument of perf stat, groups in braces"""
+        specs = ['duration_time']
+        for event in self.events:
+            if isinstance(event, (list, tuple)):
+                specs.append('{' + ','.join(event) + '}')
+            else:
+                specs.append(event)
+        return ','.join(specs)
 
     def run(self):
         """Runs perf stat on the process, saving the output"""
 
-        # Perf itself
-        call = [self.perf, 'stat']
+        # Perf itself, machine readable output, all events
+        call = [self.perf, 'stat', '-x', self.errp.separator,
+                '-e', self._event_list()]
 
         # Stat arguments, if any
         if self.stat_args:
@@ -109,5 +295,12 @@ class LinuxPerf(Execute):
         # Replaces program with perf call
         self.program = call
 
+        # Reported under the names asked for
+        for event in self.events:
+            if isinstance(event, (list, tuple)):
+                self.errp.names.update(event)
+            else:
+                self.errp.names.add(event)
+
         # Call and collect output
         return super().run()
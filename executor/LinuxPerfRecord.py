@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+ Linux Tools' Perf sampling profiler wrapper for Execute
+
+ Usage:
+  app = LinuxPerfRecord(['myapp', '-flag', 'etc'], plugin=Plugin,
+                        data='results/myapp.perf.data', frequency=999)
+  result = app.run()       # perf record -g, output parsed as with Execute
+  profile = app.script()   # perf script, folded into a Profile
+
+ The samples are read from perf script as they are printed, so only the
+ distinct stacks are kept in memory, however long the run.
+"""
+
+import re
+import subprocess
+
+from executor.Execute import OutputParser
+from executor.LinuxPerf import LinuxPerf
+from helper.Profile import Profile
+
+class PerfScriptParser(OutputParser):
+    """Folds perf script samples (a header line, one indented line per
+       frame from the leaf up, then a blank line) into a Profile"""
+
+    # Symbol offsets (foo+0x1c) and mapping (/usr/lib/libc.so.6)
+    CLEANUP = re.compile(r'\+0x[0-9a-f]+$|\s+\([^)]*\)$')
+
+    def __init__(self):
+        super().__init__()
+        self.fields = dict()
+        self.profile = Profile()
+        self.comm = None
+        self.frames = []
+
+    def _flush(self):
+        if self.comm is not None:
+            self.profile.add([self.comm] + self.frames[::-1])
+        self.comm = None
+        self.frames = []
+
+    def feed(self, line):
+        """Parses one line of perf script output"""
+        line = line.rstrip('\n')
+        if not line.strip():
+            self._flush()
+        elif line[0] in ' \t':
+            # '    55d0c0a1b2c3 CalcHourglass+0x1c (/path/to/binary)'
+            parts = line.split(None, 1)
+            symbol = parts[-1] if len(parts) > 1 else '[unknown]'
+            while True:
+                cleaned = self.CLEANUP.sub('', symbol)
+                if cleaned == symbol:
+                    break
+                symbol = cleaned
+            # Folded stacks use ';' and ' ' as separators
+            self.frames.append(symbol.replace(';', ':').replace(' ', '_'))
+        else:
+            self._flush()
+            self.comm = line.split()[0]
+
+    def result(self):
+        """Returns the profile of all samples fed, and starts over"""
+        self._flush()
+        profile = self.profile
+        self.profile = Profile()
+        return profile
+
+    def parse(self, output):
+        """Folds the whole perf script output"""
+        if not isinstance(output, str):
+            raise TypeError("Output must be string")
+        for line in output.splitlines():
+            self.feed(line)
+        return self.result()
+
+class LinuxPerfRecord(LinuxPerf):
+    """Overrides LinuxPerf to sample call stacks with perf record"""
+
+    def __init__(self, program=None, plugin=None, perf=None, cpus=None,
+                 logs=None, data='perf.data', frequency=999, events=None):
+        super(LinuxPerfRecord, self).__init__(program, plugin, perf,
+                                              cpus=cpus, logs=logs)
+        if not isinstance(frequency, int) or frequency < 1:
+            raise ValueError("Sampling frequency must be a positive integer")
+        # perf record reports on stderr, nothing to parse there
+        self.errp = None
+        # Where perf record writes the samples
+        self.data = data
+        self.frequency = frequency
+        # Sampled events (empty = perf's default, cycles)
+        self.events = events or list()
+
+    def run(self):
+        """Runs perf record on the process, saving the output"""
+
+        call = [self.perf, 'record', '-g', '-F', str(self.frequency),
+                '-o', self.data]
+        if self.events:
+            call.extend(['-e', ','.join(self.events)])
+        call.append('--')
+        call.extend(self.program)
+        self.program = call
+
+        return super(LinuxPerf, self).run()
+
+    def script(self):
+        """Folds the recorded samples into a Profile"""
+
+        parser = PerfScriptParser()
+        proc = subprocess.Popen([self.perf, 'script', '-F', 'comm,ip,sym',
+                                 '-i', self.data],
+                                stdout=subprocess.PIPE,
+                                stderr=subprocess.DEVNULL,
+                                universal_newlines=True, errors='replace')
+        for line in proc.stdout:
+            parser.feed(line)
+        if proc.wait():
+            raise RuntimeError("perf script failed on %s" % self.data)
+        return parser.result()
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+ Columnar store of parsed results: one typed column per metric, one row
+ per iteration.
+
+ Usage:
+  table = MetricTable()
+  table.append({'FOM': 1195.13, 'Grind': 0.83})
+  table.column('FOM')   # array of floats (numpy array, if installed)
+  table.values('FOM')   # same, without the iterations that missed it
+
+ Numeric values (int, float) go into array('d') columns, where iterations
+ without the metric hold NaN. Other values (ex. strings) go into plain
+ list columns, holding None instead.
+"""
+
+from array import array
+import math
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+class MetricTable(object):
+    """Typed per-metric columns of parsed results"""
+
+    def __init__(self):
+        self.rows = 0
+        # Numeric columns (array of doubles) and other columns (lists)
+        self.numeric = dict()
+        self.other = dict()
+
+    def __len__(self):
+        return self.rows
+
+    def __iter__(self):
+        """Rows as dictionaries, each call is an independent iterator"""
+        return (self.row(idx) for idx in range(self.rows))
+
+    @staticmethod
+    def _is_number(value):
+        return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+    def append(self, values):
+        """Adds a row, from a dictionary of parsed metrics"""
+        if not isinstance(values, dict):
+            raise TypeError("Row must be a dictionary")
+
+        for name, value in values.items():
+            if self._is_number(value) and name not in self.other:
+                if name not in self.numeric:
+                    self.numeric[name] = array('d', [math.nan] * self.rows)
+                self.numeric[name].append(value)
+            else:
+                if name in self.numeric:
+                    # Demote to a generic column, keeping the values
+                    self.other[name] = list(self.numeric.pop(name))
+                if name not in self.other:
+                    self.other[name] = [None] * self.rows
+                self.other[name].append(value)
+
+        # Metrics this row doesn't have
+        for name, column in self.numeric.items():
+            if name not in values:
+                column.append(math.nan)
+        for name, column in self.other.items():
+            if name not in values:
+                column.append(None)
+        self.rows += 1
+
+    def names(self):
+        """Names of all metrics, numeric ones first"""
+        return list(self.numeric) + list(self.other)
+
+    def row(self, idx):
+        """Metrics of one iteration, as a dictionary"""
+        if idx < 0:
+            idx += self.rows
+        if idx < 0 or idx >= self.rows:
+            raise IndexError("Row %d out of range" % idx)
+        row = dict()
+        for name, column in self.numeric.items():
+            if not math.isnan(column[idx]):
+                row[name] = column[idx]
+        for name, column in self.other.items():
+            if column[idx] is not None:
+                row[name] = column[idx]
+        return row
+
+    def _view(self, name):
+        """Numeric column without copy: only for short lived use, the
+           column can't grow while a numpy view of it exists"""
+        if numpy is not None:
+            return numpy.frombuffer(self.numeric[name], dtype=numpy.float64)
+        return self.numeric[name]
+
+    def column(self, name):
+        """All values of a metric (NaN/None where missing), numeric columns
+           as numpy arrays when numpy is available
+           Returns a copy, so that the table can still grow"""
+        if name in self.numeric:
+            if numpy is not None:
+                return self._view(name).copy()
+            return array('d', self.numeric[name])
+        if name in self.other:
+            return list(self.other[name])
+        raise KeyError("No metric named %s" % name)
+
+    def values(self, name):
+        """Values of a numeric metric, without the missing ones (a copy)"""
+        if name not in self.numeric:
+            raise KeyError("No numeric metric named %s" % name)
+        column = self._view(name)
+        if numpy is not None:
+            return column[~numpy.isnan(column)]
+        return array('d', [value for value in column if not math.isnan(value)])
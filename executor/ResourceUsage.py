@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+ Resource usage collector for Execute, for when perf is not available
+
+ Usage:
+  out, err = ResourceUsage(['myapp', '-flag', 'etc'], plugin=Plugin).run()
+
+ The program is reaped with os.wait4, whose kernel resource usage of the
+ program (and of its children it waited for) becomes the err dictionary:
+   elapsed               wall clock time, monotonic, in seconds
+   user-time/system-time CPU time, in seconds
+   max-rss               peak resident set size, in KiB
+   max-rss:floor         peak of the harness when it started the program,
+                         in KiB: max-rss can't be lower (see below)
+   voluntary-switches    context switches waiting for resources
+   involuntary-switches  context switches by preemption
+   minor-faults/major-faults  page faults without/with I/O
+ The program's own stderr is not parsed (see the logs, if streamed).
+
+ Resource limits (see Execute.setLimits) are set in the child before it
+ executes the program, so they add nothing to its usage. max-rss has a
+ floor though: Linux carries the peak RSS of the process over exec, so
+ a program smaller than the harness (from which it forks) reports the
+ harness' peak instead (a launcher forking the program would only lower
+ it to the launcher's own peak). So the floor is reported with it, and a
+ max-rss at max-rss:floor only says the program's own peak is no higher.
+"""
+
+import os
+import resource
+import time
+
+from executor.Execute import Execute, OutputParser
+
+class ResourceUsage(Execute):
+    """Overrides Executor to collect the resource usage of the program"""
+
+    # Which way is better, as in OutputParser.directions
+    DIRECTIONS = {
+        'elapsed' : 'lower',
+        'user-time' : 'lower',
+        'system-time' : 'lower',
+        'max-rss' : 'lower',
+        'involuntary-switches' : 'lower',
+        'major-faults' : 'lower',
+    }
+
+    # Names of the metrics collected
+    METRICS = ('elapsed', 'user-time', 'system-time', 'max-rss',
+               'voluntary-switches', 'involuntary-switches', 'minor-faults',
+               'major-faults')
+
+    def __init__(self, program=None, plugin=None, cpus=None, logs=None):
+        if not program:
+            raise ValueError("Need program arguments to collect usage")
+        if plugin and not isinstance(plugin, OutputParser):
+            raise TypeError("Output parser needs to derive from OutputParser")
+
+        super(ResourceUsage, self).__init__(program, plugin, None,
+                                            cpus=cpus, logs=logs)
+        # Collected by _wait()
+        self.usage = dict()
+        self.start = None
+        # Peak RSS of the harness when the program started, in KiB
+        self.floor = None
+
+    def _wait(self, proc):
+        """Reaps the program with wait4, keeping its resource usage"""
+        _, status, usage = os.wait4(proc.pid, 0)
+        elapsed = time.monotonic() - self.start
+        # Reaped here, so Popen must not wait for it again
+        proc.returncode = os.waitstatus_to_exitcode(status)
+        self.usage = {
+            'elapsed' : elapsed,
+            'user-time' : usage.ru_utime,
+            'system-time' : usage.ru_stime,
+            'max-rss' : usage.ru_maxrss,
+            'max-rss:floor' : self.floor,
+            'voluntary-switches' : usage.ru_nvcsw,
+            'involuntary-switches' : usage.ru_nivcsw,
+            'minor-faults' : usage.ru_minflt,
+            'major-faults' : usage.ru_majflt,
+        }
+        return proc.returncode
+
+    def run(self):
+        """Runs the program, returns its output and resource usage"""
+        # The program starts with this peak, see the module notes
+        self.floor = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        self.start = time.monotonic()
+        result = super().run()
+        result.stderr = self.usage
+        return result
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+ Result writers, streaming the parsed out/err of each iteration to disk
+
+ Usage:
+  writer = ResultWriter.create('jsonl', 'results/lulesh-x86_64-gcc---1234')
+  writer.append(result)   # a CompletedProcess, as each iteration completes
+  writer.close()
+
+ Formats, each one writing prefix.out* (parsed stdout) and prefix.err*
+ (parsed stderr), one record per iteration:
+  yaml   prefix.out/.err: YAML list of one dictionary per iteration (as
+         read by ResultsDatabase), with the C dumper if libyaml is there
+  jsonl  prefix.out.jsonl/.err.jsonl: JSON Lines, one object per line
+  csv    prefix.out.csv/.err.csv: one row per iteration, one column per
+         metric (a metric first seen later on adds a column)
+
+ Every record is flushed as it's appended, so the iterations that completed
+ survive the harness being killed. Only parsed (dict) outputs are written.
+"""
+
+import csv
+import json
+import os
+import yaml
+
+class ResultWriter(object):
+    """Base class of the writers, appends records to prefix.out/.err"""
+
+    # Appended to prefix.out and prefix.err
+    EXTENSION = ''
+
+    def __init__(self, prefix):
+        self.prefix = prefix
+        self.paths = [prefix + '.out' + self.EXTENSION,
+                      prefix + '.err' + self.EXTENSION]
+        self.files = [open(path, 'w', newline='') for path in self.paths]
+        self.count = 0
+
+    @staticmethod
+    def create(name, prefix):
+        """Writer of a format (see FORMATS) to files starting with prefix"""
+        if name not in FORMATS:
+            raise ValueError("Result format must be one of %s" %
+                             ', '.join(FORMATS))
+        return FORMATS[name](prefix)
+
+    def _write(self, idx, record):
+        """Writes a record to the out (0) or err (1) file"""
+        raise NotImplementedError("Result writers must implement _write")
+
+    def append(self, result):
+        """Writes the parsed out/err of a CompletedProcess"""
+        for idx, record in enumerate((result.stdout, result.stderr)):
+            if isinstance(record, dict):
+                self._write(idx, record)
+                self.files[idx].flush()
+        self.count += 1
+
+    def close(self):
+        for out in self.files:
+            out.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+class YamlWriter(ResultWriter):
+    """YAML lists, one element appended at a time (a YAML list is the
+       concatenation of its one element lists)"""
+
+    DUMPER = getattr(yaml, 'CDumper', yaml.Dumper)
+
+    def _write(self, idx, record):
+        # Empty outputs were never listed
+        if record:
+            yaml.dump([record], self.files[idx], Dumper=self.DUMPER,
+                      default_flow_style=False)
+
+class JsonLinesWriter(ResultWriter):
+    """One JSON object per line"""
+
+    EXTENSION = '.jsonl'
+
+    def _write(self, idx, record):
+        self.files[idx].write(json.dumps(record, default=str) + '\n')
+
+class CsvWriter(ResultWriter):
+    """Rows of metrics, the header being the metrics seen so far"""
+
+    EXTENSION = '.csv'
+
+    def __init__(self, prefix):
+        super(CsvWriter, self).__init__(prefix)
+        self.columns = [[], []]
+        self.writers = [None, None]
+
+    def _rewrite(self, idx, columns):
+        """Rewrites the rows written so far with more columns (rare: the
+           metrics usually are the same in every iteration)"""
+        self.files[idx].close()
+        with open(self.paths[idx], newline='') as stream:
+            rows = list(csv.DictReader(stream))
+        tmp = self.paths[idx] + '.tmp'
+        with open(tmp, 'w', newline='') as out:
+            writer = csv.DictWriter(out, columns)
+            writer.writeheader()
+            writer.writerows(rows)
+        os.replace(tmp, self.paths[idx])
+        self.files[idx] = open(self.paths[idx], 'a', newline='')
+
+    def _write(self, idx, record):
+        if not record and self.writers[idx] is None:
+            # No columns to write a row of yet
+            return
+        columns = self.columns[idx]
+        new = [name for name in record if name not in columns]
+        if new or self.writers[idx] is None:
+            columns = columns + new
+            if self.writers[idx] is None:
+                csv.DictWriter(self.files[idx], columns).writeheader()
+            else:
+                self._rewrite(idx, columns)
+            self.columns[idx] = columns
+            self.writers[idx] = csv.DictWriter(self.files[idx], columns)
+        self.writers[idx].writerow(record)
+
+FORMATS = {
+    'yaml' : YamlWriter,
+    'jsonl' : JsonLinesWriter,
+    'csv' : CsvWriter,
+}
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+    CPU Partition
+    Splits the CPUs this process may use into disjoint sets of the same size,
+    so that concurrent benchmark runs can each be pinned to their own set
+    without sharing cores. Optionally only one hardware thread of each core
+    is used, so that SMT siblings don't compete with each other.
+
+    Free sets are tracked in shared memory guarded by a condition created
+    from a fork context, so a partition can be shared by threads as well as
+    by forked processes (ex. the workers of a sweep).
+
+    Usage:
+        partition = CpuPartition(4, exclude_smt=True)
+        cpus = partition.acquire()
+        Execute(['myapp'], cpus=cpus).run()
+        partition.release(cpus)
+"""
+
+import os
+import multiprocessing
+
+class CpuPartition(object):
+    """Disjoint CPU sets for concurrent runs"""
+
+    def __init__(self, cpus_per_set, exclude_smt=False, cpus=None):
+        if not isinstance(cpus_per_set, int) or cpus_per_set < 1:
+            raise ValueError("CPUs per set must be a positive integer")
+
+        available = sorted(cpus if cpus else os.sched_getaffinity(0))
+        if exclude_smt:
+            available = self._one_thread_per_core(available)
+        if len(available) < cpus_per_set:
+            raise ValueError("Only %d CPUs available, can't make sets of %d" %
+                             (len(available), cpus_per_set))
+
+        # Leftover CPUs (less than a full set) stay unused
+        self.sets = [available[i:i + cpus_per_set]
+                     for i in range(0, len(available) - cpus_per_set + 1,
+                                    cpus_per_set)]
+        context = multiprocessing.get_context('fork')
+        self.busy = context.RawArray('b', len(self.sets))
+        self.changed = context.Condition()
+
+    @staticmethod
+    def _parse_list(cpu_list):
+        """Parses the kernel's CPU list format (ex. '0-3,8')"""
+        cpus = []
+        for part in cpu_list.strip().split(','):
+            if not part:
+                continue
+            if '-' in part:
+                first, last = part.split('-')
+                cpus.extend(range(int(first), int(last) + 1))
+            else:
+                cpus.append(int(part))
+        return cpus
+
+    def _one_thread_per_core(self, cpus):
+        """Keeps only the first available hardware thread of each core"""
+        kept = []
+        seen = set()
+        for cpu in cpus:
+            path = ('/sys/devices/system/cpu/cpu%d/topology/thread_siblings_list'
+                    % cpu)
+            try:
+                with open(path) as siblings:
+                    core = tuple(self._parse_list(siblings.read()))
+            except OSError:
+                # No topology information, assume no SMT
+                core = (cpu,)
+            if core not in seen:
+                seen.add(core)
+                kept.append(cpu)
+        return kept
+
+    def acquire(self):
+        """Takes a free CPU set, blocking until one is available"""
+        with self.changed:
+            while all(self.busy):
+                self.changed.wait()
+            idx = list(self.busy).index(0)
+            self.busy[idx] = 1
+            return self.sets[idx]
+
+    def release(self, cpu_set):
+        """Returns a CPU set to the partition"""
+        with self.changed:
+            self.busy[self.sets.index(cpu_set)] = 0
+            self.changed.notify_all()
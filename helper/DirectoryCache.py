@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+    Directory Cache
+    Content-addressed store of directory trees, shared between harness
+    processes.
+
+    Entries are filled once into a staging directory, checksummed and then
+    atomically renamed into place. Every entry has its own lock file, so
+    concurrent processes filling the same entry wait for each other instead
+    of racing, while hits only share it. Entries can be held (ex. a toolchain
+    for the whole run) until released. The store is kept under a size cap by evicting the least
+    recently used entries that no process is holding.
+
+    Layout:
+        <root>/entries/<key>/tree           the cached directory tree
+        <root>/entries/<key>/manifest.yaml  checksum, size, origin
+        <root>/locks/<key>.lock             per entry lock
+        <root>/staging/                     entries being filled
+
+    Usage:
+        cache = DirectoryCache('/tmp/cache', max_size=1 << 30)
+        tree = cache.get(cache.key(url, cmds), fill=lambda path: ...)
+        cache.checkout(key, fill, '/path/to/copy')
+"""
+
+import os
+import shutil
+import hashlib
+import fcntl
+import yaml
+
+# Lock file descriptors held by this process, by lock path
+_held_locks = dict()
+
+class DirectoryCache(object):
+    """Content-addressed, locked, LRU evicted store of directory trees"""
+
+    MANIFEST = 'manifest.yaml'
+
+    def __init__(self, root, max_size=None, verify=True):
+        if not isinstance(root, str) or not root:
+            raise ValueError("Cache root must be a non-empty path")
+        self.root = os.path.abspath(root)
+        # Maximum size of all entries in bytes, None means no limit
+        self.max_size = max_size
+        # Verify the checksum of the whole tree on every hit
+        self.verify = verify
+
+        self.entries = os.path.join(self.root, 'entries')
+        self.locks = os.path.join(self.root, 'locks')
+        self.staging = os.path.join(self.root, 'staging')
+        for path in [self.entries, self.locks, self.staging]:
+            os.makedirs(path, exist_ok=True)
+
+    @staticmethod
+    def key(*parts):
+        """Hash of all parts (any YAML serialisable data), used as key"""
+        raw = yaml.safe_dump(list(parts), default_flow_style=True)
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def checksum(path):
+        """Checksum and size (in bytes) of a directory tree"""
+        digest = hashlib.sha256()
+        size = 0
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            for name in sorted(files):
+                filename = os.path.join(root, name)
+                relative = os.path.relpath(filename, path)
+                digest.update(relative.encode('utf-8') + b'\0')
+                if os.path.islink(filename):
+                    digest.update(os.readlink(filename).encode('utf-8'))
+                    continue
+                digest.update(b'x' if os.access(filename, os.X_OK) else b'-')
+                with open(filename, 'rb') as content:
+                    for block in iter(lambda: content.read(1 << 20), b''):
+                        digest.update(block)
+                        size += len(block)
+        return digest.hexdigest(), size
+
+    @staticmethod
+    def materialize(tree, dest):
+        """Creates dest as a copy of tree, hard linking files if possible"""
+        def link_or_copy(src, dst):
+            try:
+                os.link(src, dst)
+            except OSError:
+                shutil.copy2(src, dst)
+        shutil.copytree(tree, dest, symlinks=True, copy_function=link_or_copy)
+
+    def _entry(self, key):
+        return os.path.join(self.entries, key)
+
+    def _lock_path(self, key):
+        return os.path.join(self.locks, key + '.lock')
+
+    def manifest(self, key):
+        """Manifest of an entry, None if not in the cache"""
+        path = os.path.join(self._entry(key), self.MANIFEST)
+        try:
+            with open(path) as manifest:
+                return yaml.safe_load(manifest)
+        except FileNotFoundError:
+            return None
+
+    def _valid(self, key):
+        """Checks the entry is complete and, if verifying, not corrupted"""
+        manifest = self.manifest(key)
+        tree = os.path.join(self._entry(key), 'tree')
+        if not manifest or not os.path.isdir(tree):
+            return False
+        if self.verify:
+            checksum, _ = self.checksum(tree)
+            return checksum == manifest['checksum']
+        return True
+
+    def _store(self, key, fill, origin):
+        """Fills an entry in the staging area, then moves it into place"""
+        staging = os.path.join(self.staging, '%s.%d' % (key, os.getpid()))
+        if os.path.exists(staging):
+            shutil.rmtree(staging)
+        os.mkdir(staging)
+        try:
+            tree = os.path.join(staging, 'tree')
+            fill(tree)
+            if not os.path.isdir(tree):
+                raise RuntimeError("Cache fill did not create %s" % tree)
+            checksum, size = self.checksum(tree)
+            manifest = {'key': key, 'checksum': checksum, 'size': size,
+                        'origin': origin}
+            with open(os.path.join(staging, self.MANIFEST), 'w') as out:
+                out.write(yaml.safe_dump(manifest, default_flow_style=False))
+            # Same filesystem, so this is atomic
+            os.rename(staging, self._entry(key))
+        except BaseException:
+            shutil.rmtree(staging, ignore_errors=True)
+            raise
+
+    def get(self, key, fill, origin=None, hold=False):
+        """Returns the tree of an entry, calling fill(path) to create it
+           on a miss (or a corrupted hit). With hold, the entry is
+           protected from eviction until released (see release())."""
+        lock = self._lock_path(key)
+        held = lock in _held_locks
+        fd = _held_locks.get(lock)
+        if fd is None:
+            fd = os.open(lock, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            # Hits only share the lock, so readers never wait for each other
+            fcntl.flock(fd, fcntl.LOCK_SH)
+            while not self._valid(key):
+                # Filled (or repaired) exclusively, then shared again. The
+                # conversions aren't atomic, hence checking again after each
+                fcntl.flock(fd, fcntl.LOCK_EX)
+                if not self._valid(key):
+                    if os.path.isdir(self._entry(key)):
+                        shutil.rmtree(self._entry(key))
+                    self._store(key, fill, origin)
+                fcntl.flock(fd, fcntl.LOCK_SH)
+            os.utime(os.path.join(self._entry(key), self.MANIFEST))
+        except BaseException:
+            # Failed fills are not held, but earlier holds are kept
+            if held:
+                fcntl.flock(fd, fcntl.LOCK_SH)
+            else:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+                os.close(fd)
+            raise
+
+        if hold or held:
+            _held_locks[lock] = fd
+        else:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+            os.close(fd)
+
+        self.evict(keep=key)
+        return os.path.join(self._entry(key), 'tree')
+
+    def release(self, key):
+        """Drops the hold on an entry, making it evictable again"""
+        fd = _held_locks.pop(self._lock_path(key), None)
+        if fd is not None:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+            os.close(fd)
+
+    def checkout(self, key, fill, dest, origin=None):
+        """Materializes an entry into dest, filling it on a miss"""
+        held = self._lock_path(key) in _held_locks
+        tree = self.get(key, fill, origin, hold=True)
+        try:
+            self.materialize(tree, dest)
+        finally:
+            if not held:
+                self.release(key)
+        return tree
+
+    def evict(self, keep=None):
+        """Removes least recently used entries until under max_size"""
+        if self.max_size is None:
+            return
+
+        # Only one evicting process at a time, others just skip it
+        evict_fd = os.open(os.path.join(self.locks, 'evict.lock'),
+                           os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(evict_fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(evict_fd)
+            return
+
+        try:
+            entries = []
+            total = 0
+            for key in os.listdir(self.entries):
+                manifest = self.manifest(key)
+                if not manifest:
+                    continue
+                try:
+                    used = os.path.getmtime(os.path.join(self._entry(key),
+                                                         self.MANIFEST))
+                except FileNotFoundError:
+                    continue
+                entries.append((used, key, manifest['size']))
+                total += manifest['size']
+
+            for used, key, size in sorted(entries):
+                if total <= self.max_size:
+                    break
+                if key == keep:
+                    continue
+                # Entries held by this process are locked already
+                lock = self._lock_path(key)
+                if lock in _held_locks:
+                    continue
+                fd = os.open(lock, os.O_RDWR | os.O_CREAT, 0o644)
+                try:
+                    fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except OSError:
+                    # In use (or being filled) by another process
+                    os.close(fd)
+                    continue
+                shutil.rmtree(self._entry(key), ignore_errors=True)
+                total -= size
+                os.close(fd)
+        finally:
+            os.close(evict_fd)
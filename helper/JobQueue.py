@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+    Job Queue
+    State of the jobs a cluster coordinator hands out to its workers.
+
+    Each job is a list of controller arguments and the architecture it must
+    run on (None for any). Workers claim pending jobs of their architecture,
+    send heartbeats while they run them and report their results. Jobs of
+    workers that stopped sending heartbeats are requeued, up to a number of
+    attempts, after which they fail, and so are the jobs of a worker that
+    claims another one without reporting them (workers run one job at a
+    time). A result for a job that was requeued is ignored.
+
+    Usage:
+        queue = JobQueue(heartbeat_timeout=60, attempts=3)
+        queue.add(['lulesh', '--machine_type=aarch64'], 'aarch64')
+        job = queue.claim('node1', 'aarch64')
+        queue.heartbeat('node1')
+        queue.complete('node1', job['id'], valid=True)
+        queue.reap()    # periodically
+"""
+
+import threading
+import time
+
+class JobQueue(object):
+    """Thread safe queue of jobs, with worker heartbeats"""
+
+    STATES = ('pending', 'running', 'passed', 'failed')
+
+    def __init__(self, heartbeat_timeout=60, attempts=3):
+        if heartbeat_timeout <= 0:
+            raise ValueError("Heartbeat timeout must be positive")
+        if attempts < 1:
+            raise ValueError("Jobs need at least one attempt")
+        self.heartbeat_timeout = heartbeat_timeout
+        self.attempts = attempts
+        self.lock = threading.Lock()
+        self.jobs = []
+        # Worker name to its architecture and last heartbeat (monotonic)
+        self.workers = dict()
+
+    def add(self, argv, arch=None):
+        """Queues a job, returns its id"""
+        with self.lock:
+            job = {'id': len(self.jobs), 'argv': list(argv), 'arch': arch,
+                   'state': 'pending', 'worker': None, 'attempts': 0,
+                   'name': None, 'error': None}
+            self.jobs.append(job)
+            return job['id']
+
+    def _seen(self, worker, arch=None):
+        entry = self.workers.setdefault(worker, {'arch': arch, 'seen': 0})
+        if arch:
+            entry['arch'] = arch
+        entry['seen'] = time.monotonic()
+
+    def _requeue(self, job):
+        """Puts back a job whose worker was lost, or fails it"""
+        job['worker'] = None
+        if job['attempts'] >= self.attempts:
+            job['state'] = 'failed'
+            job['error'] = 'Worker lost %d times' % job['attempts']
+            return False
+        job['state'] = 'pending'
+        return True
+
+    def claim(self, worker, arch):
+        """Hands the first pending job of the architecture to a worker,
+           None if there is none (for now)"""
+        with self.lock:
+            self._seen(worker, arch)
+            for job in self.jobs:
+                # Its result was lost: the worker moved on
+                if job['state'] == 'running' and job['worker'] == worker:
+                    self._requeue(job)
+            for job in self.jobs:
+                if job['state'] != 'pending':
+                    continue
+                if job['arch'] and job['arch'] != arch:
+                    continue
+                job['state'] = 'running'
+                job['worker'] = worker
+                job['attempts'] += 1
+                return dict(job)
+            return None
+
+    def heartbeat(self, worker):
+        """Notes that a worker (and the job it runs) is still alive"""
+        with self.lock:
+            self._seen(worker)
+
+    def complete(self, worker, job_id, valid, name=None, error=None):
+        """Records the outcome of a job, returns False if the job no longer
+           belongs to the worker (ex. requeued after missed heartbeats)"""
+        with self.lock:
+            self._seen(worker)
+            job = self.jobs[job_id]
+            if job['state'] != 'running' or job['worker'] != worker:
+                return False
+            job['state'] = 'passed' if valid else 'failed'
+            job['name'] = name
+            job['error'] = error
+            return True
+
+    def reap(self):
+        """Requeues the jobs of workers without recent heartbeats (or fails
+           them after too many attempts), returns the requeued job ids"""
+        now = time.monotonic()
+        requeued = []
+        with self.lock:
+            dead = [worker for worker, entry in self.workers.items()
+                    if now - entry['seen'] > self.heartbeat_timeout]
+            for worker in dead:
+                del self.workers[worker]
+            for job in self.jobs:
+                if job['state'] != 'running' or job['worker'] not in dead:
+                    continue
+                if self._requeue(job):
+                    requeued.append(job['id'])
+        return requeued
+
+    def finished(self):
+        """Whether every job passed or failed"""
+        with self.lock:
+            return all(job['state'] in ('passed', 'failed')
+                       for job in self.jobs)
+
+    def status(self):
+        """Number of jobs in each state, and the live workers"""
+        with self.lock:
+            counts = {state: 0 for state in self.STATES}
+            for job in self.jobs:
+                counts[job['state']] += 1
+            return {'jobs': counts,
+                    'workers': {worker: entry['arch']
+                                for worker, entry in self.workers.items()}}
@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+    GNU make compatible jobserver
+
+    A pipe pre-filled with one token per job. The harness takes a token
+    before starting each build command (its implicit job slot) and gives it
+    back when the command finishes, while make takes extra tokens from the
+    same pipe for its parallel jobs. Builds sharing one JobServer (ex. the
+    workers of a sweep, which inherit the pipe) never run more jobs than
+    there are tokens in total.
+
+    Usage:
+        jobserver = JobServer(JobServer.default_jobs())
+        token = jobserver.acquire()
+        Execute(['make'], env=jobserver.env(), pass_fds=jobserver.fds()).run()
+        jobserver.release(token)
+"""
+
+import os
+import select
+
+class JobServer(object):
+    """Pool of job tokens shared with make through MAKEFLAGS"""
+
+    def __init__(self, jobs):
+        if not isinstance(jobs, int) or jobs < 1:
+            raise ValueError("Number of jobs must be a positive integer")
+        self.jobs = jobs
+        self.read_fd, self.write_fd = os.pipe()
+        os.write(self.write_fd, b'+' * jobs)
+
+    @staticmethod
+    def default_jobs():
+        """Number of CPUs this process is allowed to run on"""
+        return len(os.sched_getaffinity(0))
+
+    def acquire(self):
+        """Takes a token from the pool, blocking until one is free"""
+        while True:
+            try:
+                return os.read(self.read_fd, 1)
+            except BlockingIOError:
+                # make switches the (shared) pipe to non-blocking mode
+                select.select([self.read_fd], [], [])
+
+    def release(self, token):
+        """Returns a token to the pool"""
+        os.write(self.write_fd, token)
+
+    def fds(self):
+        """File descriptors the build commands need to inherit"""
+        return (self.read_fd, self.write_fd)
+
+    def env(self):
+        """Environment for build commands, with the jobserver in MAKEFLAGS"""
+        env = dict(os.environ)
+        # --jobserver-fds for make older than 4.2
+        env['MAKEFLAGS'] = (' -j --jobserver-auth=%d,%d --jobserver-fds=%d,%d'
+                            % (self.fds() + self.fds()))
+        return env
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+    Phase Journal
+    Append-only record of the completed phases of a run (prepare, build and
+    each iteration's parsed results), so that an interrupted run can resume
+    where it stopped.
+
+    Each entry is a line of JSON with the SHA256 of its own contents, and
+    is flushed and synced to disk when written: a line torn by a crash, and
+    everything after it, is ignored. Phases record the digests of their
+    artifacts (ex. the sources tree, the binary), which are verified again
+    before their work is skipped. The first entry holds the digest of the
+    run's configuration: a journal of a different configuration is not
+    resumed.
+
+    Usage:
+        journal = PhaseJournal('runs/<name>/journal.jsonl', config,
+                               resume=True, start_time=time.time())
+        if not journal.completed('build', {binary: PhaseJournal.digest(binary)}):
+            build()
+            journal.record('build', {binary: PhaseJournal.digest(binary)})
+        for entry in journal.entries('iteration'):
+            ...
+"""
+
+import hashlib
+import json
+import os
+
+from helper.DirectoryCache import DirectoryCache
+
+class PhaseJournal(object):
+    """Journal of the completed phases of a run"""
+
+    def __init__(self, path, config, resume=True, **start):
+        self.path = path
+        self.config = self._hash(config)
+        self.entries_read = []
+        if resume and os.path.exists(path):
+            self.entries_read = self._read()
+        self.resumed = bool(self.entries_read and
+                            self.entries_read[0].get('config') == self.config)
+        if not self.resumed:
+            # Nothing to resume: start over
+            self.entries_read = [dict(start, phase='start',
+                                      config=self.config)]
+        # Rewritten without any torn tail, then appended to
+        tmp = path + '.tmp'
+        self.out = open(tmp, 'w')
+        for entry in self.entries_read:
+            self._write(entry)
+        os.replace(tmp, path)
+        # Data of the first run (ex. its start time), kept when resumed
+        self.start = self.entries_read[0]
+
+    @staticmethod
+    def _hash(data):
+        return hashlib.sha256(json.dumps(data, sort_keys=True,
+                                         default=str).encode('utf-8')
+                              ).hexdigest()
+
+    @staticmethod
+    def digest(path):
+        """SHA256 of a file or directory tree, None if it doesn't exist"""
+        if os.path.isdir(path):
+            return DirectoryCache.checksum(path)[0]
+        if not os.path.isfile(path):
+            return None
+        digest = hashlib.sha256()
+        with open(path, 'rb') as content:
+            for block in iter(lambda: content.read(1 << 20), b''):
+                digest.update(block)
+        return digest.hexdigest()
+
+    def _read(self):
+        """Valid entries, up to the first torn or corrupted line"""
+        entries = []
+        with open(self.path) as stream:
+            for line in stream:
+                try:
+                    entry = json.loads(line)
+                    checksum = entry.pop('sha256')
+                except (ValueError, KeyError, AttributeError):
+                    break
+                if checksum != self._hash(entry):
+                    break
+                entries.append(entry)
+        return entries
+
+    def _write(self, entry):
+        line = dict(entry, sha256=self._hash(entry))
+        self.out.write(json.dumps(line, default=str) + '\n')
+        self.out.flush()
+        os.fsync(self.out.fileno())
+
+    def record(self, phase, artifacts=None, **data):
+        """Records a completed phase, with the digests of its artifacts
+           (path to digest) and any JSON serializable data"""
+        entry = dict(data, phase=phase, artifacts=artifacts or {})
+        self._write(entry)
+
+    def entries(self, phase):
+        """Entries of a phase in a resumed journal, oldest first"""
+        return [entry for entry in self.entries_read
+                if entry['phase'] == phase]
+
+    def completed(self, phase, artifacts=None):
+        """Whether a resumed journal has the phase completed, with the same
+           artifacts (path to digest) still present and unchanged"""
+        for entry in self.entries(phase):
+            recorded = entry['artifacts']
+            if artifacts is not None and recorded != artifacts:
+                continue
+            if all(self.digest(path) == digest
+                   for path, digest in recorded.items()):
+                return True
+        return False
+
+    def append(self, result):
+        """Records an iteration (a CompletedProcess), as a result writer"""
+        self.record('iteration', args=result.args,
+                    returncode=result.returncode, stdout=result.stdout,
+                    stderr=result.stderr,
+                    timed_out=getattr(result, 'timed_out', False),
+                    cpus=getattr(result, 'cpus', None))
+
+    def close(self):
+        self.out.close()
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+    Phase Lock
+    Keeps the measured runs of concurrent controllers (ex. the workers of a
+    sweep) apart from their prepare and build phases: any number of
+    controllers can prepare and build at the same time, and any number can
+    run at the same time, but never both. Runs go first: once one is
+    waiting, no new prepare or build starts, and it starts as soon as the
+    ones in progress finish.
+
+    Holders are counted in shared memory guarded by a condition created from
+    a fork context, so a lock can be shared by threads as well as by forked
+    processes.
+
+    Usage:
+        lock = PhaseLock()
+        with lock.hold('build'):
+            make()
+        with lock.hold('run'):
+            benchmark()
+"""
+
+import multiprocessing
+from contextlib import contextmanager
+
+class PhaseLock(object):
+    """Shared within a phase, exclusive between build and run phases"""
+
+    # Phases that share the machine with each other (prepare goes with build)
+    PHASES = ('build', 'run')
+
+    def __init__(self):
+        context = multiprocessing.get_context('fork')
+        self.condition = context.Condition()
+        # Phase holding the lock (index in PHASES + 1, 0 for none), number
+        # of holders and number of runs waiting for it
+        self.state = context.RawArray('i', 3)
+
+    def acquire(self, phase):
+        """Waits until the phase can share the machine, then holds it"""
+        if phase not in self.PHASES:
+            raise ValueError("Phase must be one of %s" %
+                             ', '.join(self.PHASES))
+        current = self.PHASES.index(phase) + 1
+        with self.condition:
+            if phase == 'run':
+                self.state[2] += 1
+            try:
+                # Builds also let waiting runs go first
+                self.condition.wait_for(
+                    lambda: (self.state[0] in (0, current) and
+                             (phase == 'run' or not self.state[2])))
+            finally:
+                if phase == 'run':
+                    self.state[2] -= 1
+            self.state[0] = current
+            self.state[1] += 1
+
+    def release(self, phase):
+        with self.condition:
+            self.state[1] -= 1
+            if not self.state[1]:
+                self.state[0] = 0
+                self.condition.notify_all()
+
+    @contextmanager
+    def hold(self, phase):
+        self.acquire(phase)
+        try:
+            yield
+        finally:
+            self.release(phase)
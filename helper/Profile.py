@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+    Profile
+    Sampled call stacks in folded form (one line per distinct stack, frames
+    from the root to the leaf separated by ';', then the number of samples),
+    as produced by the profile mode of the harness and understood by flame
+    graph tools.
+
+    Hot symbols are ranked by self samples (the symbol is the leaf) and
+    also report total samples (the symbol is anywhere in the stack), both
+    as a percentage of all samples, so that profiles of runs of different
+    lengths can be compared.
+
+    Usage:
+        profile = Profile.load('results/lulesh-...-1234.folded')
+        for entry in profile.hot(20):
+            print(entry['symbol'], entry['self_pct'])
+        for entry in Profile.load(old).diff(profile, 20):
+            print(entry['symbol'], entry['delta_pct'])
+"""
+
+class Profile(object):
+    """Folded call stacks and the hot symbols in them"""
+
+    def __init__(self, stacks=None):
+        # Samples by folded stack ('comm;main;foo;bar')
+        self.stacks = dict(stacks or {})
+
+    def add(self, frames, count=1):
+        """Adds samples of a stack, frames from root to leaf"""
+        stack = ';'.join(frames)
+        self.stacks[stack] = self.stacks.get(stack, 0) + count
+
+    def samples(self):
+        return sum(self.stacks.values())
+
+    @classmethod
+    def load(cls, path):
+        """Reads a folded stacks file"""
+        profile = cls()
+        with open(path) as folded:
+            for line in folded:
+                stack, _, count = line.rstrip('\n').rpartition(' ')
+                if stack:
+                    profile.stacks[stack] = (profile.stacks.get(stack, 0) +
+                                             int(count))
+        return profile
+
+    def save(self, path):
+        """Writes the folded stacks, most sampled first"""
+        with open(path, 'w') as folded:
+            for stack, count in sorted(self.stacks.items(),
+                                       key=lambda item: -item[1]):
+                folded.write('%s %d\n' % (stack, count))
+
+    def symbols(self):
+        """Self and total samples by symbol (the command name, first
+           frame of each stack, is not a symbol)"""
+        own = dict()
+        total = dict()
+        for stack, count in self.stacks.items():
+            frames = stack.split(';')[1:]
+            if not frames:
+                continue
+            own[frames[-1]] = own.get(frames[-1], 0) + count
+            # Recursive symbols count once per stack
+            for frame in set(frames):
+                total[frame] = total.get(frame, 0) + count
+        return own, total
+
+    def hot(self, top=20):
+        """The top symbols by self samples, with percentages"""
+        samples = self.samples() or 1
+        own, total = self.symbols()
+        table = []
+        for symbol in sorted(own, key=lambda name: -own[name])[:top]:
+            table.append({'symbol': symbol,
+                          'self': own[symbol],
+                          'total': total[symbol],
+                          'self_pct': 100.0 * own[symbol] / samples,
+                          'total_pct': 100.0 * total[symbol] / samples})
+        return table
+
+    def diff(self, other, top=20):
+        """Symbols whose share of self samples changed the most from this
+           profile to the other one (positive delta: got hotter)"""
+        before = self.samples() or 1
+        after = other.samples() or 1
+        own_before = self.symbols()[0]
+        own_after = other.symbols()[0]
+        table = []
+        for symbol in set(own_before) | set(own_after):
+            old = 100.0 * own_before.get(symbol, 0) / before
+            new = 100.0 * own_after.get(symbol, 0) / after
+            table.append({'symbol': symbol, 'before_pct': old,
+                          'after_pct': new, 'delta_pct': new - old})
+        table.sort(key=lambda entry: -abs(entry['delta_pct']))
+        return table[:top]
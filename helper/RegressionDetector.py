@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+    Regression Detector
+    Compares the latest run of each series (same benchmark, machine,
+    toolchain and flags) with a rolling baseline of the previous runs in the
+    results database, metric by metric.
+
+    Each run is reduced to the median of its iterations. The baseline is
+    the median of the last runs of the window, after the most recent change
+    point in it (a lasting step, ex. a new compiler), so that old levels
+    don't mask or fake a change. Its spread is the MAD of the run medians.
+    A change is significant when it is both larger than the relative
+    threshold and more than z robust standard deviations away from the
+    baseline. Whether it is a regression or an improvement depends on the
+    direction of the metric: declared by the parsers (ex. LuleshParser:
+    FOM higher is better, Grind lower is better) or in a configuration
+    file, which can also set thresholds per metric:
+
+        metrics:
+          FOM: {direction: higher, threshold: 0.03}
+          elapsed: {direction: lower, threshold: 0.1, z: 4}
+
+    Usage:
+        detector = RegressionDetector(database, window=10)
+        report = detector.detect(benchmark='lulesh')
+        regressions = [r for r in report if r['status'] == 'regression']
+"""
+
+import statistics
+import yaml
+
+from models.benchmarks.BenchmarkFactory import BenchmarkFactory
+from executor.LinuxPerf import LinuxPerfParser
+from executor.ResourceUsage import ResourceUsage
+
+class RegressionDetector(object):
+    """Robust comparison of the latest runs against their history"""
+
+    DIRECTIONS = ('higher', 'lower')
+    # Columns that identify a series of comparable runs
+    SERIES = ('benchmark', 'machine', 'toolchain', 'compiler_flags',
+              'linker_flags', 'run_flags')
+
+    def __init__(self, database, window=10, min_baseline=3, threshold=0.05,
+                 z=3.0, config=None):
+        if window < min_baseline or min_baseline < 1:
+            raise ValueError("Window must hold at least the minimum baseline")
+        self.database = database
+        self.window = window
+        self.min_baseline = min_baseline
+        self.threshold = threshold
+        self.z = z
+        # Per metric settings (direction, threshold, z)
+        self.metrics = dict()
+        if config:
+            with open(config) as stream:
+                self.metrics = (yaml.safe_load(stream) or {}).get('metrics', {})
+            for name, settings in self.metrics.items():
+                if settings.get('direction', 'higher') not in self.DIRECTIONS:
+                    raise ValueError("Direction of %s must be one of %s" %
+                                     (name, ', '.join(self.DIRECTIONS)))
+        # Directions declared by the parsers, by benchmark
+        self.parsers = dict()
+
+    def _direction(self, benchmark, source, metric):
+        """Which way is better for a metric, None if unknown"""
+        if metric in self.metrics and 'direction' in self.metrics[metric]:
+            return self.metrics[metric]['direction']
+        if source == 'err':
+            # perf counters, or resource usage when perf wasn't available
+            return (LinuxPerfParser().directions.get(metric) or
+                    ResourceUsage.DIRECTIONS.get(metric))
+        if benchmark not in self.parsers:
+            try:
+                model = BenchmarkFactory(benchmark).getBenchmark()
+                self.parsers[benchmark] = model.get_plugin().directions
+            except (ImportError, AttributeError):
+                self.parsers[benchmark] = dict()
+        return self.parsers[benchmark].get(metric)
+
+    def _setting(self, metric, name):
+        return self.metrics.get(metric, {}).get(name, getattr(self, name))
+
+    @staticmethod
+    def _spread(values):
+        """Robust standard deviation (scaled MAD)"""
+        median = statistics.median(values)
+        return 1.4826 * statistics.median([abs(v - median) for v in values])
+
+    def change_point(self, values, threshold, z):
+        """Index where the most significant lasting step in values starts,
+           None if there is none (each side needs min_baseline values)"""
+        best = None
+        best_cost = None
+        for idx in range(self.min_baseline,
+                         len(values) - self.min_baseline + 1):
+            left = values[:idx]
+            right = values[idx:]
+            left_median = statistics.median(left)
+            right_median = statistics.median(right)
+            cost = (sum(abs(v - left_median) for v in left) +
+                    sum(abs(v - right_median) for v in right))
+            if best_cost is None or cost < best_cost:
+                best, best_cost = idx, cost
+        if best is None:
+            return None
+
+        left = values[:best]
+        right = values[best:]
+        step = statistics.median(right) - statistics.median(left)
+        base = abs(statistics.median(left))
+        spread = max(self._spread(left), self._spread(right))
+        if base and abs(step) / base < threshold:
+            return None
+        if spread and abs(step) / spread < z:
+            return None
+        return best
+
+    def _compare(self, benchmark, source, metric, runs):
+        """Report entry of one metric of a series, runs oldest first as
+           (run name, list of iteration values)"""
+        direction = self._direction(benchmark, source, metric)
+        threshold = self._setting(metric, 'threshold')
+        z = self._setting(metric, 'z')
+        name, latest = runs[-1]
+        history = [statistics.median(values)
+                   for _, values in runs[-self.window - 1:-1]]
+        entry = {'metric': metric, 'source': source, 'run': name,
+                 'direction': direction, 'latest': statistics.median(latest),
+                 'baseline_runs': len(history)}
+
+        if direction is None:
+            entry['status'] = 'untracked'
+            return entry
+
+        # Only the runs after the last step are comparable
+        start = self.change_point(history, threshold, z)
+        if start is not None:
+            entry['change_point'] = runs[-len(history) - 1 + start][0]
+            history = history[start:]
+            entry['baseline_runs'] = len(history)
+        if len(history) < self.min_baseline:
+            entry['status'] = 'insufficient'
+            return entry
+
+        baseline = statistics.median(history)
+        spread = self._spread(history)
+        change = entry['latest'] - baseline
+        entry['baseline'] = baseline
+        entry['change'] = change / abs(baseline) if baseline else 0.0
+        entry['z'] = abs(change) / spread if spread else float('inf')
+
+        significant = (abs(entry['change']) >= threshold and
+                       (not change or entry['z'] >= z))
+        worse = change < 0 if direction == 'higher' else change > 0
+        if not significant:
+            entry['status'] = 'ok'
+        elif worse:
+            entry['status'] = 'regression'
+        else:
+            entry['status'] = 'improvement'
+        return entry
+
+    def detect(self, benchmark=None, machine=None, toolchain=None,
+               metric=None, days=None):
+        """Report of the latest run of every matching series, one entry
+           (dictionary) per metric, with the series columns"""
+        series = dict()
+        for row in self.database.query(benchmark=benchmark, machine=machine,
+                                       toolchain=toolchain, metric=metric,
+                                       days=days):
+            # Partial results of runs stopped by a timeout aren't comparable
+            if row['status'] == 'timeout':
+                continue
+            key = tuple(row[column] for column in self.SERIES)
+            metrics = series.setdefault(key, dict())
+            runs = metrics.setdefault((row['source'], row['metric']), [])
+            if not runs or runs[-1][0] != row['name']:
+                runs.append((row['name'], []))
+            runs[-1][1].append(row['value'])
+
+        report = []
+        for key, metrics in series.items():
+            for (source, name), runs in sorted(metrics.items()):
+                entry = self._compare(key[0], source, name, runs)
+                entry.update(zip(self.SERIES, key))
+                report.append(entry)
+        return report
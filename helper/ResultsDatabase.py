@@ -0,0 +1,271 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+    Results Database
+    SQLite history of all completed runs: one row of metadata per run
+    (benchmark, machine, toolchain and compiler version, flags, unique id,
+    timestamp) and one row per metric per iteration, so that series across
+    many runs can be queried without walking the run directories.
+
+    Each run directory has, in results/, the parsed outputs (<name>.out and
+    <name>.err, YAML lists of one dictionary per iteration, or their JSON
+    Lines or CSV versions, see ResultWriter) and the run metadata
+    (<name>.meta, YAML). Runs are imported from there, either right after
+    they finish (benchmark_controller.py) or in bulk to backfill older runs
+    (benchmark_results.py import). Importing is idempotent: a run with
+    the same name replaces the previous one.
+
+    Usage:
+        db = ResultsDatabase('runs/results.db')
+        db.import_run('runs/lulesh-aarch64-clang---1234')
+        for row in db.query(benchmark='lulesh', metric='FOM', days=90):
+            print(row['timestamp'], row['value'])
+"""
+
+import csv
+import json
+import math
+import os
+import re
+import sqlite3
+import time
+import yaml
+
+class ResultsDatabase(object):
+    """SQLite store of run metadata and per-iteration metrics"""
+
+    # Run metadata columns, in the .meta files and the runs table
+    META = ('benchmark', 'machine', 'toolchain', 'compiler',
+            'compiler_version', 'compiler_flags', 'linker_flags', 'run_flags',
+            'unique_id', 'timestamp', 'iterations', 'valid', 'status')
+    # Run status: valid results, failed validation, stopped by a timeout
+    STATUS = ('ok', 'invalid', 'timeout')
+
+    SCHEMA = '''
+        CREATE TABLE IF NOT EXISTS runs (
+            id INTEGER PRIMARY KEY,
+            name TEXT UNIQUE NOT NULL,
+            path TEXT,
+            benchmark TEXT,
+            machine TEXT,
+            toolchain TEXT,
+            compiler TEXT,
+            compiler_version TEXT,
+            compiler_flags TEXT,
+            linker_flags TEXT,
+            run_flags TEXT,
+            unique_id TEXT,
+            timestamp REAL,
+            iterations INTEGER,
+            valid INTEGER,
+            status TEXT
+        );
+        CREATE TABLE IF NOT EXISTS metrics (
+            run_id INTEGER NOT NULL REFERENCES runs(id) ON DELETE CASCADE,
+            iteration INTEGER NOT NULL,
+            source TEXT NOT NULL,
+            name TEXT NOT NULL,
+            value REAL
+        );
+        CREATE INDEX IF NOT EXISTS runs_series
+            ON runs (benchmark, machine, toolchain, timestamp);
+        CREATE INDEX IF NOT EXISTS runs_timestamp ON runs (timestamp);
+        CREATE INDEX IF NOT EXISTS metrics_run ON metrics (run_id, name);
+        CREATE INDEX IF NOT EXISTS metrics_name ON metrics (name, run_id);
+    '''
+
+    # Numbers as older (untyped) outputs have them, ex. '91,912,003,233'
+    NUMBER = re.compile(r'[-+]?(\d{1,3}(,\d{3})+|\d*)(\.\d*)?([eE][-+]?\d+)?$')
+
+    # Schema version (PRAGMA user_version), see _migrate()
+    VERSION = 1
+
+    def __init__(self, path):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        # Concurrent runs (ex. sweep jobs) may write at the same time
+        self.db = sqlite3.connect(path, timeout=60)
+        self.db.row_factory = sqlite3.Row
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA foreign_keys=ON')
+        self.db.executescript(self.SCHEMA)
+        self._migrate()
+
+    def _version(self):
+        return self.db.execute('PRAGMA user_version').fetchone()[0]
+
+    def _migrate(self):
+        """Upgrades databases of older harness versions, once"""
+        if self._version() >= self.VERSION:
+            return
+        with self.db:
+            # Holds the write lock, so concurrent runs migrate only once
+            self.db.execute('BEGIN IMMEDIATE')
+            version = self._version()
+            if version < 1:
+                # Runs had no status
+                columns = [row['name'] for row in
+                           self.db.execute('PRAGMA table_info(runs)')]
+                if 'status' not in columns:
+                    self.db.execute('ALTER TABLE runs ADD COLUMN status TEXT')
+                # The CPU set of pinned runs was stored as a stdout metric
+                self.db.execute("DELETE FROM metrics WHERE source = 'out' "
+                                "AND name = 'cpus'")
+            self.db.execute('PRAGMA user_version = %d' % self.VERSION)
+
+    def close(self):
+        self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @staticmethod
+    def _numbers(record):
+        """Numeric metrics of a parsed output, strings converted if possible
+           (outputs of older runs were not typed)"""
+        numbers = dict()
+        if not isinstance(record, dict):
+            return numbers
+        for name, value in record.items():
+            if isinstance(value, bool):
+                continue
+            if isinstance(value, str):
+                if not value or not ResultsDatabase.NUMBER.match(value):
+                    continue
+                try:
+                    value = float(value.replace(',', ''))
+                except ValueError:
+                    continue
+            if isinstance(value, (int, float)) and not math.isnan(value):
+                numbers[name] = float(value)
+        return numbers
+
+    def add_run(self, name, meta, outs, errs=(), path=None):
+        """Stores a run, replacing any previous run with the same name
+           outs/errs: parsed stdout/stderr, one dictionary per iteration"""
+        row = [meta.get(key) for key in self.META]
+        with self.db:
+            self.db.execute('DELETE FROM runs WHERE name = ?', (name,))
+            cursor = self.db.execute(
+                'INSERT INTO runs (name, path, %s) VALUES (?, ?, %s)' %
+                (', '.join(self.META), ', '.join('?' * len(self.META))),
+                [name, path] + row)
+            run_id = cursor.lastrowid
+            rows = []
+            for source, records in (('out', outs), ('err', errs)):
+                for iteration, record in enumerate(records or ()):
+                    for metric, value in self._numbers(record).items():
+                        rows.append((run_id, iteration, source, metric, value))
+            self.db.executemany('INSERT INTO metrics VALUES (?, ?, ?, ?, ?)',
+                                rows)
+        return run_id
+
+    @staticmethod
+    def _load(path):
+        if not os.path.exists(path):
+            return None
+        with open(path) as stream:
+            return yaml.load(stream, Loader=getattr(yaml, 'CSafeLoader',
+                                                    yaml.SafeLoader))
+
+    @staticmethod
+    def load_records(base):
+        """Records of base (.out or .err) as written by any ResultWriter
+           format, None if there are none"""
+        records = ResultsDatabase._load(base)
+        if records is not None:
+            return records
+        if os.path.exists(base + '.jsonl'):
+            with open(base + '.jsonl') as stream:
+                return [json.loads(line) for line in stream if line.strip()]
+        if os.path.exists(base + '.csv'):
+            with open(base + '.csv', newline='') as stream:
+                return [{name: value for name, value in row.items() if value}
+                        for row in csv.DictReader(stream)]
+        return None
+
+    def import_run(self, run_path):
+        """Imports a run directory, returns its name or None if incomplete
+           Runs without metadata (older harness) are imported with what the
+           directory name and file times tell"""
+        run_path = os.path.abspath(run_path)
+        name = os.path.basename(run_path.rstrip('/'))
+        base = os.path.join(run_path, 'results', name)
+        outs = self.load_records(base + '.out')
+        if outs is None:
+            return None
+        errs = self.load_records(base + '.err')
+
+        meta = self._load(base + '.meta')
+        if not isinstance(meta, dict):
+            meta = {'benchmark': name.split('-')[0],
+                    'timestamp': os.path.getmtime(os.path.dirname(base)),
+                    'iterations': len(outs or ())}
+        if 'status' not in meta and 'valid' in meta:
+            meta['status'] = 'ok' if meta['valid'] else 'invalid'
+        self.add_run(name, meta, outs, errs, run_path)
+        return name
+
+    def import_tree(self, root):
+        """Imports all run directories under a benchmark root"""
+        names = []
+        for entry in sorted(os.listdir(root)):
+            run_path = os.path.join(root, entry)
+            if entry.startswith('.') or not os.path.isdir(run_path):
+                continue
+            name = self.import_run(run_path)
+            if name:
+                names.append(name)
+        return names
+
+    def query(self, benchmark=None, machine=None, toolchain=None,
+              compiler_version=None, metric=None, source=None, days=None,
+              since=None, run_flags=None, limit=None):
+        """Per-iteration metrics of the matching runs, oldest first
+           Returns rows with the run metadata plus iteration, source, metric
+           name and value"""
+        clauses = []
+        params = []
+        for column, value in (('r.benchmark', benchmark),
+                              ('r.machine', machine),
+                              ('r.toolchain', toolchain),
+                              ('r.compiler_version', compiler_version),
+                              ('r.run_flags', run_flags),
+                              ('m.name', metric),
+                              ('m.source', source)):
+            if value is not None:
+                clauses.append('%s = ?' % column)
+                params.append(value)
+        if days is not None:
+            since = time.time() - days * 86400
+        if since is not None:
+            clauses.append('r.timestamp >= ?')
+            params.append(since)
+
+        sql = ('SELECT r.*, m.iteration, m.source, m.name AS metric, m.value '
+               'FROM runs r JOIN metrics m ON m.run_id = r.id')
+        if clauses:
+            sql += ' WHERE ' + ' AND '.join(clauses)
+        sql += ' ORDER BY r.timestamp, r.id, m.source, m.name, m.iteration'
+        if limit:
+            sql += ' LIMIT %d' % limit
+        return self.db.execute(sql, params).fetchall()
+
+    def runs(self, benchmark=None, machine=None, toolchain=None):
+        """Metadata of the matching runs, oldest first"""
+        clauses = []
+        params = []
+        for column, value in (('benchmark', benchmark), ('machine', machine),
+                              ('toolchain', toolchain)):
+            if value is not None:
+                clauses.append('%s = ?' % column)
+                params.append(value)
+        sql = 'SELECT * FROM runs'
+        if clauses:
+            sql += ' WHERE ' + ' AND '.join(clauses)
+        return self.db.execute(sql + ' ORDER BY timestamp, id',
+                               params).fetchall()
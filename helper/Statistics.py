@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+    Statistics
+    Summarises the values of each metric over all iterations of a run:
+    count, min, max, mean, median, standard deviation, coefficient of
+    variation and a bootstrap confidence interval of the mean.
+
+    Outliers can be rejected before summarising, either by their distance
+    to the median in median absolute deviations (MAD, modified z-score) or
+    by the interquartile range (IQR, Tukey's fences). Rejected values are
+    counted, never silently dropped.
+
+    Time series of counters (ex. perf stat -I) are summarised by their
+    steady-state rate and the warm-up time it takes to reach it.
+
+    Usage:
+        stats = Statistics(outliers='mad', confidence=0.95)
+        summary = stats.summarize([1195.1, 1201.3, 1187.9, 640.2])
+        summaries = stats.summarize_table(results.out_metrics)
+        rate, warmup = Statistics.steady_state(times, counts)
+"""
+
+import math
+import random
+import statistics
+
+class Statistics(object):
+    """Per-metric summary statistics with outlier rejection"""
+
+    OUTLIERS = ('none', 'mad', 'iqr')
+    # Default thresholds: modified z-score and IQR fence multiplier
+    THRESHOLDS = {'mad': 3.5, 'iqr': 1.5}
+
+    def __init__(self, outliers='mad', threshold=None, confidence=0.95,
+                 resamples=1000, seed=0):
+        if outliers not in self.OUTLIERS:
+            raise ValueError("Outlier method must be one of %s" %
+                             ', '.join(self.OUTLIERS))
+        if not 0 < confidence < 1:
+            raise ValueError("Confidence must be between 0 and 1")
+        if resamples < 1:
+            raise ValueError("Bootstrap resamples must be positive")
+        self.outliers = outliers
+        self.threshold = threshold
+        if threshold is None:
+            self.threshold = self.THRESHOLDS.get(outliers)
+        self.confidence = confidence
+        self.resamples = resamples
+        # Fixed seed, so the same values always give the same interval
+        self.seed = seed
+
+    @staticmethod
+    def quantile(values, q):
+        """Linearly interpolated quantile of sorted values"""
+        if not values:
+            raise ValueError("No values")
+        pos = (len(values) - 1) * q
+        low = math.floor(pos)
+        high = math.ceil(pos)
+        return values[low] + (values[high] - values[low]) * (pos - low)
+
+    def reject(self, values):
+        """Splits values into (kept, rejected) with the outlier method"""
+        if self.outliers == 'none' or len(values) < 3:
+            return list(values), []
+
+        if self.outliers == 'mad':
+            median = statistics.median(values)
+            mad = statistics.median([abs(v - median) for v in values])
+            if mad == 0:
+                return list(values), []
+            # 0.6745: MAD to standard deviation, for normal distributions
+            def outlier(v):
+                return 0.6745 * abs(v - median) / mad > self.threshold
+        else:
+            ordered = sorted(values)
+            q1 = self.quantile(ordered, 0.25)
+            q3 = self.quantile(ordered, 0.75)
+            low = q1 - self.threshold * (q3 - q1)
+            high = q3 + self.threshold * (q3 - q1)
+            def outlier(v):
+                return v < low or v > high
+
+        kept = [v for v in values if not outlier(v)]
+        rejected = [v for v in values if outlier(v)]
+        return kept, rejected
+
+    def bootstrap(self, values):
+        """Percentile bootstrap confidence interval of the mean"""
+        if len(values) < 2:
+            return values[0], values[0]
+        rng = random.Random(self.seed)
+        size = len(values)
+        means = sorted(math.fsum(rng.choices(values, k=size)) / size
+                       for _ in range(self.resamples))
+        alpha = (1 - self.confidence) / 2
+        return (self.quantile(means, alpha), self.quantile(means, 1 - alpha))
+
+    def summarize(self, values):
+        """Summary dictionary of a list of numbers (NaN are ignored)"""
+        values = [float(v) for v in values if not math.isnan(v)]
+        if not values:
+            return {'count': 0}
+
+        kept, rejected = self.reject(values)
+        mean = statistics.fmean(kept)
+        stddev = statistics.stdev(kept) if len(kept) > 1 else 0.0
+        ci_low, ci_high = self.bootstrap(kept)
+        return {
+            'count': len(kept),
+            'outliers': len(rejected),
+            'min': min(kept),
+            'max': max(kept),
+            'mean': mean,
+            'median': statistics.median(kept),
+            'stddev': stddev,
+            'cv': stddev / abs(mean) if mean else 0.0,
+            'ci_low': ci_low,
+            'ci_high': ci_high,
+        }
+
+    def summarize_table(self, table):
+        """Summaries of all numeric metrics of a MetricTable"""
+        return {name: self.summarize(table.column(name))
+                for name in table.numeric}
+
+    @staticmethod
+    def steady_state(times, values, tolerance=0.1, share=0.9):
+        """Steady-state rate (per second) and warm-up duration (seconds) of
+           a counter sampled at interval end times (seconds from the start)
+           The steady state starts at the first interval from which at least
+           share of the intervals are within tolerance of the median rate
+           of the second half of the run; the rate is then the median of the
+           intervals from there on. Returns (None, None) without samples"""
+        rates = []
+        start = 0.0
+        for end, value in zip(times, values):
+            if end > start and not math.isnan(value):
+                rates.append((start, value / (end - start)))
+            start = end
+        if not rates:
+            return None, None
+
+        steady = statistics.median([rate for _, rate in
+                                    rates[len(rates) // 2:]])
+        limit = tolerance * abs(steady)
+        # Intervals within tolerance, from each interval to the end
+        within = [0] * (len(rates) + 1)
+        for idx in range(len(rates) - 1, -1, -1):
+            close = abs(rates[idx][1] - steady) <= limit
+            within[idx] = within[idx + 1] + close
+        first = len(rates) - 1
+        for idx in range(len(rates)):
+            if within[idx] >= share * (len(rates) - idx):
+                first = idx
+                break
+        rate = statistics.median([rate for _, rate in rates[first:]])
+        return rate, rates[first][0]
+
+    def describe(self):
+        """Settings used, to be stored along with the summaries"""
+        return {
+            'outliers': self.outliers,
+            'threshold': self.threshold,
+            'confidence': self.confidence,
+            'resamples': self.resamples,
+        }
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+    Sweep Matrix
+    Expands a YAML matrix of benchmarks, toolchains and flag variants into
+    the list of benchmark_controller command lines (one per combination).
+
+    Example matrix:
+        benchmarks: [lulesh, himeno]
+        toolchains: [gcc, clang]
+        compiler_flags: ['', '-march=native']
+        run_flags: ['']
+        iterations: 5
+        warmup: 1
+        size: 2
+
+    Lists expand into the cartesian product, scalars apply to all jobs.
+"""
+
+import itertools
+import yaml
+
+class SweepMatrix(object):
+    """Loads a sweep matrix and expands it into controller arguments"""
+
+    # Matrix axes (expanded) and the controller option they map to
+    AXES = [
+        ('benchmarks', None),
+        ('machine_type', '--machine_type'),
+        ('toolchains', '--toolchain'),
+        ('compiler_flags', '--compiler-flags'),
+        ('linker_flags', '--linker-flags'),
+        ('run_flags', '--run-flags'),
+    ]
+
+    # Scalar options, applied to every job
+    OPTIONS = {
+        'iterations' : '--iterations',
+        'adaptive' : '--adaptive',
+        'target_ci' : '--target-ci',
+        'min_iterations' : '--min-iterations',
+        'max_iterations' : '--max-iterations',
+        'max_time' : '--max-time',
+        'warmup' : '--warmup',
+        'prepare_timeout' : '--prepare-timeout',
+        'build_timeout' : '--build-timeout',
+        'run_timeout' : '--run-timeout',
+        'limit_as' : '--limit-as',
+        'limit_cpu' : '--limit-cpu',
+        'size' : '--size',
+        'benchmark_root' : '--benchmark-root',
+        'unique_id' : '--unique-id',
+    }
+
+    def __init__(self, path, overrides=None):
+        with open(path) as matrix_file:
+            self.matrix = yaml.safe_load(matrix_file)
+        if not isinstance(self.matrix, dict):
+            raise ValueError('Sweep matrix %s must be a dictionary' % path)
+
+        # Command line options take precedence over the file
+        if overrides:
+            for key, value in overrides.items():
+                if value is not None:
+                    self.matrix[key] = value
+
+        known = [axis for axis, _ in self.AXES] + list(self.OPTIONS)
+        for key in self.matrix:
+            if key not in known:
+                raise ValueError('Unknown sweep matrix key: %s' % key)
+        if not self.matrix.get('benchmarks'):
+            raise ValueError('Sweep matrix needs at least one benchmark')
+
+    def _axis(self, name):
+        """Values of an axis, as a list (missing axes have one empty value)"""
+        values = self.matrix.get(name)
+        if values is None:
+            return [None]
+        if not isinstance(values, list):
+            return [values]
+        return values
+
+    def jobs(self):
+        """Returns the list of controller argument lists, one per job"""
+        options = []
+        for key, option in self.OPTIONS.items():
+            if self.matrix.get(key) is not None:
+                options.append('%s=%s' % (option, self.matrix[key]))
+
+        jobs = []
+        axes = [self._axis(axis) for axis, _ in self.AXES]
+        for combination in itertools.product(*axes):
+            argv = []
+            for (axis, option), value in zip(self.AXES, combination):
+                if value is None:
+                    continue
+                if option is None:
+                    argv.append(str(value))
+                else:
+                    # '=' form, so that flags starting with '-' are values
+                    argv.append('%s=%s' % (option, value))
+            jobs.append(argv + options)
+        return jobs
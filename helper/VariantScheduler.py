@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+    Variant Scheduler
+    Interleaves the iterations of several variants (ex. the toolchains and
+    flag sets of a sweep), so that slow drifts of the machine (temperature,
+    background load) spread over all of them instead of biasing the ones
+    that happened to run last.
+
+    Iterations run in rounds, each one with a block of iterations of every
+    variant still running: in the same order every round (round-robin, ex.
+    ABCABC) or shuffled within each round (random, ex. BACCAB), from a seed
+    that can be given to reproduce a schedule. A variant leaves the rounds
+    once it has no iterations left.
+
+    Usage:
+        scheduler = VariantScheduler('random', block=2, seed=42)
+        scheduler.run(controllers, lambda ctrl: ctrl.run_iteration())
+"""
+
+import random
+
+class VariantScheduler(object):
+    """Round-robin or randomized block order of the variants' iterations"""
+
+    ORDERS = ('round-robin', 'random')
+
+    def __init__(self, order='round-robin', block=1, seed=None):
+        if order not in self.ORDERS:
+            raise ValueError("Order must be one of %s" % ', '.join(self.ORDERS))
+        if block < 1:
+            raise ValueError("Blocks need at least one iteration per variant")
+        self.order = order
+        self.block = block
+        if seed is None:
+            seed = random.SystemRandom().randrange(1 << 32)
+        self.seed = seed
+        self.random = random.Random(seed)
+
+    def round(self, variants):
+        """Order of the iterations of a round: each variant block times"""
+        slots = [variant for variant in variants for _ in range(self.block)]
+        if self.order == 'random':
+            self.random.shuffle(slots)
+        return slots
+
+    def run(self, variants, step):
+        """Runs step(variant) in schedule order, until it returned False
+           for every variant (no iterations left)"""
+        active = list(variants)
+        while active:
+            for variant in self.round(active):
+                if variant in active and not step(variant):
+                    active.remove(variant)
@@ -0,0 +1,264 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+    Harness overhead benchmark
+
+    Times the harness' own hot paths, with neither network nor compilers:
+      import      interpreter start and import of benchmark_controller
+      discovery   compiler model lookup among N fake compiler models with a
+                  stub compiler: the previous lookup (every model imported
+                  and checked), then the registry without and with its index
+      logger      BenchmarkLogger setup
+      parse       LULESH, himeno and perf (CSV) outputs of increasing size
+      dump        CompletedProcessList.stdout() YAML of N iterations (at
+                  most DUMP_LIMIT), then once more after one more iteration
+                  (incremental)
+    Each case reports its best time and its peak memory (Python allocations,
+    or the peak RSS of the child for import).
+
+    Results are saved as JSON (--output) and can be compared against a
+    stored baseline (--baseline): cases slower than the tolerance (and by
+    more than NOISE seconds) are reported as regressions, and the exit
+    status is 1.
+
+    Usage: python3 -m microbench.harness_bench [--sizes 1000,100000]
+               [--models 200] [--output results.json]
+               [--baseline baseline.json] [--tolerance 0.2]
+"""
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import timeit
+import tracemalloc
+
+from executor.CompletedProcessList import CompletedProcessList
+from executor.LinuxPerf import LinuxPerfParser
+from executor.ResourceUsage import ResourceUsage
+from helper.BenchmarkLogger import BenchmarkLogger
+from microbench.parser_bench import (lulesh_output, himeno_output,
+                                     perf_csv_output)
+from models.ModelLoader import ModelLoader
+from models.ModelRegistry import ModelRegistry
+from models.benchmarks.himeno_model import HimenoParser
+from models.benchmarks.lulesh_model import LuleshParser
+from models.compilers.CompilerFactory import CompilerFactory
+
+ROOT = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+# Most iterations dumped, as big outputs are parse cases already
+DUMP_LIMIT = 1000
+# Slowdowns below this many seconds are noise, not regressions
+NOISE = 0.0005
+
+FAKE_COMPILER = '''#!/usr/bin/env python3
+from models.compilers.CompilerModel import CompilerModel
+
+class ModelImplementation(CompilerModel):
+    def __init__(self):
+        super().__init__()
+        self.cc_name = 'fakecc%d'
+        self.cxx_name = 'fakecc%d++'
+        self.default_compiler_flags = '-O2'
+'''
+
+STUB_COMPILER = '''#!/bin/sh
+echo "$(basename $0) (Fake) 1.2.3"
+'''
+
+def measure(run, repeat):
+    """Best time of run() and peak Python memory (KiB) of one more call"""
+    seconds = min(timeit.repeat(run, number=1, repeat=repeat))
+    tracemalloc.start()
+    run()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {'seconds': seconds, 'peak_kib': peak / 1024}
+
+def bench_import(repeat):
+    """Interpreter start and harness import, in a child process"""
+    best = None
+    for _ in range(repeat):
+        usage = ResourceUsage([sys.executable, '-c',
+                               'import benchmark_controller']).run()
+        if usage.returncode:
+            raise RuntimeError('Importing benchmark_controller failed')
+        if best is None or usage.stderr['elapsed'] < best['seconds']:
+            best = {'seconds': usage.stderr['elapsed'],
+                    'peak_kib': usage.stderr['max-rss']}
+    return best
+
+def fake_models(root, count):
+    """Tree of count fake compiler models, and a bin dir with the stub
+       compiler of the last one"""
+    models = os.path.join(root, 'models', 'compilers')
+    os.makedirs(models)
+    for idx in range(count):
+        with open(os.path.join(models, 'fake%04d_model.py' % idx), 'w') as out:
+            out.write(FAKE_COMPILER % (idx, idx))
+    bin_dir = os.path.join(root, 'bin')
+    os.mkdir(bin_dir)
+    stub = os.path.join(bin_dir, 'fakecc%d' % (count - 1))
+    with open(stub, 'w') as out:
+        out.write(STUB_COMPILER)
+    os.chmod(stub, 0o755)
+    return os.path.join(root, 'models'), bin_dir
+
+def bench_discovery(count, repeat):
+    """Compiler lookup among count models, previous and registry based"""
+    results = dict()
+    root = tempfile.mkdtemp(prefix='harness-bench-')
+    try:
+        models, bin_dir = fake_models(root, count)
+        directory = os.path.join(models, 'compilers')
+
+        def legacy():
+            # Every model read twice, imported, instantiated and checked
+            for name in sorted(os.listdir(directory)):
+                model = ModelLoader(os.path.join(directory, name)).load()
+                if model.check(bin_dir):
+                    return model
+            raise ImportError('No model found')
+
+        index = os.path.join(root, 'models.json')
+        def lookup():
+            factory = CompilerFactory('file://' + bin_dir, root,
+                                      registry=ModelRegistry(models, index))
+            return factory._find_model(bin_dir)
+
+        def cold():
+            if os.path.exists(index):
+                os.remove(index)
+            return lookup()
+
+        for case, run in (('legacy', legacy), ('cold', cold),
+                          ('warm', lookup)):
+            if run().version != '1.2.3':
+                raise AssertionError('%s lookup found the wrong model' % case)
+            results['discovery/%s/%d' % (case, count)] = measure(run, repeat)
+    finally:
+        shutil.rmtree(root)
+    return results
+
+def bench_logger(repeat):
+    """Logger setup, with a new logger every time as each run has"""
+    loggers = iter(range(1 << 30))
+    def setup():
+        BenchmarkLogger('harness-bench-%d' % next(loggers), None, 1)
+    return {'logger': measure(setup, repeat)}
+
+def bench_parse(size, repeat):
+    """Parsers on synthetic outputs with size filler lines"""
+    results = dict()
+    for name, parser, output in (
+            ('lulesh', LuleshParser(), lulesh_output(size)),
+            ('himeno', HimenoParser(), himeno_output(size)),
+            ('perf', LinuxPerfParser(), perf_csv_output(size))):
+        results['parse/%s/%d' % (name, size)] = measure(
+            lambda: parser.parse(output), repeat)
+    return results
+
+def bench_dump(size, repeat):
+    """YAML of size parsed iterations, then incrementally one more"""
+    output = LuleshParser().parse(lulesh_output(10))
+    def results():
+        processes = CompletedProcessList()
+        for idx in range(size):
+            processes.append(subprocess.CompletedProcess(
+                ['lulesh'], 0, dict(output, iteration=idx), ''))
+        return processes
+
+    def full():
+        results().stdout()
+
+    # Built and dumped once, then each call adds and dumps one more
+    processes = results()
+    processes.stdout()
+    def incremental():
+        processes.append(subprocess.CompletedProcess(['lulesh'], 0,
+                                                     dict(output), ''))
+        processes.stdout()
+
+    return {'dump/full/%d' % size: measure(full, repeat),
+            'dump/incremental/%d' % size: measure(incremental, repeat)}
+
+def compare(results, baseline, tolerance):
+    """Prints the change of each case against the baseline, returns the
+       names of the ones slower than the tolerance"""
+    regressions = []
+    for case, result in sorted(results.items()):
+        base = baseline.get(case)
+        if not base or not base['seconds']:
+            print('%-28s %10.3f ms  (new)' % (case, result['seconds'] * 1e3))
+            continue
+        change = result['seconds'] / base['seconds'] - 1
+        slower = (change > tolerance and
+                  result['seconds'] - base['seconds'] > NOISE)
+        if slower:
+            regressions.append(case)
+        print('%-28s %10.3f ms  baseline %10.3f ms  %+7.1f%%%s' %
+              (case, result['seconds'] * 1e3, base['seconds'] * 1e3,
+               change * 100, '  REGRESSION' if slower else ''))
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Harness overhead benchmark')
+    parser.add_argument('--sizes', type=str, default='1000,100000',
+                        help='Comma separated output lines / iterations')
+    parser.add_argument('--models', type=int, default=200,
+                        help='Number of fake compiler models to search')
+    parser.add_argument('--repeat', type=int, default=5,
+                        help='Repetitions per measurement (best is kept)')
+    parser.add_argument('--output', type=str,
+                        help='Save the results to this JSON file')
+    parser.add_argument('--baseline', type=str,
+                        help='Compare with the results of a previous run')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='Relative slowdown reported as a regression')
+    args = parser.parse_args()
+
+    sizes = [int(size) for size in args.sizes.split(',')]
+    if args.models < 1 or args.repeat < 1:
+        raise ValueError('Models and repetitions must be positive')
+
+    # The user's model index and compiler cache are left alone
+    os.environ['XDG_CACHE_HOME'] = tempfile.mkdtemp(prefix='harness-bench-')
+    os.chdir(ROOT)
+    try:
+        results = {'import': bench_import(args.repeat)}
+        results.update(bench_discovery(args.models, args.repeat))
+        results.update(bench_logger(args.repeat))
+        for size in sizes:
+            results.update(bench_parse(size, args.repeat))
+            results.update(bench_dump(min(size, DUMP_LIMIT), args.repeat))
+    finally:
+        shutil.rmtree(os.environ['XDG_CACHE_HOME'])
+
+    report = {
+        'timestamp': time.time(),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as out:
+            json.dump(report, out, indent=2, sort_keys=True)
+
+    if args.baseline:
+        with open(args.baseline) as stream:
+            baseline = json.load(stream)['results']
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print('%d regressions: %s' % (len(regressions),
+                                          ', '.join(regressions)))
+            sys.exit(1)
+    else:
+        for case, result in sorted(results.items()):
+            print('%-28s %10.3f ms  peak %10.1f KiB' %
+                  (case, result['seconds'] * 1e3, result['peak_kib']))
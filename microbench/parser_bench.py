@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+    Output parser micro-benchmark
+
+    Compares OutputParser (fields compiled once per class, values converted
+    to their types) against the previous implementation (one uncompiled
+    re.search over the whole output per field, then str.replace filters)
+    on synthetic LULESH, himeno and perf outputs of increasing size. Both must extract the same values.
+    For perf, the previous implementation scraped the human readable
+    output, which is compared with parsing the CSV output (perf stat -x,).
+
+    Usage: python3 -m microbench.parser_bench [--sizes 1000,100000] [--repeat 5]
+"""
+
+import argparse
+import re
+import timeit
+
+from executor.LinuxPerf import LinuxPerfParser
+from models.benchmarks.lulesh_model import LuleshParser
+from models.benchmarks.himeno_model import HimenoParser
+
+# Fields of LinuxPerfParser before perf stat -x
+LEGACY_PERF_FIELDS = {
+    'instructions' : r'([\d,]+)\s+instructions',
+    'cycles' : r'([\d,]+)\s+cycles',
+    'cpu-migrations' : r'([\d,]+)\s+cpu-migrations',
+    'context-switches' : r'([\d,]+)\s+context-switches',
+    'page-faults' : r'([\d,]+)\s+page-faults',
+    'branches' : r'([\d,]+)\s+branches',
+    'branch-misses' : r'([\d,]+)\s+branch-misses',
+    'elapsed' : r'(\d+\.\d+)\s+seconds time elapsed'
+}
+
+def legacy_parse(parser, output, fields=None):
+    """The parser before compiled, typed fields, kept as the reference"""
+    data = dict()
+    for field, regex in (fields or parser.fields).items():
+        match = re.search(regex, output)
+        if match:
+            string = match.group(1)
+            for find, repl in parser.filters.items():
+                string = string.replace(find, repl)
+            data[field] = string
+    return data
+
+def lulesh_output(lines):
+    """LULESH run with one progress line per cycle, summary at the end"""
+    out = ['Running problem size 50^3 per domain until completion',
+           'Num threads: 8',
+           'Total number of elements: 125000', '']
+    for cycle in range(1, lines + 1):
+        out.append('cycle = %d, time = %.6e, dt=%.6e' %
+                   (cycle, cycle * 1.1e-7, 1.1e-7))
+    out += ['Run completed:',
+            '   Problem size        =  50',
+            '   MPI tasks           =  1',
+            '   Iteration count     =  %d' % lines,
+            '   Final Origin Energy = 5.124778e+05',
+            '   Testing Plane 0 of Energy Array on rank 0:',
+            '        MaxAbsDiff   = 8.731149e-11',
+            '        TotalAbsDiff = 3.253975e-10',
+            '        MaxRelDiff   = 1.021497e-13', '',
+            'Elapsed time         =      21.06 (s)',
+            'Grind time (us/z/c)  = 0.83672331 (per dom)  ( 0.83672331 overall)',
+            'FOM                  =  1195.1369 (z/s)', '']
+    return '\n'.join(out)
+
+def himeno_output(lines):
+    """himeno run with verbose progress, results at the end"""
+    out = ['mimax = 257 mjmax = 129 mkmax = 129',
+           'imax = 256 jmax = 128 kmax =128']
+    for step in range(lines):
+        out.append(' Loop executed for %d times' % step)
+    out += [' Gosa : 1.244771e-03',
+            ' MFLOPS measured : 1523.412345',
+            ' Score based on MMX Pentium 200MHz : 46.235691',
+            'cpu : 12.345678 sec.']
+    return '\n'.join(out)
+
+def perf_output(lines):
+    """perf stat output after a benchmark that also wrote to stderr"""
+    out = ['warning: stderr noise line %d' % line for line in range(lines)]
+    out += ['', " Performance counter stats for './lulesh2.0 -s 50':", '',
+            '     26,305.563811      task-clock (msec)',
+            '             2,134      context-switches',
+            '                 8      cpu-migrations',
+            '            28,754      page-faults',
+            '    91,912,003,233      cycles',
+            '   146,826,146,519      instructions',
+            '    11,862,004,116      branches',
+            '        40,125,301      branch-misses', '',
+            '      21.062101351 seconds time elapsed', '']
+    return '\n'.join(out)
+
+def perf_csv_output(lines):
+    """perf stat -x, output of the same run as perf_output"""
+    out = ['warning: stderr noise line %d' % line for line in range(lines)]
+    out += ['21062101351,ns,duration_time,21062101351,100.00,,',
+            '26305.56,msec,task-clock,26305563811,100.00,1.249,CPUs utilized',
+            '2134,,context-switches,26305563811,100.00,0.081,K/sec',
+            '8,,cpu-migrations,26305563811,100.00,0.000,K/sec',
+            '28754,,page-faults,26305563811,100.00,0.001,M/sec',
+            '91912003233,,cycles,26305441293,100.00,3.494,GHz',
+            '146826146519,,instructions,26305441293,100.00,1.60,insn per cycle',
+            '11862004116,,branches,26305441293,100.00,450.930,M/sec',
+            '40125301,,branch-misses,26305441293,100.00,0.34,of all branches']
+    return '\n'.join(out)
+
+def bench(name, parser, output, repeat, legacy_output=None, fields=None):
+    """Times both implementations, checks they agree, prints a line
+       The previous implementation parses legacy_output with fields, if
+       given, instead of output with the parser's fields"""
+    legacy_output = legacy_output or output
+    expected = legacy_parse(parser, legacy_output, fields)
+    result = parser.parse(output)
+    for field, value in expected.items():
+        if (result.get(field) is None or
+                float(parser.sanitise(value)) != float(result[field])):
+            raise AssertionError('%s: %s differs (%s vs %s)' %
+                                 (name, field, value, result.get(field)))
+
+    legacy = min(timeit.repeat(lambda: legacy_parse(parser, legacy_output,
+                                                    fields),
+                               number=1, repeat=repeat))
+    compiled = min(timeit.repeat(lambda: parser.parse(output),
+                                 number=1, repeat=repeat))
+    print('%-8s %10d bytes  legacy %9.3f ms  compiled %9.3f ms  x%.1f' %
+          (name, len(output), legacy * 1e3, compiled * 1e3,
+           legacy / compiled if compiled else float('inf')))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Output parser benchmark')
+    parser.add_argument('--sizes', type=str, default='100,10000,200000',
+                        help='Comma separated number of filler lines')
+    parser.add_argument('--repeat', type=int, default=5,
+                        help='Repetitions per measurement (best is kept)')
+    args = parser.parse_args()
+
+    for size in [int(size) for size in args.sizes.split(',')]:
+        bench('lulesh', LuleshParser(), lulesh_output(size), args.repeat)
+        bench('himeno', HimenoParser(), himeno_output(size), args.repeat)
+        bench('perf', LinuxPerfParser(), perf_csv_output(size), args.repeat,
+              perf_output(size), LEGACY_PERF_FIELDS)
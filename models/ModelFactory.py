@@ -2,22 +2,27 @@
 # -*- coding: utf-8 -*-
 """
     Base Factory class, with common logic for finding and loading models
+
+    Models are looked up in the ModelRegistry index, so only the selected
+    model (or the candidates whose criteria match) is imported.
 """
 import os
-import re
 import importlib
 from models.ModelLoader import ModelLoader
+from models.ModelRegistry import ModelRegistry
 
 class ModelFactory(object):
     """Identify and return the correct machine model"""
 
-    def __init__(self, model_type):
+    def __init__(self, model_type, registry=None):
         if model_type is None:
             raise ValueError('Model type is empty')
         if not isinstance(model_type, str):
             raise TypeError('Model type has to be a string')
 
-        self.root = os.path.dirname(os.path.realpath(__file__))
+        # Models are under the registry's root (this directory by default)
+        self.registry = registry or ModelRegistry.default()
+        self.root = self.registry.root
         self.model_type = model_type
         self.models_dir = os.path.join(self.root, self.model_type)
 
@@ -26,21 +31,32 @@ class ModelFactory(object):
             raise ValueError('Model name is empty')
         if not isinstance(name, str):
             raise TypeError('Model name has to be a string')
-        if not re.search('_model.py', name):
+        if not name.endswith(ModelRegistry.SUFFIX):
             return None
 
-        filename = os.path.join(self.models_dir, name)
-        if not os.path.isfile(filename):
+        entry = self.registry.entry(self.model_type,
+                                    name[:-len(ModelRegistry.SUFFIX)])
+        if entry is None:
             return None
+        filename = os.path.join(self.models_dir, name)
+        if 'error' in entry:
+            raise ImportError('Model %s: %s' % (filename, entry['error']))
+        if not entry['implementation']:
+            raise ImportError('Model %s does not implement ModelImplementation'
+                              % filename)
+
+        # Already checked by the registry
+        return ModelLoader(filename, check=False).load()
 
-        return ModelLoader(filename).load()
+    def _candidates(self, condition):
+        """Names of the models that may satisfy the condition"""
+        return self.registry.names(self.model_type)
 
     def _find_model(self, condition):
-        """Checks compiler models against binary dir"""
+        """Checks candidate models against the condition (ex. binary dir)"""
 
-        for model in [f for f in os.listdir(self.models_dir)
-                        if re.match(r'.*\.py*', f)]:
-            loaded_model = self._load_model(model)
+        for name in self._candidates(condition):
+            loaded_model = self._load_model(name + '_model.py')
             if loaded_model and loaded_model.check(condition):
                 return loaded_model
 
@@ -9,9 +9,10 @@ from pathlib import Path
 
 
 class ModelLoader(object):
-    def __init__(self, path):
+    def __init__(self, path, check=True):
         self.path = path
-        self._check_model()
+        if check:
+            self._check_model()
 
     def load(self):
         """Class loader python style"""
@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+    Model Registry
+    Index of the model files (benchmarks, compilers, machines), so that the
+    factories only import the model they select.
+
+    Each *_model.py file is indexed once, without importing it: its name,
+    kind (directory), size, modification time and SHA256, whether it
+    defines ModelImplementation and its match criteria (string constants
+    assigned in it, such as cc_name). The index is kept in the user cache
+    directory ($XDG_CACHE_HOME/benchmark-harness, ~/.cache by default) and
+    only files whose size or modification time changed are read again.
+
+    Compiler identification (<cc> --version) is cached there too, by binary
+    path, inode and modification time, so that each compiler only runs once
+    until it is updated.
+
+    Usage:
+        registry = ModelRegistry.default()
+        path = registry.path('machines', 'aarch64')
+        names = registry.names('compilers', cc_name='gcc')
+        output = registry.identify('/usr/bin/gcc')
+"""
+
+import ast
+import hashlib
+import json
+import os
+import subprocess
+import tempfile
+
+class ModelRegistry(object):
+    """Cached index of the model files and compiler identifications"""
+
+    # Index format, older indexes are rebuilt
+    VERSION = 1
+    KINDS = ('benchmarks', 'compilers', 'machines')
+    # Attributes of the models that factories match against
+    CRITERIA = ('name', 'cc_name', 'arch')
+    SUFFIX = '_model.py'
+
+    # One registry per process, shared by all factories
+    _default = None
+
+    def __init__(self, root=None, cache=None):
+        self.root = root or os.path.dirname(os.path.realpath(__file__))
+        # Index file, None to keep the index in memory only
+        self.cache = cache
+        self.index = {'version': self.VERSION, 'root': self.root,
+                      'models': {}, 'binaries': {}}
+        if cache and os.path.isfile(cache):
+            try:
+                with open(cache) as stream:
+                    index = json.load(stream)
+                if (index.get('version') == self.VERSION and
+                        index.get('root') == self.root):
+                    self.index = index
+            except (OSError, ValueError):
+                # Unreadable or truncated, rebuilt below
+                pass
+        self.changed = False
+        self.refresh()
+
+    @classmethod
+    def default(cls):
+        """Registry of this harness' models, cached in the user cache"""
+        if cls._default is None:
+            root = os.path.dirname(os.path.realpath(__file__))
+            base = (os.environ.get('XDG_CACHE_HOME') or
+                    os.path.join(os.path.expanduser('~'), '.cache'))
+            # One index per harness checkout
+            digest = hashlib.sha256(root.encode('utf-8')).hexdigest()[:16]
+            cache = os.path.join(base, 'benchmark-harness',
+                                 'models-%s.json' % digest)
+            cls._default = cls(root, cache)
+        return cls._default
+
+    @staticmethod
+    def _scan(path):
+        """Whether the source defines ModelImplementation, and the string
+           constants it assigns to the criteria attributes"""
+        with open(path, 'rb') as source:
+            raw = source.read()
+        entry = {'sha256': hashlib.sha256(raw).hexdigest(),
+                 'implementation': False, 'criteria': {}}
+        try:
+            tree = ast.parse(raw, path)
+        except (SyntaxError, ValueError) as err:
+            entry['error'] = str(err)
+            return entry
+
+        for node in ast.walk(tree):
+            if isinstance(node, ast.ClassDef):
+                if node.name == 'ModelImplementation':
+                    entry['implementation'] = True
+            if not isinstance(node, ast.Assign):
+                continue
+            if not (isinstance(node.value, ast.Constant) and
+                    isinstance(node.value.value, str)):
+                continue
+            for target in node.targets:
+                if (isinstance(target, ast.Attribute) and
+                        isinstance(target.value, ast.Name) and
+                        target.value.id == 'self' and
+                        target.attr in ModelRegistry.CRITERIA):
+                    entry['criteria'][target.attr] = node.value.value
+        return entry
+
+    def refresh(self):
+        """Indexes new or modified model files, drops deleted ones, and
+           saves the index if anything changed"""
+        models = self.index['models']
+        seen = set()
+        for kind in self.KINDS:
+            directory = os.path.join(self.root, kind)
+            if not os.path.isdir(directory):
+                continue
+            for filename in sorted(os.listdir(directory)):
+                if not filename.endswith(self.SUFFIX):
+                    continue
+                path = os.path.join(directory, filename)
+                key = kind + '/' + filename
+                seen.add(key)
+                stat = os.stat(path)
+                entry = models.get(key)
+                if (entry and entry['size'] == stat.st_size and
+                        entry['mtime'] == stat.st_mtime_ns):
+                    continue
+                scanned = self._scan(path)
+                if not entry or entry['sha256'] != scanned['sha256']:
+                    entry = scanned
+                    entry['kind'] = kind
+                    entry['name'] = filename[:-len(self.SUFFIX)]
+                # Touched but same contents: only the times change
+                entry['size'] = stat.st_size
+                entry['mtime'] = stat.st_mtime_ns
+                models[key] = entry
+                self.changed = True
+        for key in set(models) - seen:
+            del models[key]
+            self.changed = True
+        self.save()
+
+    def save(self):
+        """Writes the index, if changed (atomically, runs may share it)"""
+        if not self.cache or not self.changed:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.cache), exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=os.path.dirname(self.cache),
+                                       prefix='.models-')
+            with os.fdopen(fd, 'w') as stream:
+                json.dump(self.index, stream)
+            os.replace(tmp, self.cache)
+            self.changed = False
+        except OSError:
+            # Read-only cache: the index still works, in memory
+            pass
+
+    def entry(self, kind, name):
+        """Index entry of a model, None if there is no such model"""
+        return self.index['models'].get(kind + '/' + name + self.SUFFIX)
+
+    def path(self, kind, name):
+        """Path of a model file, None if there is no such model"""
+        if not self.entry(kind, name):
+            return None
+        return os.path.join(self.root, kind, name + self.SUFFIX)
+
+    def names(self, kind, **criteria):
+        """Names of the models of a kind, in file name order, that define
+           ModelImplementation and don't contradict the criteria (models
+           that don't set an attribute as a constant may still match)"""
+        names = []
+        for entry in self.index['models'].values():
+            if entry['kind'] != kind or not entry['implementation']:
+                continue
+            if any(entry['criteria'].get(attr, value) != value
+                   for attr, value in criteria.items()):
+                continue
+            names.append(entry['name'])
+        return sorted(names)
+
+    def identify(self, binary, flag='--version'):
+        """Output of a compiler's version flag, cached until the binary
+           changes (ex. a new version installed)"""
+        path = os.path.abspath(binary)
+        stat = os.stat(path)
+        key = '%s %s' % (path, flag)
+        cached = self.index['binaries'].get(key)
+        if (cached and cached['inode'] == stat.st_ino and
+                cached['mtime'] == stat.st_mtime_ns):
+            return cached['output']
+
+        output = subprocess.check_output([path, flag]).decode('utf-8')
+        self.index['binaries'][key] = {'inode': stat.st_ino,
+                                       'mtime': stat.st_mtime_ns,
+                                       'output': output}
+        self.changed = True
+        self.save()
+        return output
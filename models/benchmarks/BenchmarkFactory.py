@@ -10,9 +10,9 @@ from models.ModelFactory import ModelFactory
 class BenchmarkFactory(ModelFactory):
     """Find and return a benchmark model"""
 
-    def __init__(self, name):
+    def __init__(self, name, registry=None):
         self.name = name
-        super(BenchmarkFactory, self).__init__('benchmarks')
+        super(BenchmarkFactory, self).__init__('benchmarks', registry)
 
     def getBenchmark(self):
         """Loads benchmark model and returns"""
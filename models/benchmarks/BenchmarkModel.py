@@ -30,11 +30,19 @@ class BenchmarkModel(object):
         # Validation checks dictionary (compare to results)
         self.checks = dict()
 
+        # Wall clock limit of each command, in seconds, by phase (None for
+        # no limit), and resource limits of the run commands (resource name
+        # to limit, ex. 'as' in bytes, 'cpu' in seconds)
+        self.timeouts = {'prepare': None, 'build': None, 'run': None}
+        self.limits = dict()
+
     ## CORE
     def prepare(self, root_path, machine, compiler, iterations, size):
         """Prepares envrionment for running the benchmark
         This entitles : fetching the benchmark and preparing
-        for running it"""
+        for running it
+        Implementations return the commands to run in order, or a list of
+        independent lists of commands, which may run concurrently"""
         if isinstance(root_path, str) and root_path:
             self.root_path = os.path.join(root_path, self.name)
         else:
@@ -86,20 +94,21 @@ class BenchmarkModel(object):
 
         return build_cmd
 
-    def run(self, extra_run_flags):
-        """Runs the benchmarks using the base + extra flags"""
+    def run(self, extra_run_flags, iterations=None):
+        """Runs the benchmarks using the base + extra flags
+        Commands are generated lazily, one per iteration (default: the
+        iterations passed to prepare)"""
         all_run_flags = self.run_flags + " " + extra_run_flags
 
         binary_path = os.path.join(self.root_path, self.executable)
 
-        run_cmds = []
-        for i in range(0, self.iterations):
+        if iterations is None:
+            iterations = self.iterations
+        for i in range(0, iterations):
             run_cmd = [binary_path]
             if all_run_flags:
                 run_cmd.extend(all_run_flags.split())
-            run_cmds.append(run_cmd)
-
-        return run_cmds
+            yield run_cmd
 
     def validate(self, results):
         """Validate the run by investigating the results"""
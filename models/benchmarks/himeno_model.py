@@ -30,6 +30,23 @@ class HimenoParser(OutputParser):
             'MFLOPS': r'MFLOPS measured\s+:\s+(\d+.\d+)',
             'Score': r'Score based on MMX Pentium 200MHz\s+:\s+(\d+.\d+)'
         }
+        self.types = {
+            'mimax': int,
+            'mjmax': int,
+            'mkmax': int,
+            'imax': int,
+            'jmax': int,
+            'kmax': int,
+            'cpu': float,
+            'Gosa': float,
+            'MFLOPS': float,
+            'Score': float
+        }
+        self.directions = {
+            'cpu': 'lower',
+            'MFLOPS': 'higher',
+            'Score': 'higher'
+        }
 
 
 class ModelImplementation(BenchmarkModel):
@@ -55,13 +72,13 @@ class ModelImplementation(BenchmarkModel):
         # Himeno specific flags based on options
         # Validation will need more stable execution
         if (self.size >= 3):
-            self.checks = {'Gosa': lambda x: x == '7.394327e-04'}
+            self.checks = {'Gosa': lambda x: x == 7.394327e-04}
             self.make_flags += 'MODEL=LARGE'
         elif (self.size == 2):
-            self.checks = {'Gosa': lambda x: x == '1.244771e-03'}
+            self.checks = {'Gosa': lambda x: x == 1.244771e-03}
             self.make_flags += 'MODEL=MIDDLE'
         else:
-            self.checks = {'Gosa': lambda x: x == '1.688138e-03'}
+            self.checks = {'Gosa': lambda x: x == 1.688138e-03}
             self.make_flags += 'MODEL=SMALL'
 
         # Download the benchmark, unzip
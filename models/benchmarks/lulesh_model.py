@@ -29,8 +29,24 @@ class LuleshParser(OutputParser):
             'MaxRelDiff' : r'MaxRelDiff\s+=\s+(\d+[^\s]*)',
             'Elements' : r'Total number of elements:\s+(\d+)',
             'Threads' : r'Num threads: (\d+)',
-            'Grind' : r'Grind time\(us\/z\/c\)\s+=\s+(\d+)',
-            'FOM' : r'FOM\s+=\s+(\d+)'
+            'Grind' : r'Grind time\(us\/z\/c\)\s+=\s+(\d+\.?\d*)',
+            'FOM' : r'FOM\s+=\s+(\d+\.?\d*)'
+        }
+        self.types = {
+            'ProblemSize' : int,
+            'IterationCount' : int,
+            'FinalEnergy' : float,
+            'MaxAbsDiff' : float,
+            'TotalAbsDiff' : float,
+            'MaxRelDiff' : float,
+            'Elements' : int,
+            'Threads' : int,
+            'Grind' : float,
+            'FOM' : float
+        }
+        self.directions = {
+            'Grind' : 'lower',
+            'FOM' : 'higher'
         }
 
 
@@ -51,13 +67,13 @@ class ModelImplementation(BenchmarkModel):
 
         # Lulesh specific flags based on options
         if (self.size >= 3):
-            self.checks = {'FinalEnergy': lambda x: x == '1.482403e+06'}
+            self.checks = {'FinalEnergy': lambda x: x == 1.482403e+06}
             self.run_flags += '-s 90'
         elif (self.size == 2):
-            self.checks = {'FinalEnergy': lambda x: x == '5.124778e+05'}
+            self.checks = {'FinalEnergy': lambda x: x == 5.124778e+05}
             self.run_flags += '-s 50'
         else:
-            self.checks = {'FinalEnergy': lambda x: x == '2.720531e+04'}
+            self.checks = {'FinalEnergy': lambda x: x == 2.720531e+04}
             self.run_flags += '-s 10'
 
         prepare_cmds = []
@@ -67,11 +83,11 @@ class ModelImplementation(BenchmarkModel):
                              os.path.join(self.root_path, 'Makefile')])
         return prepare_cmds
 
-    def run(self, extra_run_flags):
+    def run(self, extra_run_flags, iterations=None):
         # If users are changing the size to non-standard, ignore validate
         if '-s' in extra_run_flags.split():
             self.checks = None
-        return super().run(extra_run_flags)
+        return super().run(extra_run_flags, iterations)
 
     def get_plugin(self):
         """Returns the plugin to parse the results"""
@@ -10,11 +10,16 @@
     Note that at the moment it is up to the factory to determine wether it is a
     toolchain to be downloaded or something already installed systemwide.
     It could be adapted to take a path to a toolchain.
+
+    If a DirectoryCache is passed, downloaded toolchains are extracted once
+    into the cache (keyed by URL and expected checksum) and used from there
+    by all runs, instead of being extracted into each run's directory.
 """
 import tarfile
 import os
 import re
 import subprocess
+import hashlib
 from urllib.request import urlretrieve
 from models.ModelFactory import ModelFactory
 from shutil import which
@@ -22,10 +27,17 @@ from shutil import which
 class CompilerFactory(ModelFactory):
     """Fetch, prepare and setup compilers"""
 
-    def __init__(self, toolchain_url, toolchain_extractpath):
+    def __init__(self, toolchain_url, toolchain_extractpath, cache=None,
+                 sha256=None, registry=None):
         self.toolchain_url = toolchain_url
         self.toolchain_extractpath = toolchain_extractpath
-        super(CompilerFactory, self).__init__('compilers')
+        # Shared toolchain cache (DirectoryCache), None extracts per run
+        self.cache = cache
+        # Expected checksum of the tarball, if known
+        self.sha256 = sha256
+        # Cache entry of the toolchain in use, held until release()
+        self.cache_key = None
+        super(CompilerFactory, self).__init__('compilers', registry)
 
     def getCompiler(self):
         """Gets a compiler from URL or system local"""
@@ -34,6 +46,8 @@ class CompilerFactory(ModelFactory):
             # URLs that we can use urlretrieve
             self.filename = self.toolchain_url.split('/')[-1]
             self.dirname = re.sub("\.(tar|tgz)\.?(gz|xz)?", "", self.filename)
+            if self.cache:
+                return self._fetch_cached()
             self.base = os.path.join(self.toolchain_extractpath, self.dirname)
             self.path = os.path.join(self.toolchain_extractpath, self.filename)
             extracted_tar = self._download_toolchain()
@@ -47,9 +61,51 @@ class CompilerFactory(ModelFactory):
             # Assume this is either a path or a toolchain name
             return self._fetch_system(self.toolchain_url)
 
+    def _fetch_cached(self):
+        """Extracts the toolchain in the shared cache, if not there yet"""
+
+        def fill(tree):
+            os.mkdir(tree)
+            self.toolchain_extractpath = tree
+            self.base = os.path.join(tree, self.dirname)
+            self.path = tree + '.download'
+            try:
+                self._download_toolchain()
+            finally:
+                if os.path.exists(self.path):
+                    os.remove(self.path)
+
+        key = self.cache.key(self.toolchain_url, self.sha256)
+        # Held, so that no other process evicts it while we use it
+        tree = self.cache.get(key, fill, origin=self.toolchain_url, hold=True)
+        self.cache_key = key
+        self.toolchain_extractpath = tree
+        self.base = os.path.join(tree, self.dirname)
+        return self._fetch_compiler(tree)
+
+    def release(self):
+        """Lets the cached toolchain be evicted, once no longer used"""
+        if self.cache_key is not None:
+            self.cache.release(self.cache_key)
+            self.cache_key = None
+
+    def _verify_tarball(self, filename):
+        """Compares the tarball checksum with the expected one"""
+
+        digest = hashlib.sha256()
+        with open(filename, 'rb') as tarball:
+            for block in iter(lambda: tarball.read(1 << 20), b''):
+                digest.update(block)
+        if digest.hexdigest() != self.sha256.lower():
+            raise ImportError('Toolchain %s checksum mismatch: %s' %
+                              (filename, digest.hexdigest()))
+
     def _extract_tarball(self, filename):
         """Extracts toolchain directory"""
 
+        if self.sha256:
+            self._verify_tarball(filename)
+
         tarball = tarfile.open(filename)
         tarball.extractall(self.toolchain_extractpath)
 
@@ -67,6 +123,29 @@ class CompilerFactory(ModelFactory):
 
         return self._extract_tarball(filename)
 
+    def _load_model(self, name):
+        model = super(CompilerFactory, self)._load_model(name)
+        if model:
+            # Compiler identification is cached in the same registry
+            model.registry = self.registry
+        return model
+
+    def _candidates(self, condition):
+        """Compiler models whose frontend is in the binary dir (any model
+           for a single binary, identified by its --version)"""
+        names = self.registry.names(self.model_type)
+        if not os.path.isdir(condition):
+            return names
+        binaries = set(os.listdir(condition))
+        candidates = []
+        for name in names:
+            criteria = self.registry.entry(self.model_type, name)['criteria']
+            # Models that don't set cc_name as a constant are always checked
+            cc_name = criteria.get('cc_name')
+            if cc_name is None or cc_name in binaries:
+                candidates.append(name)
+        return candidates
+
     def _fetch_compiler(self, extracted_tar):
         """Fetches the full path to the frontend executable"""
 
@@ -1,10 +1,11 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
-import subprocess
 import os
 import re
 
+from models.ModelRegistry import ModelRegistry
+
 
 class CompilerModel(object):
 
@@ -17,16 +18,16 @@ class CompilerModel(object):
         self.default_compiler_flags = ''
         self.default_link_flags = ''
         self.default_dependencies = []
+        # ModelRegistry caching identifications (None for the default)
+        self.registry = None
 
     def check(self, bin_path):
         if os.path.isdir(bin_path):
             for file in os.listdir(bin_path):
                 if file == self.cc_name:
-                    output = subprocess.check_output([os.path.join(bin_path, file),
-                                                      '--version']).decode('utf-8')
+                    output = self._identify(os.path.join(bin_path, file))
                     if self.cc_name in output:
-                        self.version = re.search(
-                            r'' + re.escape(self.cc_name) + r'.*? (\d*\.\d*\.\d*)', output)
+                        self.version = self._parse_version(output)
                         self.compilers_path = os.path.abspath(bin_path)
                         self.sysroot_path = os.path.abspath(
                             os.path.join(bin_path, '../'))
@@ -35,16 +36,26 @@ class CompilerModel(object):
                         return False
             return False
         if os.path.isfile(bin_path):
-            output = subprocess.check_output([bin_path,
-                                              '--version']).decode('utf-8')
+            output = self._identify(bin_path)
             if self.cc_name in output:
                 self.compilers_path = os.path.dirname(bin_path)
-                self.version = re.search(
-                    r'' + re.escape(self.cc_name) + r'.*? (\d*\.\d*\.\d*)', output)
+                self.version = self._parse_version(output)
                 return True
             else:
                 return False
 
+    def _identify(self, binary):
+        """Output of binary --version, cached until the binary changes"""
+        return (self.registry or ModelRegistry.default()).identify(binary)
+
+    def _parse_version(self, output):
+        """Extracts the version number from the --version output"""
+        match = re.search(
+            r'' + re.escape(self.cc_name) + r'.*? (\d*\.\d*\.\d*)', output)
+        if match:
+            return match.group(1)
+        return ''
+
     def _fetch_dependencies(self):
         pass
 
@@ -10,9 +10,9 @@ class MachineFactory(ModelFactory):
     """Identify and return the correct machine model"""
     # TODO: Identify machines via specific test (uname, etc)
 
-    def __init__(self, name):
+    def __init__(self, name, registry=None):
         self.name = name
-        super(MachineFactory, self).__init__('machines')
+        super(MachineFactory, self).__init__('machines', registry)
 
     def getMachine(self):
         """Loads machine model and returns"""
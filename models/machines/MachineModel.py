@@ -6,10 +6,34 @@ class MachineModel(object):
         self.mbench_flags=''
         self.mcomp_flags=''
         self.mlink_flags=''
+        # Named perf event groups (--perf-events), each one a list of
+        # groups of events perf counts together
+        self.perf_events = {
+            'default': [['task-clock', 'context-switches', 'cpu-migrations',
+                         'page-faults'],
+                        ['cycles', 'instructions', 'branches',
+                         'branch-misses']],
+            'cache': [['cache-references', 'cache-misses'],
+                      ['L1-dcache-loads', 'L1-dcache-load-misses'],
+                      ['LLC-loads', 'LLC-load-misses']],
+            'tlb': [['dTLB-loads', 'dTLB-load-misses'],
+                    ['iTLB-loads', 'iTLB-load-misses']],
+        }
 
     def _machine_specific_setup(self):
         pass
 
+    def get_perf_events(self, names):
+        """Events to count for a list of group or event names, names
+           that aren't groups of this machine are taken as perf events"""
+        events = []
+        for name in names:
+            if name in self.perf_events:
+                events.extend(self.perf_events[name])
+            elif name:
+                events.append(name)
+        return events
+
     def get_flags(self):
         self._machine_specific_setup()
         return self.mcomp_flags, self.mlink_flags
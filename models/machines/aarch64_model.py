@@ -5,3 +5,12 @@ class ModelImplementation(MachineModel):
     def __init__(self):
         super().__init__()
         self.arch = 'aarch64'
+        # Armv8 PMU common events
+        self.perf_events['cache'] = [['l1d_cache', 'l1d_cache_refill'],
+                                     ['l2d_cache', 'l2d_cache_refill'],
+                                     ['ll_cache_rd', 'll_cache_miss_rd']]
+        self.perf_events['tlb'] = [['l1d_tlb', 'l1d_tlb_refill'],
+                                   ['l1i_tlb', 'l1i_tlb_refill'],
+                                   ['dtlb_walk', 'itlb_walk']]
+        self.perf_events['stalls'] = [['cpu_cycles', 'stall_frontend',
+                                       'stall_backend']]
@@ -5,3 +5,5 @@ class ModelImplementation(MachineModel):
     def __init__(self):
         super().__init__()
         self.arch = 'x86_64'
+        self.perf_events['stalls'] = [['cycles', 'stalled-cycles-frontend',
+                                       'stalled-cycles-backend']]